@@ -0,0 +1,85 @@
+"""Compare the per-row Python rollup fold with the NumPy engine on synthetic data.
+
+    python -m app.benchmarks.rollup_benchmark --rows 1000000 --series 1000
+
+Runs in memory only; no database is needed.
+"""
+from datetime import datetime,timedelta
+from typing import Dict,List,Tuple
+from app.utils.time_utils import round_to_window,parse_window
+from app.utils.numpy_rollup import aggregate_windows,numpy_available
+from app.utils.sketch import add_to_sketch
+import argparse
+import random
+import time
+
+WINDOWS=("1m","5m","1h")
+
+def synthetic_rows(rows:int,series:int,seed:int)->Tuple[List[int],List[datetime],List[float]]:
+    rng=random.Random(seed)
+    start=datetime(2024,1,1)
+    # One point per series every ~10s, roughly in arrival order
+    step=timedelta(seconds=10)/max(series,1)
+    series_ids=[rng.randrange(series) for _ in range(rows)]
+    timestamps=[start+step*i for i in range(rows)]
+    values=[rng.random()*100 for _ in range(rows)]
+    return series_ids,timestamps,values
+
+def python_rollups(series_ids:List[int],timestamps:List[datetime],values:List[float])->Dict[str,int]:
+    """The streaming engine's per-row fold, without the database writes."""
+    buckets={}
+    for window in WINDOWS:
+        aggregates={}
+        for series_id,timestamp,value in zip(series_ids,timestamps,values):
+            key=(series_id,round_to_window(timestamp,window))
+            aggregate=aggregates.get(key)
+            if aggregate is None:
+                aggregates[key]=[value,value,value,1,{}]
+                add_to_sketch(aggregates[key][4],value)
+            else:
+                if value<aggregate[0]:
+                    aggregate[0]=value
+                if value>aggregate[1]:
+                    aggregate[1]=value
+                aggregate[2]+=value
+                aggregate[3]+=1
+                add_to_sketch(aggregate[4],value)
+        buckets[window]=len(aggregates)
+    return buckets
+
+def numpy_rollups(series_ids:List[int],timestamps:List[datetime],values:List[float])->Dict[str,int]:
+    window_seconds={window:int(parse_window(window).total_seconds()) for window in WINDOWS}
+    return {
+        window:len(groups[0])
+        for window,groups in aggregate_windows(series_ids,timestamps,values,window_seconds).items()
+    }
+
+def timed(function,*args)->Tuple[float,Dict[str,int]]:
+    started=time.perf_counter()
+    result=function(*args)
+    return time.perf_counter()-started,result
+
+def main()->None:
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows",type=int,default=1000000)
+    parser.add_argument("--series",type=int,default=1000)
+    parser.add_argument("--seed",type=int,default=42)
+    args=parser.parse_args()
+
+    if not numpy_available():
+        raise SystemExit("numpy is not installed")
+
+    data=synthetic_rows(args.rows,args.series,args.seed)
+    print(f"{args.rows} rows, {args.series} series, windows {', '.join(WINDOWS)}")
+
+    python_seconds,python_buckets=timed(python_rollups,*data)
+    numpy_seconds,numpy_buckets=timed(numpy_rollups,*data)
+    if python_buckets!=numpy_buckets:
+        raise SystemExit(f"Engines disagree: python={python_buckets} numpy={numpy_buckets}")
+
+    for name,seconds in (("python",python_seconds),("numpy",numpy_seconds)):
+        print(f"{name:>7}: {seconds:8.3f}s  {args.rows/seconds:12,.0f} rows/s")
+    print(f"speedup: {python_seconds/numpy_seconds:.1f}x  buckets: {numpy_buckets}")
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,86 @@
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+
+def get_bool(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def get_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def get_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+# Group-commit buffer behind POST /metrics/ingest
+INGEST_BUFFER_ENABLED = get_bool("INGEST_BUFFER_ENABLED")
+INGEST_BUFFER_MAX_BATCH = get_int("INGEST_BUFFER_MAX_BATCH", 500)
+INGEST_BUFFER_MAX_DELAY_MS = get_float("INGEST_BUFFER_MAX_DELAY_MS", 5.0)
+INGEST_BUFFER_CAPACITY = get_int("INGEST_BUFFER_CAPACITY", 10000)
+
+# Durable single-point ingest: append to a local write-ahead log and ack after fsync
+INGEST_WAL_ENABLED = get_bool("INGEST_WAL_ENABLED")
+INGEST_WAL_DIR = os.getenv("INGEST_WAL_DIR", "wal")
+INGEST_WAL_SEGMENT_BYTES = get_int("INGEST_WAL_SEGMENT_BYTES", 16 * 1024 * 1024)
+INGEST_WAL_FSYNC_INTERVAL_MS = get_float("INGEST_WAL_FSYNC_INTERVAL_MS", 2.0)
+INGEST_WAL_ROTATE_SECONDS = get_float("INGEST_WAL_ROTATE_SECONDS", 1.0)
+INGEST_WAL_CAPACITY = get_int("INGEST_WAL_CAPACITY", 10000)
+
+# In-memory series index used for cardinality checks (0 disables periodic resync)
+SERIES_INDEX_RESYNC_SECONDS = get_float("SERIES_INDEX_RESYNC_SECONDS", 3600.0)
+
+# Streaming backfill (POST /backfill/stream)
+BACKFILL_STREAM_BATCH_SIZE = get_int("BACKFILL_STREAM_BATCH_SIZE", 5000)
+BACKFILL_STREAM_MAX_ERRORS = get_int("BACKFILL_STREAM_MAX_ERRORS", 100)
+
+# Points older than this at write time are queued as partial rollup aggregates
+ROLLUP_LATENESS_SECONDS = get_float("ROLLUP_LATENESS_SECONDS", 120.0)
+ROLLUP_DIRTY_BATCH_SIZE = get_int("ROLLUP_DIRTY_BATCH_SIZE", 5000)
+# Seconds between rollup job runs
+ROLLUP_INTERVAL_SECONDS = get_float("ROLLUP_INTERVAL_SECONDS", 60.0)
+# Rollup engine: "sql" (INSERT ... SELECT on PostgreSQL), "python", "numpy", or "auto"
+ROLLUP_ENGINE = os.getenv("ROLLUP_ENGINE", "auto").strip().lower()
+ROLLUP_NUMPY_CHUNK_ROWS = get_int("ROLLUP_NUMPY_CHUNK_ROWS", 1000000)
+# Raw rows fetched per server-side cursor round trip, and rollup rows per INSERT
+ROLLUP_STREAM_BATCH_SIZE = get_int("ROLLUP_STREAM_BATCH_SIZE", 10000)
+
+# In-process aggregation of ingested points into open rollup buckets; the
+# rollup job then only merges queued late points
+STREAM_AGGREGATION_ENABLED = get_bool("STREAM_AGGREGATION_ENABLED")
+STREAM_AGGREGATION_FLUSH_SECONDS = get_float("STREAM_AGGREGATION_FLUSH_SECONDS", 5.0)
+# An aggregator that has not flushed for this long is treated as crashed
+STREAM_AGGREGATION_STALE_SECONDS = get_float("STREAM_AGGREGATION_STALE_SECONDS", 60.0)
+
+# In-process cache of settled rollup query results
+QUERY_CACHE_ENABLED = get_bool("QUERY_CACHE_ENABLED")
+QUERY_CACHE_MAX_BYTES = get_int("QUERY_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+QUERY_CACHE_TTL_SECONDS = get_float("QUERY_CACHE_TTL_SECONDS", 600.0)
+
+# POST /query/batch: queries per request, and queries running at once across all batches
+QUERY_BATCH_MAX_QUERIES = get_int("QUERY_BATCH_MAX_QUERIES", 50)
+QUERY_BATCH_CONCURRENCY = get_int("QUERY_BATCH_CONCURRENCY", 4)
+
+# Daily range partitioning of raw_metrics/rollup_metrics (PostgreSQL)
+PARTITIONING_ENABLED = get_bool("PARTITIONING_ENABLED", True)
+PARTITION_PREMAKE_DAYS = get_int("PARTITION_PREMAKE_DAYS", 7)
+
+# Retention: JSON file with per-tier/per-metric periods, and delete batching
+RETENTION_POLICY_FILE = os.getenv("RETENTION_POLICY_FILE")
+RETENTION_BATCH_SIZE = get_int("RETENTION_BATCH_SIZE", 10000)
+RETENTION_BATCH_PAUSE_MS = get_float("RETENTION_BATCH_PAUSE_MS", 100.0)
+
+# Connection pools (applied to both the async request engine and the sync job engine)
+DB_POOL_SIZE = get_int("DB_POOL_SIZE", 10)
+DB_MAX_OVERFLOW = get_int("DB_MAX_OVERFLOW", 20)
+DB_POOL_TIMEOUT_SECONDS = get_float("DB_POOL_TIMEOUT_SECONDS", 30.0)
+DB_POOL_PRE_PING = get_bool("DB_POOL_PRE_PING", True)
+DB_STATEMENT_TIMEOUT_MS = get_int("DB_STATEMENT_TIMEOUT_MS", 0)
@@ -1,11 +1,15 @@
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi.responses import Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.services.anomaly_service import AnomalyService
 from app.schemas.anomaly import AnomalyDetectionResponse
+from app.utils.columnar import COLUMNAR_FORMATS, check_format, encode
 from datetime import datetime
 from typing import Optional, Dict
 import json
 
+ANOMALY_FORMATS = ("json",) + COLUMNAR_FORMATS
+
 
 class AnomalyController:
     
@@ -16,12 +20,15 @@ class AnomalyController:
         end_time: datetime,
         threshold: float,
         labels: Optional[str],
-        db: Session
+        db: AsyncSession,
+        format: str = "json"
     ) -> AnomalyDetectionResponse:
         try:
             parsed_labels = AnomalyController._parse_labels(labels)
+            check_format(format, ANOMALY_FORMATS)
             anomaly_service = AnomalyService(db)
-            result = anomaly_service.detect_anomalies(
+            detect = anomaly_service.detect_anomalies_columns if format in COLUMNAR_FORMATS else anomaly_service.detect_anomalies
+            result = await detect(
                 metric_name=metric_name,
                 start_time=start_time,
                 end_time=end_time,
@@ -29,14 +36,23 @@ class AnomalyController:
                 labels=parsed_labels
             )
             
-            if result.total_points == 0:
+            total_points = result["total_points"] if format in COLUMNAR_FORMATS else result.total_points
+            if total_points == 0:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="No data found for the given query"
                 )
             
+            if format in COLUMNAR_FORMATS:
+                body, media_type = encode(format, result)
+                return Response(content=body, media_type=media_type)
             return result
             
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
         except HTTPException:
             raise
         except Exception as e:
@@ -1,7 +1,9 @@
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.services.backfill_service import BackfillService
-from app.schemas.backfill import BackfillRequest, BackfillResponse
+from app.schemas.backfill import BackfillRequest, BackfillResponse, BackfillStreamResponse
+from app.utils.backfill_parsers import InvalidBackfillFormatException
+from typing import AsyncIterator, Optional
 
 
 class BackfillController:    
@@ -9,11 +11,11 @@ class BackfillController:
     @staticmethod
     async def import_historical_data(
         request: BackfillRequest,
-        db: Session
+        db: AsyncSession
     ) -> BackfillResponse:
         try:
             backfill_service = BackfillService(db)
-            result = backfill_service.import_metrics(request)
+            result = await backfill_service.import_metrics(request)
             
             if result.status == "error":
                 raise HTTPException(
@@ -30,3 +32,42 @@ class BackfillController:
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Error importing data: {str(e)}"
             )
+
+    @staticmethod
+    async def stream_historical_data(
+        chunks: AsyncIterator[bytes],
+        fmt: Optional[str],
+        content_type: str,
+        db: AsyncSession
+    ) -> BackfillStreamResponse:
+        fmt = (fmt or ("csv" if "csv" in content_type else "ndjson")).lower()
+        if fmt not in ("ndjson", "csv"):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid format. Must be 'ndjson' or 'csv'."
+            )
+
+        try:
+            backfill_service = BackfillService(db)
+            result = await backfill_service.import_stream(chunks, fmt)
+            
+            if result.status == "error":
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=result.message
+                )
+            
+            return result
+            
+        except InvalidBackfillFormatException as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error importing data: {str(e)}"
+            )
@@ -1,8 +1,16 @@
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.raw_metrics import RawMetrics
-from app.schemas.ingest import IngestRequest, IngestResponse
-from app.utils.label_utils import check_cardinality as check_cardinality_limit
+from app.schemas.ingest import IngestRequest, IngestResponse, BatchIngestRequest, BatchIngestResponse
+from app.services.ingest_service import IngestService
+from app.services.series_service import SeriesService
+from app.services.rollup_service import RollupService
+from app.services.write_buffer import ingest_buffer, WriteBufferFullException
+from app.services.ingest_wal import ingest_wal
+from app.services.stream_aggregator import stream_aggregator
+from app.utils.series_index import series_index, check_cardinality as check_cardinality_limit, reserve_series
+from app.utils.time_utils import to_utc_naive
+from datetime import datetime, timezone
 
 
 class CardinalityExceededException(Exception):
@@ -12,20 +20,62 @@ class CardinalityExceededException(Exception):
 class IngestController:
 
     @staticmethod
-    async def ingest_metric(metric: IngestRequest, db: Session) -> IngestResponse:
+    async def ingest_metric(metric: IngestRequest, db: AsyncSession) -> IngestResponse:
         try:
-            IngestController._check_cardinality(db, metric.metric_name, metric.labels)
+            if ingest_wal.running:
+                # The series reaches the database only at replay, so it is counted in the index now
+                await IngestController._check_cardinality(db, metric.metric_name, metric.labels, reserve=True)
+                # Durable once fsynced to the local log; the replayer loads it into the database
+                await ingest_wal.append({
+                    "metric_name": metric.metric_name,
+                    "value": metric.value,
+                    "timestamp": metric.timestamp,
+                    "labels": metric.labels,
+                    "tenant_id": metric.tenant_id
+                })
+                return IngestResponse(
+                    status="success",
+                    message="Metric ingested successfully"
+                )
+
+            await IngestController._check_cardinality(db, metric.metric_name, metric.labels)
+            series_id = await SeriesService(db).resolve(metric.metric_name, metric.labels)
+
+            if ingest_buffer.running:
+                # A new series must outlive this session, since the buffer writes the point later
+                await db.commit()
+                await ingest_buffer.submit({
+                    "metric_name": metric.metric_name,
+                    "value": metric.value,
+                    "timestamp": metric.timestamp,
+                    "series_id": series_id,
+                    "labels": metric.labels
+                })
+                return IngestResponse(
+                    status="success",
+                    message="Metric ingested successfully"
+                )
             
             metric_record = RawMetrics(
                 metric_name=metric.metric_name,
                 value=metric.value,
-                timestamp=metric.timestamp,
-                labels=metric.labels
+                timestamp=to_utc_naive(metric.timestamp),
+                series_id=series_id
             )
             
             db.add(metric_record)
-            db.commit()
-            db.refresh(metric_record)
+            observed_at = datetime.now(timezone.utc)
+            await RollupService(db).record_late_points(
+                [(metric.metric_name, series_id, metric.timestamp, metric.value)], observed_at
+            )
+            await db.commit()
+            series_index.add(metric.metric_name, metric.labels)
+            stream_aggregator.add([{
+                "metric_name": metric.metric_name,
+                "series_id": series_id,
+                "timestamp": metric.timestamp,
+                "value": metric.value
+            }], observed_at)
             
             return IngestResponse(
                 status="success",
@@ -38,16 +88,40 @@ class IngestController:
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=str(e)
             )
+        except WriteBufferFullException as e:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=str(e)
+            )
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Error ingesting metric: {str(e)}"
             )
     
     @staticmethod
-    def _check_cardinality(db: Session, metric_name: str, labels: dict, limit: int = 100) -> None:
-        if not check_cardinality_limit(db, metric_name, labels, limit):
+    async def ingest_batch(request: BatchIngestRequest, db: AsyncSession) -> BatchIngestResponse:
+        try:
+            ingest_service = IngestService(db)
+            return await ingest_service.ingest_batch(request)
+
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error ingesting batch: {str(e)}"
+            )
+
+    @staticmethod
+    async def _check_cardinality(
+        db: AsyncSession,
+        metric_name: str,
+        labels: dict,
+        limit: int = 100,
+        reserve: bool = False
+    ) -> None:
+        check = reserve_series if reserve else check_cardinality_limit
+        if not await check(db, metric_name, labels, limit):
             raise CardinalityExceededException(
                 f"Cardinality limit of {limit} exceeded for metric '{metric_name}'"
             )
@@ -1,10 +1,20 @@
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db import AsyncSessionLocal
+from app.services.batch_query_service import BatchQueryService
 from app.services.query_service import QueryService
-from app.schemas.query import RawQueryResponse, RollupQueryResponse
+from app.schemas.query import BatchQueryRequest, BatchQueryResponse, RangeQueryResponse, RawQueryResponse, RollupQueryResponse
+from app.utils.columnar import COLUMNAR_FORMATS, check_format, encode
 from datetime import datetime
-from typing import Optional, Dict
+from typing import AsyncIterator, Optional, Dict, List
 import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+RAW_FORMATS = ("json", "ndjson") + COLUMNAR_FORMATS
+ROLLUP_FORMATS = ("json",) + COLUMNAR_FORMATS
 
 
 class QueryController:
@@ -17,16 +27,43 @@ class QueryController:
         labels: Optional[str],
         fill_gaps: bool,
         interval_seconds: int,
-        db: Session
+        db: AsyncSession,
+        max_points: Optional[int] = None,
+        downsample: str = "lttb",
+        format: str = "json"
     ) -> RawQueryResponse:
         try:
             parsed_labels = QueryController._parse_labels(labels)
+            check_format(format, RAW_FORMATS)
+            if format in COLUMNAR_FORMATS:
+                if fill_gaps:
+                    raise ValueError(f"fill_gaps is not supported with format={format}")
+                result = await QueryService(db).query_raw_columns(
+                    metric_name=metric_name,
+                    start_time=start_time,
+                    end_time=end_time,
+                    labels=parsed_labels,
+                    max_points=max_points,
+                    downsample=downsample
+                )
+                body, media_type = encode(format, result)
+                return Response(content=body, media_type=media_type)
+            if format == "ndjson":
+                if fill_gaps or max_points:
+                    raise ValueError("fill_gaps and max_points are not supported with format=ndjson")
+                return StreamingResponse(
+                    QueryController._stream_raw(metric_name, start_time, end_time, parsed_labels),
+                    media_type="application/x-ndjson"
+                )
+
             query_service = QueryService(db)
             result = await query_service.query_raw_data(
                 metric_name=metric_name,
                 start_time=start_time,
                 end_time=end_time,
-                labels=parsed_labels
+                labels=parsed_labels,
+                max_points=max_points,
+                downsample=downsample
             )
             
             # Return empty result instead of 404 error
@@ -49,6 +86,11 @@ class QueryController:
             
             return result
             
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
         except HTTPException:
             raise
         except Exception as e:
@@ -57,6 +99,23 @@ class QueryController:
                 detail=f"Error querying raw data: {str(e)}"
             )
     
+    @staticmethod
+    async def _stream_raw(
+        metric_name: str,
+        start_time: datetime,
+        end_time: datetime,
+        labels: Dict[str, str]
+    ) -> AsyncIterator[bytes]:
+        # The stream outlives the request handler, so it holds its own session
+        async with AsyncSessionLocal() as db:
+            try:
+                async for chunk in QueryService(db).stream_raw_data(metric_name, start_time, end_time, labels):
+                    yield chunk
+            except Exception as e:
+                # Headers are already sent; the client sees a truncated stream
+                logger.error(f"Raw stream of {metric_name} failed: {e}")
+                raise
+
     @staticmethod
     async def query_rollup_metrics(
         metric_name: str,
@@ -64,17 +123,33 @@ class QueryController:
         end_time: datetime,
         window: str,
         labels: Optional[str],
-        db: Session
+        db: AsyncSession,
+        quantiles: Optional[str] = None,
+        format: str = "json"
     ) -> RollupQueryResponse:
         try:
             parsed_labels = QueryController._parse_labels(labels)
+            parsed_quantiles = QueryController._parse_quantiles(quantiles)
+            check_format(format, ROLLUP_FORMATS)
             query_service = QueryService(db)
+            if format in COLUMNAR_FORMATS:
+                result = await query_service.query_rollup_columns(
+                    metric_name=metric_name,
+                    start_time=start_time,
+                    end_time=end_time,
+                    window=window,
+                    labels=parsed_labels,
+                    quantiles=parsed_quantiles
+                )
+                body, media_type = encode(format, result)
+                return Response(content=body, media_type=media_type)
             result = await query_service.query_rollup_data(
                 metric_name=metric_name,
                 start_time=start_time,
                 end_time=end_time,
                 window=window,
-                labels=parsed_labels
+                labels=parsed_labels,
+                quantiles=parsed_quantiles
             )
             
             # Return empty result instead of 404 error
@@ -101,6 +176,67 @@ class QueryController:
                 detail=f"Error querying rollup data: {str(e)}"
             )
     
+    @staticmethod
+    async def query_range_metrics(
+        metric_name: str,
+        start_time: datetime,
+        end_time: datetime,
+        labels: Optional[str],
+        max_points: int,
+        step: Optional[str],
+        db: AsyncSession
+    ) -> RangeQueryResponse:
+        try:
+            parsed_labels = QueryController._parse_labels(labels)
+            query_service = QueryService(db)
+            return await query_service.query_range(
+                metric_name=metric_name,
+                start_time=start_time,
+                end_time=end_time,
+                labels=parsed_labels,
+                max_points=max_points,
+                step=step
+            )
+
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error querying range data: {str(e)}"
+            )
+
+    @staticmethod
+    async def query_batch(request: BatchQueryRequest) -> BatchQueryResponse:
+        try:
+            return await BatchQueryService().run(request.queries)
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error running batch query: {str(e)}"
+            )
+
+    @staticmethod
+    def _parse_quantiles(quantiles: Optional[str]) -> List[float]:
+        if not quantiles:
+            return []
+
+        try:
+            parsed = [float(q) for q in quantiles.split(",") if q.strip()]
+        except ValueError:
+            parsed = None
+        if not parsed or any(not 0 <= q <= 1 for q in parsed):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid quantiles. Must be comma-separated numbers between 0 and 1."
+            )
+        return parsed
+
     @staticmethod
     def _parse_labels(labels_json: Optional[str]) -> Dict[str, str]:
         if not labels_json:
@@ -1,29 +1,62 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from app import config
 import os
 from sqlalchemy.ext.declarative import declarative_base
 
-load_dotenv()
-
 DATABASE_URL=os.getenv("DB_URL")
 
 if not DATABASE_URL:
     raise ValueError("Set the database url in the DB_URL environment variable")
 
-engine=create_engine(DATABASE_URL,connect_args={"sslmode": "require"})
+def to_async_url(url:str):
+    """The async form of DB_URL: PostgreSQL on asyncpg, SQLite on aiosqlite, anything else as given.
+
+    asyncpg does not understand `sslmode`, so it is removed from the URL and
+    passed as asyncpg's `ssl` argument by `async_ssl_args`.
+    """
+    parsed=make_url(url)
+    if parsed.get_backend_name()=="postgresql":
+        return parsed.set(drivername="postgresql+asyncpg").difference_update_query(["sslmode"])
+    if parsed.get_backend_name()=="sqlite" and parsed.get_driver_name()!="aiosqlite":
+        return parsed.set(drivername="sqlite+aiosqlite")
+    return parsed
+
+def async_ssl_args(url:str):
+    parsed=make_url(url)
+    sslmode=parsed.query.get("sslmode")
+    if parsed.get_backend_name()!="postgresql" or not sslmode:
+        return {}
+    return {"ssl":sslmode}
+
+pool_args={
+    "pool_size":config.DB_POOL_SIZE,
+    "max_overflow":config.DB_MAX_OVERFLOW,
+    "pool_timeout":config.DB_POOL_TIMEOUT_SECONDS,
+    "pool_pre_ping":config.DB_POOL_PRE_PING
+}
+
+# TLS follows the URL's sslmode; psycopg2 reads it from the URL itself
+sync_connect_args={}
+async_connect_args=async_ssl_args(DATABASE_URL)
+if config.DB_STATEMENT_TIMEOUT_MS and make_url(DATABASE_URL).get_backend_name()=="postgresql":
+    sync_connect_args["options"]=f"-c statement_timeout={config.DB_STATEMENT_TIMEOUT_MS}"
+    async_connect_args["server_settings"]={"statement_timeout":str(config.DB_STATEMENT_TIMEOUT_MS)}
+
+# Sync engine for the background jobs and schema maintenance
+engine=create_engine(DATABASE_URL,connect_args=sync_connect_args,**pool_args)
 
 SessionLocal=sessionmaker(autocommit=False,autoflush=False,bind=engine)
 
-Base=declarative_base()
-
-def get_db():
-    db=SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
+# Async engine for request handlers, so DB work never blocks the event loop
+async_engine=create_async_engine(to_async_url(DATABASE_URL),connect_args=async_connect_args,**pool_args)
 
+AsyncSessionLocal=async_sessionmaker(async_engine,autoflush=False,expire_on_commit=False)
 
+Base=declarative_base()
 
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -18,13 +18,14 @@ async def run_retention_job():
         retention_service=RetentionService(db)
         results=await retention_service.apply_retention_policies()
         execution_time=(datetime.now()-start_time).total_seconds()
-        logger.info(
-            f"Retention job completed in {execution_time:.2f}s: "
-            f"Deleted {results['raw']} raw metrics, "
-            f"Deleted {results['1m']} '1m' rollup metrics, "
-            f"Deleted {results['5m']} '5m' rollup metrics, "
-            f"Deleted {results['1h']} '1h' rollup metrics."
-        )
+        for tier,stats in results.items():
+            logger.info(
+                f"Retention '{tier}': deleted {stats['rows_deleted']} rows "
+                f"in {stats['batches']} batches, "
+                f"dropped {stats['partitions_dropped']} partitions, "
+                f"took {stats['elapsed_seconds']:.2f}s"
+            )
+        logger.info(f"Retention job completed in {execution_time:.2f}s")
 
     except Exception as e:
         logger.error(f"Error during retention job: {str(e)}", exc_info=True)
@@ -5,12 +5,17 @@ import os
 from datetime import datetime,timedelta,timezone
 from pathlib import Path
 from app.db import SessionLocal
+from app.services.partition_service import PartitionService
 from app.services.rollup_service import RollupService
+from app.services.rollup_watermark_service import RollupWatermarkService
+from app import config
 
 logging.basicConfig(level=logging.INFO,format="%(asctime)s - %(levelname)s - %(message)s")
 logger=logging.getLogger(__name__)
 
 State_file=Path("rollup_state.json")
+# Upcoming partitions are checked this often, so ingest never lands in the default partition
+PARTITION_CHECK_SECONDS=3600
 
 def load_last_processed_time()->datetime:
     if State_file.exists():
@@ -25,49 +30,62 @@ def load_last_processed_time()->datetime:
 
     return datetime.now(timezone.utc)-timedelta(hours=1)
 
-def save_last_processed_time(timestamp:datetime):
-    try:
-        state={
-            "last_processed_time":timestamp.isoformat(),
-            "last_run":datetime.now(timezone.utc).isoformat()
-        }
-        with open(State_file,"w") as f:
-            json.dump(state,f,indent=2)
-
-    except Exception as e:
-        logger.error(f"Error saving state file: {e}")
-
 async def run_rollup_job():
     db=SessionLocal()
     try:
-        since=load_last_processed_time()
-        logger.info(f"Starting rollup job since {since.isoformat()}")
+        # Metrics seen for the first time start an hour back; on the first run
+        # after upgrading they take over the legacy rollup_state.json progress
+        if RollupWatermarkService(db).is_empty():
+            initial_watermark=load_last_processed_time()
+            if State_file.exists():
+                logger.info(f"Migrating rollup progress from {State_file} to rollup_watermarks")
+        else:
+            initial_watermark=datetime.now(timezone.utc)-timedelta(hours=1)
+        logger.info("Starting rollup job")
         rollup_service=RollupService(db)
         start_time=datetime.now(timezone.utc)
-        stats=await rollup_service.perform_rollups(since)
+        stats=await rollup_service.run(initial_watermark)
         end_time=datetime.now(timezone.utc)
 
         processing_time=(end_time-start_time).total_seconds()
 
-        logger.info(f"Rollup job completed in {processing_time:.2f}s :"
-                   f"Processed {stats['raw_metrics_processed']} raw metrics,"
-                   f"Created {stats['rollup_metrics_created']} rollup metrics"
-                   f"for windows {stats['windows_processed']}"
+        logger.info(f"Rollup job completed in {processing_time:.2f}s up to {stats['watermark'].isoformat()}: "
+                   f"Rolled up {stats['metrics_processed']} metrics ({stats['metrics_failed']} failed, "
+                   f"{stats['metrics_discovered']} new), "
+                   f"Processed {stats['raw_metrics_processed']} raw metrics, "
+                   f"Created {stats['rollup_metrics_created']} rollup metrics "
+                   f"for windows {stats['windows_processed']}, "
+                   f"Merged {stats['dirty_buckets_merged']} dirty buckets"
         )
 
-        save_last_processed_time(datetime.now(timezone.utc))
-
     except Exception as e:
         logger.error(f"Error during rollup job: {e}")
     finally:
         db.close()
 
 
+def premake_partitions():
+    db=SessionLocal()
+    try:
+        created=PartitionService(db).ensure_partitions(config.PARTITION_PREMAKE_DAYS)
+        if created:
+            logger.info(f"Created {created} upcoming partitions")
+    except Exception as e:
+        logger.error(f"Error creating upcoming partitions: {e}")
+    finally:
+        db.close()
+
+
 async def run_continuous():
-    interval=60
+    interval=config.ROLLUP_INTERVAL_SECONDS
     logger.info(f"Starting continuous rollup job with interval {interval}s")
 
+    partitions_checked_at=None
     while True:
+        now=asyncio.get_running_loop().time()
+        if config.PARTITIONING_ENABLED and (partitions_checked_at is None or now-partitions_checked_at>=PARTITION_CHECK_SECONDS):
+            partitions_checked_at=now
+            await asyncio.to_thread(premake_partitions)
         try:
             await run_rollup_job()
         except Exception as e:
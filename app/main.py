@@ -1,13 +1,18 @@
 from fastapi import FastAPI, Depends
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
-from app.db import engine, get_db, Base
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db import engine, get_db, Base, AsyncSessionLocal
 from app.routes.ingest import ingestRouter
 from app.routes.query import queryRouter
 from app.routes.anomaly import anomalyRouter
 from app.routes.backfill import backfillRouter
-from app.schema_fix import fix_schema
+from app.schema_fix import fix_schema, migrate_series_ids, partition_tables
+from app.services.write_buffer import ingest_buffer
+from app.services.ingest_wal import ingest_wal
+from app.services.stream_aggregator import stream_aggregator
+from app.utils.series_index import series_index
+from app import config
 from sqlalchemy import text
 
 Base.metadata.create_all(bind=engine)
@@ -22,8 +27,40 @@ app.include_router(anomalyRouter)
 app.include_router(backfillRouter)
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     fix_schema()
+    await migrate_series_ids()
+    partition_tables()
+    async with AsyncSessionLocal() as db:
+        await series_index.warm(db)
+
+@app.on_event("startup")
+async def start_stream_aggregator():
+    if config.STREAM_AGGREGATION_ENABLED:
+        await stream_aggregator.start()
+
+@app.on_event("startup")
+async def start_ingest_buffer():
+    if config.INGEST_BUFFER_ENABLED:
+        await ingest_buffer.start()
+
+@app.on_event("shutdown")
+async def stop_ingest_buffer():
+    await ingest_buffer.stop()
+
+@app.on_event("startup")
+async def start_ingest_wal():
+    if config.INGEST_WAL_ENABLED:
+        await ingest_wal.start()
+
+@app.on_event("shutdown")
+async def stop_ingest_wal():
+    await ingest_wal.stop()
+
+@app.on_event("shutdown")
+async def stop_stream_aggregator():
+    # After the buffer and WAL have drained their last points into it
+    await stream_aggregator.stop()
 
 @app.get("/", tags=["dashboard"])
 def home():
@@ -38,9 +75,9 @@ def health_check():
     return {"message":"Timeseries service is up and running"}
 
 @app.get("/db/status", tags=["health"])
-def db_status(db: Session = Depends(get_db)):
+async def db_status(db: AsyncSession = Depends(get_db)):
     try:
-        db.execute(text("SELECT 1"))
+        await db.execute(text("SELECT 1"))
         return {
             "status": "connected",
             "message": "Database connection is successful"
@@ -1,5 +1,9 @@
 from app.models.raw_metrics import RawMetrics
 from app.models.rollup_metrics import RollupMetrics
+from app.models.series import Series
+from app.models.rollup_dirty_buckets import RollupDirtyBucket
+from app.models.ingest_wal_segments import IngestWalSegment
+from app.models.rollup_watermarks import RollupWatermark
+from app.models.stream_flush_watermarks import StreamFlushWatermark
 
-__all__ = ["RawMetrics", "RollupMetrics"]
-
+__all__ = ["RawMetrics", "RollupMetrics", "Series", "RollupDirtyBucket", "IngestWalSegment", "RollupWatermark", "StreamFlushWatermark"]
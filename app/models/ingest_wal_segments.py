@@ -0,0 +1,12 @@
+from sqlalchemy import Column,Integer,String,DateTime
+from sqlalchemy.sql import func
+from app.db import Base
+
+class IngestWalSegment(Base):
+    __tablename__="ingest_wal_segments"
+    segment=Column(String,primary_key=True)
+    rows=Column(Integer,nullable=False)
+    replayed_at=Column(DateTime,nullable=False,default=func.now(),index=True)
+
+    def __repr__(self):
+        return f"<IngestWalSegment(segment='{self.segment}',rows={self.rows})>"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column,Integer,String,Float,DateTime,JSON,Index
+from sqlalchemy import Column,Integer,String,Float,DateTime,Index
 from sqlalchemy.sql import func
 from app.db import Base
 
@@ -8,15 +8,16 @@ class RawMetrics(Base):
     metric_name=Column(String,nullable=False,index=True)
     value=Column(Float,nullable=False)
     timestamp=Column(DateTime,nullable=False,index=True)
-    labels=Column(JSON,nullable=True,default={})
+    series_id=Column(Integer,nullable=True,index=True)
     tenant_id=Column(String,nullable=True,index=True)
     created_at=Column(DateTime,nullable=False,default=func.now())
     __table_args__=(
         Index("index_metric_timestamp","metric_name","timestamp"),
+        Index("index_series_timestamp","series_id","timestamp"),
     )
 
     def __repr__(self):
-        return f"<RawMetric(id={self.id},metric_name='{self.metric_name}',value={self.value},timestamp={self.timestamp})>"    
+        return f"<RawMetric(id={self.id},metric_name='{self.metric_name}',series_id={self.series_id},value={self.value},timestamp={self.timestamp})>"    
 
 
     
\ No newline at end of file
@@ -0,0 +1,22 @@
+from sqlalchemy import Column,Integer,String,Float,DateTime,JSON
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func
+from app.db import Base
+
+class RollupDirtyBucket(Base):
+    __tablename__="rollup_dirty_buckets"
+    id=Column(Integer,primary_key=True,index=True,autoincrement=True)
+    metric_name=Column(String,nullable=False)
+    series_id=Column(Integer,nullable=False)
+    window=Column(String,nullable=False)
+    bucket_start=Column(DateTime,nullable=False)
+    # Partial aggregate of the queued points, merged into the bucket as is
+    min=Column(Float,nullable=False)
+    max=Column(Float,nullable=False)
+    sum=Column(Float,nullable=False)
+    count=Column(Integer,nullable=False)
+    sketch=Column(JSON(none_as_null=True).with_variant(JSONB(none_as_null=True),"postgresql"),nullable=True)
+    created_at=Column(DateTime,nullable=False,default=func.now())
+
+    def __repr__(self):
+        return f"<RollupDirtyBucket(id={self.id},series_id={self.series_id},window='{self.window}',bucket_start={self.bucket_start},count={self.count})>"
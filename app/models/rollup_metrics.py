@@ -1,4 +1,5 @@
-from sqlalchemy import Column,Integer,String,Float,DateTime,JSON,Index,UniqueConstraint
+from sqlalchemy import Column,Integer,String,Float,DateTime,Index,JSON,UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
 from app.db import Base
 
@@ -6,6 +7,7 @@ class RollupMetrics(Base):
     __tablename__="rollup_metrics"
     id=Column(Integer,primary_key=True,index=True,autoincrement=True)
     metric_name=Column(String,nullable=False,index=True)
+    series_id=Column(Integer,nullable=True,index=True)
     window=Column(String,nullable=False,index=True)
     start_time=Column(DateTime,nullable=False,index=True)
     end_time=Column(DateTime,nullable=False,index=True)
@@ -14,10 +16,11 @@ class RollupMetrics(Base):
     sum=Column(Float,nullable=False)
     avg=Column(Float,nullable=False)
     count=Column(Integer,nullable=False)
-    labels=Column(JSON,nullable=True,default={})
+    # Mergeable quantile sketch (app.utils.sketch); NULL for buckets rolled up before sketches existed
+    sketch=Column(JSON(none_as_null=True).with_variant(JSONB(none_as_null=True),"postgresql"),nullable=True)
     created_at=Column(DateTime,nullable=False,default=func.now())
     __table_args__=(
-        UniqueConstraint("metric_name","window","start_time",name='uix_rollup_metric'),
+        UniqueConstraint("series_id","window","start_time",name='uix_rollup_series'),
         Index("index_rollup_metric_time","metric_name","start_time"),
     )
 
@@ -0,0 +1,14 @@
+from sqlalchemy import Column,String,DateTime,Integer
+from sqlalchemy.sql import func
+from app.db import Base
+
+class RollupWatermark(Base):
+    __tablename__="rollup_watermarks"
+    metric_name=Column(String,primary_key=True)
+    watermark=Column(DateTime,nullable=False)
+    updated_at=Column(DateTime,nullable=False,default=func.now(),onupdate=func.now())
+    # Bumped whenever buckets at or before the watermark change, so every process drops its cached results
+    generation=Column(Integer,nullable=False,default=0,server_default="0")
+
+    def __repr__(self):
+        return f"<RollupWatermark(metric_name='{self.metric_name}',watermark={self.watermark})>"
@@ -0,0 +1,17 @@
+from sqlalchemy import Column,Integer,String,DateTime,JSON,UniqueConstraint
+from sqlalchemy.sql import func
+from app.db import Base
+
+class Series(Base):
+    __tablename__="series"
+    series_id=Column(Integer,primary_key=True,index=True,autoincrement=True)
+    metric_name=Column(String,nullable=False,index=True)
+    labels=Column(JSON,nullable=False,default={})
+    labels_hash=Column(String(32),nullable=False)
+    created_at=Column(DateTime,nullable=False,default=func.now())
+    __table_args__=(
+        UniqueConstraint("metric_name","labels_hash",name="uix_series_metric_labels"),
+    )
+
+    def __repr__(self):
+        return f"<Series(series_id={self.series_id},metric_name='{self.metric_name}',labels={self.labels})>"
@@ -0,0 +1,14 @@
+from sqlalchemy import Column,String,DateTime
+from sqlalchemy.sql import func
+from app.db import Base
+
+class StreamFlushWatermark(Base):
+    __tablename__="stream_flush_watermarks"
+    # One row per running stream aggregator (host, pid and a random suffix)
+    process_id=Column(String,primary_key=True)
+    # Every bucket ending at or before this has been merged by the process
+    flushed_until=Column(DateTime,nullable=False)
+    updated_at=Column(DateTime,nullable=False,default=func.now())
+
+    def __repr__(self):
+        return f"<StreamFlushWatermark(process_id='{self.process_id}',flushed_until={self.flushed_until})>"
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, Query, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.db import get_db
 from app.controllers.anomaly_controller import AnomalyController
 from app.schemas.anomaly import AnomalyDetectionResponse
@@ -15,8 +15,9 @@ async def detect_anomalies(
     end_time: datetime = Query(..., description="End time for analysis"),
     threshold: float = Query(3.0, ge=1.0, le=5.0, description="Z-score threshold (default: 3.0)"),
     labels: Optional[str] = Query(None, description="Labels as JSON string"),
-    db: Session = Depends(get_db)
+    format: str = Query("json", description="json, or columnar, msgpack or arrow (parallel arrays)"),
+    db: AsyncSession = Depends(get_db)
 ):
     return await AnomalyController.detect_anomalies(
-        metric_name, start_time, end_time, threshold, labels, db
+        metric_name, start_time, end_time, threshold, labels, db, format
     )
@@ -1,11 +1,23 @@
-from fastapi import APIRouter, Depends, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Query, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.db import get_db
 from app.controllers.backfill_controller import BackfillController
-from app.schemas.backfill import BackfillRequest, BackfillResponse
+from app.schemas.backfill import BackfillRequest, BackfillResponse, BackfillStreamResponse
+from typing import Optional
 
 backfillRouter = APIRouter(prefix="/backfill", tags=["backfill"])
 
 @backfillRouter.post("/import", response_model=BackfillResponse, status_code=status.HTTP_200_OK)
-async def import_historical_data(request: BackfillRequest, db: Session = Depends(get_db)):
+async def import_historical_data(request: BackfillRequest, db: AsyncSession = Depends(get_db)):
     return await BackfillController.import_historical_data(request, db)
+
+
+@backfillRouter.post("/stream", response_model=BackfillStreamResponse, status_code=status.HTTP_200_OK)
+async def stream_historical_data(
+    request: Request,
+    format: Optional[str] = Query(None, description="Body format: ndjson or csv (defaults from Content-Type)"),
+    db: AsyncSession = Depends(get_db)
+):
+    return await BackfillController.stream_historical_data(
+        request.stream(), format, request.headers.get("content-type", ""), db
+    )
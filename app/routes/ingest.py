@@ -1,12 +1,17 @@
 from fastapi import APIRouter, Depends, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.db import get_db
 from app.controllers.ingest_controller import IngestController
-from app.schemas.ingest import IngestRequest, IngestResponse
+from app.schemas.ingest import IngestRequest, IngestResponse, BatchIngestRequest, BatchIngestResponse
 
 ingestRouter = APIRouter(prefix="/metrics", tags=["ingestion"])
 
 
 @ingestRouter.post("/ingest", response_model=IngestResponse, status_code=status.HTTP_200_OK)
-async def ingest_metric(metric: IngestRequest, db: Session = Depends(get_db)):
+async def ingest_metric(metric: IngestRequest, db: AsyncSession = Depends(get_db)):
     return await IngestController.ingest_metric(metric, db)
+
+
+@ingestRouter.post("/ingest/batch", response_model=BatchIngestResponse, status_code=status.HTTP_200_OK)
+async def ingest_batch(request: BatchIngestRequest, db: AsyncSession = Depends(get_db)):
+    return await IngestController.ingest_batch(request, db)
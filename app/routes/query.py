@@ -1,21 +1,24 @@
 from fastapi import APIRouter, status, Query, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.db import get_db
 from app.controllers.query_controller import QueryController
-from app.schemas.query import RawQueryResponse, RollupQueryResponse
+from app.schemas.query import BatchQueryRequest, BatchQueryResponse, RangeQueryResponse, RawQueryResponse, RollupQueryResponse
 from datetime import datetime
 from typing import Optional
 from app.models.raw_metrics import RawMetrics
-from sqlalchemy import distinct
+from sqlalchemy import distinct, func, select
+from app.utils.query_cache import query_cache
+from app.utils.series_index import series_index
+from app import config
 
 queryRouter = APIRouter(tags=["query"])
 
 @queryRouter.get("/metrics/names", status_code=status.HTTP_200_OK)
-async def get_metric_names(db: Session = Depends(get_db)):
+async def get_metric_names(db: AsyncSession = Depends(get_db)):
     try:
-        total_records = db.query(RawMetrics).count()
-        metric_names = db.query(distinct(RawMetrics.metric_name)).all()
-        metrics_list = [name[0] for name in metric_names if name[0]]
+        total_records = await db.scalar(select(func.count()).select_from(RawMetrics))
+        metric_names = await db.scalars(select(distinct(RawMetrics.metric_name)))
+        metrics_list = [name for name in metric_names if name]
         
         return {
             "metrics": metrics_list,
@@ -33,23 +36,39 @@ async def get_metric_names(db: Session = Depends(get_db)):
         }
 
 
+@queryRouter.get("/metrics/series", status_code=status.HTTP_200_OK)
+async def get_series_counts():
+    counts = series_index.counts()
+    return {
+        "series": counts,
+        "total": sum(counts.values())
+    }
+
+
+@queryRouter.get("/metrics/query-cache", status_code=status.HTTP_200_OK)
+async def get_query_cache_stats():
+    return {
+        "enabled": config.QUERY_CACHE_ENABLED,
+        "ttl_seconds": config.QUERY_CACHE_TTL_SECONDS,
+        **query_cache.stats()
+    }
+
+
 @queryRouter.get("/debug/data-info", status_code=status.HTTP_200_OK)
-async def get_data_info(db: Session = Depends(get_db)):
+async def get_data_info(db: AsyncSession = Depends(get_db)):
     """Debug endpoint to see what data actually exists"""
     try:
-        from sqlalchemy import func
-        
         # Get total count
-        total_count = db.query(RawMetrics).count()
+        total_count = await db.scalar(select(func.count()).select_from(RawMetrics))
         
         # Get date range of actual data
-        date_range = db.query(
+        date_range = (await db.execute(select(
             func.min(RawMetrics.timestamp).label('earliest'),
             func.max(RawMetrics.timestamp).label('latest')
-        ).first()
+        ))).first()
         
         # Get sample data
-        sample_data = db.query(RawMetrics).limit(5).all()
+        sample_data = (await db.scalars(select(RawMetrics).limit(5))).all()
         
         return {
             "total_records": total_count,
@@ -82,22 +101,57 @@ async def query_raw_metrics(
     labels: Optional[str] = Query(None, description="Labels as JSON string"),
     fill_gaps: bool = Query(False, description="Fill missing data points with nulls"),
     interval_seconds: int = Query(60, description="Interval in seconds for gap filling"),
-    db: Session = Depends(get_db)
+    max_points: Optional[int] = Query(None, ge=2, le=100000, description="Downsample to at most this many points, e.g. the chart width in pixels"),
+    downsample: str = Query("lttb", description="Downsampling method when max_points is set: lttb or minmax"),
+    format: str = Query("json", description="json, ndjson (one point per line), or columnar, msgpack or arrow (parallel arrays)"),
+    db: AsyncSession = Depends(get_db)
 ):
     return await QueryController.query_raw_metrics(
-        metric_name, start_time, end_time, labels, fill_gaps, interval_seconds, db
+        metric_name, start_time, end_time, labels, fill_gaps, interval_seconds, db, max_points, downsample, format
     )
 
 
-@queryRouter.get("/query/rollup", response_model=RollupQueryResponse, status_code=status.HTTP_200_OK)
+@queryRouter.get(
+    "/query/rollup",
+    response_model=RollupQueryResponse,
+    response_model_exclude_none=True,
+    status_code=status.HTTP_200_OK
+)
 async def query_rollup_metrics(
     metric_name: str = Query(..., description="Name of the metric to query"),
     start_time: datetime = Query(..., description="Start time for the query range"),
     end_time: datetime = Query(..., description="End time for the query range"),
-    window: str = Query(..., description="Rollup window size: 1m, 5m, or 1h"),
+    window: str = Query(..., description="Rollup window, e.g. 1m, 15m, 6h or 1d (a multiple of 1m)"),
     labels: Optional[str] = Query(None, description="Labels as JSON string"),
-    db: Session = Depends(get_db)
+    quantiles: Optional[str] = Query(None, description="Comma-separated quantiles to estimate, e.g. 0.5,0.95,0.99"),
+    format: str = Query("json", description="json, or columnar, msgpack or arrow (parallel arrays)"),
+    db: AsyncSession = Depends(get_db)
 ):
     return await QueryController.query_rollup_metrics(
-        metric_name, start_time, end_time, window, labels, db
+        metric_name, start_time, end_time, window, labels, db, quantiles, format
     )
+
+
+@queryRouter.get("/query/range", response_model=RangeQueryResponse, status_code=status.HTTP_200_OK)
+async def query_range_metrics(
+    metric_name: str = Query(..., description="Name of the metric to query"),
+    start_time: datetime = Query(..., description="Start time for the query range"),
+    end_time: datetime = Query(..., description="End time for the query range"),
+    labels: Optional[str] = Query(None, description="Labels as JSON string"),
+    max_points: int = Query(1000, ge=1, le=100000, description="Maximum points per series when choosing the step"),
+    step: Optional[str] = Query(None, description="Force a step (raw, or a multiple of 1m such as 15m); chosen from max_points if omitted"),
+    db: AsyncSession = Depends(get_db)
+):
+    return await QueryController.query_range_metrics(
+        metric_name, start_time, end_time, labels, max_points, step, db
+    )
+
+
+@queryRouter.post(
+    "/query/batch",
+    response_model=BatchQueryResponse,
+    response_model_exclude_none=True,
+    status_code=status.HTTP_200_OK
+)
+async def query_batch(request: BatchQueryRequest):
+    return await QueryController.query_batch(request)
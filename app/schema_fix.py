@@ -1,7 +1,17 @@
 from sqlalchemy import text
-from app.db import engine
+from app.db import engine, async_engine, AsyncSessionLocal, SessionLocal
+from app.services.partition_service import PartitionService
+from app.services.series_service import SeriesService, clear_series_cache
+from app import config
+from app.utils.label_utils import hash_labels
+from app.utils.sketch import SKETCH_MERGE_FUNCTION_SQL, SKETCH_MERGE_AGGREGATE_SQL
+import json
 
 def fix_schema():
+    # Upgrades older PostgreSQL schemas; other databases start from create_all
+    if engine.dialect.name != "postgresql":
+        return
+
     with engine.connect() as conn:
 
         conn.execute(text("""
@@ -19,11 +29,171 @@ def fix_schema():
         """))
         conn.execute(text("""
             ALTER TABLE raw_metrics
-            ADD COLUMN IF NOT EXISTS labels JSON;
+            ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT NOW();
         """))
         conn.execute(text("""
             ALTER TABLE raw_metrics
-            ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT NOW();
+            ADD COLUMN IF NOT EXISTS series_id INTEGER;
+        """))
+        conn.execute(text("""
+            ALTER TABLE rollup_metrics
+            ADD COLUMN IF NOT EXISTS series_id INTEGER;
+        """))
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS index_series_timestamp
+            ON raw_metrics (series_id, timestamp);
+        """))
+        conn.execute(text("""
+            ALTER TABLE rollup_metrics
+            DROP CONSTRAINT IF EXISTS uix_rollup_metric;
+        """))
+        conn.execute(text("""
+            CREATE UNIQUE INDEX IF NOT EXISTS uix_rollup_series
+            ON rollup_metrics (series_id, "window", start_time);
+        """))
+        conn.execute(text("""
+            ALTER TABLE rollup_metrics
+            ADD COLUMN IF NOT EXISTS sketch JSONB;
+        """))
+        conn.execute(text("""
+            ALTER TABLE rollup_dirty_buckets
+            ADD COLUMN IF NOT EXISTS min DOUBLE PRECISION,
+            ADD COLUMN IF NOT EXISTS max DOUBLE PRECISION,
+            ADD COLUMN IF NOT EXISTS sum DOUBLE PRECISION,
+            ADD COLUMN IF NOT EXISTS count INTEGER,
+            ADD COLUMN IF NOT EXISTS sketch JSONB;
+        """))
+        conn.execute(text("""
+            ALTER TABLE rollup_watermarks
+            ADD COLUMN IF NOT EXISTS generation INTEGER NOT NULL DEFAULT 0;
         """))
+        # Bare bucket markers from before queued aggregates carry no points to merge
+        conn.execute(text("""
+            DELETE FROM rollup_dirty_buckets WHERE count IS NULL;
+        """))
+        conn.execute(text(SKETCH_MERGE_FUNCTION_SQL))
+        conn.execute(text(SKETCH_MERGE_AGGREGATE_SQL))
 
         conn.commit()
+
+# Arbitrary key; held while one worker migrates so the others wait for it
+SERIES_MIGRATION_LOCK = 72400401
+SERIES_MIGRATION_BATCH_ROWS = 100000
+
+async def migrate_series_ids():
+    """Move JSON labels stored on raw/rollup rows into the series table.
+
+    Every distinct (metric_name, labels) still carried by a row is inserted
+    into series first. The rows are then pointed at their series with one
+    set-based UPDATE ... FROM per id range, joining through a mapping table,
+    and the labels column is dropped once no row depends on it any more.
+    Workers starting together serialize on an advisory lock, so only the
+    first one does the work. Only PostgreSQL databases predate the series
+    table.
+    """
+    if async_engine.dialect.name != "postgresql":
+        return
+
+    tables = [table for table in ("raw_metrics", "rollup_metrics") if await _has_labels_column(table)]
+    if not tables:
+        return
+
+    async with async_engine.connect() as lock_conn:
+        await lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": SERIES_MIGRATION_LOCK})
+        await lock_conn.commit()
+        try:
+            for table in tables:
+                # Another worker may have finished while this one waited for the lock
+                if await _has_labels_column(table):
+                    await _migrate_table(table)
+        finally:
+            clear_series_cache()
+            await lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": SERIES_MIGRATION_LOCK})
+            await lock_conn.commit()
+
+async def _has_labels_column(table: str) -> bool:
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(text("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = :table AND column_name = 'labels'
+        """), {"table": table})).first() is not None
+
+async def _migrate_table(table: str) -> None:
+    async with AsyncSessionLocal() as db:
+        label_sets = (await db.execute(text(f"""
+            SELECT DISTINCT metric_name, COALESCE(labels::text, '')
+            FROM {table}
+            WHERE series_id IS NULL
+        """))).all()
+
+        parsed = [
+            (metric_name, labels_text, json.loads(labels_text) if labels_text else {})
+            for metric_name, labels_text in label_sets
+        ]
+        series_ids = await SeriesService(db).resolve_many(
+            (metric_name, labels) for metric_name, _, labels in parsed
+        )
+
+        mapping = f"{table}_series_map"
+        await db.execute(text(f"DROP TABLE IF EXISTS {mapping}"))
+        await db.execute(text(f"""
+            CREATE TABLE {mapping} (
+                metric_name VARCHAR NOT NULL,
+                labels_text TEXT NOT NULL,
+                series_id INTEGER NOT NULL,
+                PRIMARY KEY (metric_name, labels_text)
+            )
+        """))
+        if parsed:
+            await db.execute(text(f"""
+                INSERT INTO {mapping} (metric_name, labels_text, series_id)
+                VALUES (:metric_name, :labels_text, :series_id)
+            """), [
+                {
+                    "metric_name": metric_name,
+                    "labels_text": labels_text,
+                    "series_id": series_ids[(metric_name, hash_labels(labels))]
+                }
+                for metric_name, labels_text, labels in parsed
+            ])
+        await db.execute(text(f"ANALYZE {mapping}"))
+        await db.commit()
+
+        first_id, last_id = (await db.execute(text(
+            f"SELECT min(id), max(id) FROM {table} WHERE series_id IS NULL"
+        ))).one()
+        if first_id is not None:
+            for batch_start in range(first_id, last_id + 1, SERIES_MIGRATION_BATCH_ROWS):
+                await db.execute(text(f"""
+                    UPDATE {table} t
+                    SET series_id = m.series_id
+                    FROM {mapping} m
+                    WHERE t.id >= :batch_start AND t.id < :batch_end
+                    AND t.series_id IS NULL
+                    AND t.metric_name = m.metric_name
+                    AND COALESCE(t.labels::text, '') = m.labels_text
+                """), {"batch_start": batch_start, "batch_end": batch_start + SERIES_MIGRATION_BATCH_ROWS})
+                await db.commit()
+
+        await db.execute(text(f"DROP TABLE {mapping}"))
+        unmigrated = (await db.execute(text(f"SELECT 1 FROM {table} WHERE series_id IS NULL LIMIT 1"))).first()
+        if not unmigrated:
+            await db.execute(text(f"ALTER TABLE {table} DROP COLUMN labels"))
+        await db.commit()
+
+def partition_tables():
+    """Partition raw/rollup tables by day and premake upcoming partitions.
+
+    Runs after `migrate_series_ids`, since tables still carrying a labels
+    column are left unpartitioned until that migration has finished.
+    """
+    if not config.PARTITIONING_ENABLED:
+        return
+
+    db = SessionLocal()
+    try:
+        partition_service = PartitionService(db)
+        partition_service.migrate()
+        partition_service.ensure_partitions(config.PARTITION_PREMAKE_DAYS)
+    finally:
+        db.close()
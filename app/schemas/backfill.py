@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional, Dict
 from datetime import datetime
+import math
 
 class BackfillMetric(BaseModel):
     metric_name: str = Field(..., description="Name of the metric")
@@ -15,6 +16,13 @@ class BackfillMetric(BaseModel):
             raise ValueError("Metric name must be a non-empty string")
         return v.strip()
     
+    @field_validator("value")
+    @classmethod
+    def validate_value(cls, v: float) -> float:
+        if not math.isfinite(v):
+            raise ValueError("Value must be finite")
+        return v
+    
     class Config:
         json_schema_extra = {
             "example": {
@@ -72,3 +80,29 @@ class BackfillResponse(BaseModel):
                 "failed": 0
             }
         }
+
+class BackfillLineError(BaseModel):
+    line: int = Field(..., description="1-based line number in the uploaded body")
+    error: str = Field(..., description="Why the line was rejected")
+
+class BackfillStreamResponse(BaseModel):
+    status: str = Field(..., description="Status of the backfill operation")
+    message: str = Field(..., description="Detailed message")
+    lines_processed: int = Field(..., description="Number of data lines read from the body")
+    metrics_imported: int = Field(..., description="Number of metrics successfully imported")
+    failed: int = Field(0, description="Number of lines that were rejected")
+    batches: int = Field(0, description="Number of batches written")
+    errors: List[BackfillLineError] = Field(default_factory=list, description="First rejected lines with the reason")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "status": "partial",
+                "message": "Imported 249999 metrics, 1 failed",
+                "lines_processed": 250000,
+                "metrics_imported": 249999,
+                "failed": 1,
+                "batches": 50,
+                "errors": [{"line": 1042, "error": "value must be numeric"}]
+            }
+        }
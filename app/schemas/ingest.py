@@ -1,6 +1,9 @@
-from pydantic import BaseModel,Field,field_validator
+from pydantic import BaseModel,Field,field_validator,model_validator
 from datetime import datetime
-from typing import Optional,Dict
+from typing import Optional,Dict,List,Tuple
+import math
+
+MAX_BATCH_POINTS=50000
 
 class IngestRequest(BaseModel):
     metric_name:str=Field(...,min_length=1,max_length=100,description="Name of the metric")
@@ -21,6 +24,8 @@ class IngestRequest(BaseModel):
     def validate_value(cls,v:float)->float:
         if not isinstance(v,(int,float)):
             raise ValueError("Value must be a numeric type")
+        if not math.isfinite(v):
+            raise ValueError("Value must be finite")
         return v
 
     class Config:
@@ -47,3 +52,76 @@ class IngestResponse(BaseModel):
                 "metric_id":42
             }
         }
+
+
+class SeriesPoints(BaseModel):
+    metric_name:str=Field(...,min_length=1,max_length=100,description="Name of the metric")
+    labels:Optional[Dict[str,str]]=Field(default_factory=dict,description="Optional labels shared by every point")
+    tenant_id:Optional[str]=Field(None,description="Optional tenant identifier")
+    points:List[Tuple[datetime,float]]=Field(...,description="List of [timestamp, value] pairs")
+
+    @field_validator("metric_name")
+    @classmethod
+    def validate_metric_name(cls,v:str)->str:
+        if not v or not v.strip():
+            raise ValueError("Metric name must be a non-empty string")
+        return v.strip()
+
+    @field_validator("points")
+    @classmethod
+    def validate_points(cls,v:List[Tuple[datetime,float]])->List[Tuple[datetime,float]]:
+        if not all(math.isfinite(value) for _,value in v):
+            raise ValueError("Point values must be finite")
+        return v
+
+class BatchIngestRequest(BaseModel):
+    metrics:List[IngestRequest]=Field(default_factory=list,description="Individual metrics to ingest")
+    series:List[SeriesPoints]=Field(default_factory=list,description="Series headers with many points each")
+
+    @model_validator(mode="after")
+    def validate_size(self)->"BatchIngestRequest":
+        total=len(self.metrics)+sum(len(s.points) for s in self.series)
+        if total==0:
+            raise ValueError("Batch cannot be empty")
+        if total>MAX_BATCH_POINTS:
+            raise ValueError(f"Cannot ingest more than {MAX_BATCH_POINTS} points in one batch")
+        return self
+
+    class Config:
+        json_schema_extra={
+            "example":{
+                "metrics":[
+                    {
+                        "metric_name":"cpu_usage",
+                        "value":75.5,
+                        "timestamp":"2024-06-01T12:00:00Z",
+                        "labels":{"host":"server1"}
+                    }
+                ],
+                "series":[
+                    {
+                        "metric_name":"memory_usage",
+                        "labels":{"host":"server1"},
+                        "points":[["2024-06-01T12:00:00Z",61.2],["2024-06-01T12:00:10Z",61.9]]
+                    }
+                ]
+            }
+        }
+
+class BatchIngestResponse(BaseModel):
+    status:str=Field(...,description="Status of the batch ingestion")
+    message:str=Field(...,description="Detailed message about the ingestion result")
+    accepted:int=Field(...,description="Number of points written")
+    rejected:int=Field(0,description="Number of points rejected")
+    errors:List[str]=Field(default_factory=list,description="One entry per rejected series")
+
+    class Config:
+        json_schema_extra={
+            "example":{
+                "status":"partial",
+                "message":"Ingested 998 metrics, 2 rejected",
+                "accepted":998,
+                "rejected":2,
+                "errors":["Cardinality limit of 100 exceeded for metric 'cpu_usage'"]
+            }
+        }
@@ -1,6 +1,7 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import Optional, List, Dict, Literal, Union
 from datetime import datetime
+from app import config
 
 
 class DataPointSchema(BaseModel):
@@ -39,6 +40,9 @@ class RollupDataPoint(BaseModel):
     avg:float=Field(...,description="Average value in the window")
     sum:float=Field(...,description="Sum of values in the window")
     count:int=Field(...,description="Number of data points in the window")
+    quantiles:Optional[Dict[str,Optional[float]]]=Field(
+        None,description="Requested quantiles estimated from the bucket's sketch (null where it has none)"
+    )
     
     class Config:
         json_schema_extra={
@@ -54,7 +58,7 @@ class RollupDataPoint(BaseModel):
 
 class RollupQueryResponse(BaseModel):
     metric_name:str=Field(...,description="Name of the queried metric")
-    window:str=Field(...,description="Rollup window size (1m, 5m, 1h)")
+    window:str=Field(...,description="Rollup window size, e.g. 1m, 15m, 6h or 1d")
     points:List[RollupDataPoint]=Field(...,description="List of rollup data points")
     total_points:int=Field(...,description="Total number of rollup windows returned")
     
@@ -77,3 +81,115 @@ class RollupQueryResponse(BaseModel):
             }
         }
 
+
+
+class RangeDataPoint(RollupDataPoint):
+    source:str=Field(...,description="Tier the point was read from: raw, 1m, 5m or 1h")
+
+class RangeSegment(BaseModel):
+    source:str=Field(...,description="Tier read for this part of the range: raw, 1m, 5m or 1h")
+    step:Optional[str]=Field(None,description="Bucket size of the points in this segment (null for raw points)")
+    start_time:datetime=Field(...,description="Start of the segment")
+    end_time:datetime=Field(...,description="End of the segment")
+
+class RangeQueryResponse(BaseModel):
+    metric_name:str=Field(...,description="Name of the queried metric")
+    step:str=Field(...,description="Resolution chosen for the newest data: raw or a window such as 5m")
+    points:List[RangeDataPoint]=Field(...,description="Points of all segments, oldest first")
+    segments:List[RangeSegment]=Field(...,description="Tiers stitched together to cover the range, oldest first")
+    total_points:int=Field(...,description="Total number of points returned")
+    
+    class Config:
+        json_schema_extra={
+            "example":{
+                "metric_name":"cpu_usage",
+                "step":"15m",
+                "points":[
+                    {
+                        "timestamp":"2024-01-01T12:00:00Z",
+                        "min":70.0,
+                        "max":80.0,
+                        "avg":75.5,
+                        "sum":6795.0,
+                        "count":90,
+                        "source":"5m"
+                    }
+                ],
+                "segments":[
+                    {"source":"5m","step":"15m","start_time":"2024-01-01T00:00:00Z","end_time":"2024-01-01T12:15:00Z"},
+                    {"source":"raw","step":"15m","start_time":"2024-01-01T12:15:00Z","end_time":"2024-01-01T12:20:00Z"}
+                ],
+                "total_points":1
+            }
+        }
+
+
+class BatchQuerySpec(BaseModel):
+    type:Literal["raw","rollup"]=Field(...,description="raw or rollup")
+    metric_name:str=Field(...,min_length=1,description="Name of the metric to query")
+    start_time:datetime=Field(...,description="Start time for the query range")
+    end_time:datetime=Field(...,description="End time for the query range")
+    labels:Optional[Dict[str,str]]=Field(default_factory=dict,description="Labels to filter on")
+    window:Optional[str]=Field(None,description="Rollup window, required for rollup queries")
+    quantiles:Optional[List[float]]=Field(None,description="Quantiles to estimate for rollup queries")
+    max_points:Optional[int]=Field(None,ge=2,le=100000,description="Downsample raw queries to at most this many points")
+
+    @field_validator("quantiles")
+    @classmethod
+    def validate_quantiles(cls,v:Optional[List[float]])->Optional[List[float]]:
+        if v and any(not 0<=q<=1 for q in v):
+            raise ValueError("Quantiles must be between 0 and 1")
+        return v
+
+    @model_validator(mode="after")
+    def validate_window(self)->"BatchQuerySpec":
+        if self.type=="rollup" and not self.window:
+            raise ValueError("window is required for rollup queries")
+        return self
+
+class BatchQueryRequest(BaseModel):
+    queries:List[BatchQuerySpec]=Field(...,description="Queries to run, answered in the same order")
+
+    @field_validator("queries")
+    @classmethod
+    def validate_size(cls,v:List[BatchQuerySpec])->List[BatchQuerySpec]:
+        if not v:
+            raise ValueError("Batch cannot be empty")
+        if len(v)>config.QUERY_BATCH_MAX_QUERIES:
+            raise ValueError(f"Cannot run more than {config.QUERY_BATCH_MAX_QUERIES} queries in one batch")
+        return v
+
+    class Config:
+        json_schema_extra={
+            "example":{
+                "queries":[
+                    {
+                        "type":"rollup",
+                        "metric_name":"cpu_usage",
+                        "start_time":"2024-01-01T00:00:00Z",
+                        "end_time":"2024-01-02T00:00:00Z",
+                        "window":"5m",
+                        "labels":{"host":"server1"}
+                    },
+                    {
+                        "type":"raw",
+                        "metric_name":"memory_usage",
+                        "start_time":"2024-01-01T00:00:00Z",
+                        "end_time":"2024-01-02T00:00:00Z",
+                        "max_points":1000
+                    }
+                ]
+            }
+        }
+
+class BatchQueryResult(BaseModel):
+    type:str=Field(...,description="raw or rollup, as requested")
+    metric_name:str=Field(...,description="Name of the queried metric")
+    status_code:int=Field(...,description="HTTP status the query would have returned on its own")
+    result:Optional[Union[RollupQueryResponse,RawQueryResponse]]=Field(None,description="Query result when it succeeded")
+    error:Optional[str]=Field(None,description="Error message when it failed")
+
+class BatchQueryResponse(BaseModel):
+    results:List[BatchQueryResult]=Field(...,description="One result per query, in request order")
+    total_queries:int=Field(...,description="Number of queries run")
+    failed_queries:int=Field(...,description="Number of queries that returned an error")
@@ -1,15 +1,19 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.raw_metrics import RawMetrics
 from app.schemas.anomaly import AnomalyDetectionResponse, AnomalyDataPoint
+from app.services.series_service import SeriesService
+from app.utils.columnar import epoch_ms
+from app.utils.time_utils import to_utc_naive
 from datetime import datetime
 from typing import Dict, Optional
 import statistics
 
 class AnomalyService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
     
-    def detect_anomalies(
+    async def detect_anomalies(
         self,
         metric_name: str,
         start_time: datetime,
@@ -17,59 +21,105 @@ class AnomalyService:
         threshold: float = 3.0,
         labels: Optional[Dict[str, str]] = None
     ) -> AnomalyDetectionResponse:
-        query = self.db.query(RawMetrics).filter(
+        scored = await self._score(metric_name, start_time, end_time, threshold, labels)
+        
+        points = [
+            AnomalyDataPoint(
+                timestamp=timestamp,
+                value=value,
+                z_score=z_score,
+                is_anomaly=is_anomaly
+            )
+            for timestamp, value, z_score, is_anomaly in zip(
+                scored["timestamps"], scored["values"], scored["z_scores"], scored["is_anomaly"]
+            )
+        ]
+        
+        return AnomalyDetectionResponse(
+            metric_name=metric_name,
+            total_points=scored["total_points"],
+            anomalies_found=scored["anomalies_found"],
+            mean=scored["mean"],
+            std_dev=scored["std_dev"],
+            threshold=threshold,
+            points=points
+        )
+    
+    async def detect_anomalies_columns(
+        self,
+        metric_name: str,
+        start_time: datetime,
+        end_time: datetime,
+        threshold: float = 3.0,
+        labels: Optional[Dict[str, str]] = None
+    ) -> Dict:
+        """`detect_anomalies` as parallel columns, without per-point models."""
+        scored = await self._score(metric_name, start_time, end_time, threshold, labels)
+        
+        return {
+            "metric_name": metric_name,
+            "total_points": scored["total_points"],
+            "anomalies_found": scored["anomalies_found"],
+            "mean": scored["mean"],
+            "std_dev": scored["std_dev"],
+            "threshold": threshold,
+            "columns": {
+                "timestamp": epoch_ms(scored["timestamps"]),
+                "value": scored["values"],
+                "z_score": scored["z_scores"],
+                "is_anomaly": scored["is_anomaly"]
+            }
+        }
+    
+    async def _score(
+        self,
+        metric_name: str,
+        start_time: datetime,
+        end_time: datetime,
+        threshold: float,
+        labels: Optional[Dict[str, str]]
+    ) -> Dict:
+        query = select(RawMetrics.timestamp, RawMetrics.value).where(
             RawMetrics.metric_name == metric_name,
-            RawMetrics.timestamp >= start_time,
-            RawMetrics.timestamp <= end_time
+            RawMetrics.timestamp >= to_utc_naive(start_time),
+            RawMetrics.timestamp <= to_utc_naive(end_time)
         )
         
         if labels:
-            for key, value in labels.items():
-                query = query.filter(RawMetrics.labels.op("->>")(key) == value)
+            series_ids = await SeriesService(self.db).find_series_ids(metric_name, labels)
+            query = query.where(RawMetrics.series_id.in_(series_ids))
         
-        results = query.order_by(RawMetrics.timestamp).all()
+        results = (await self.db.execute(query.order_by(RawMetrics.timestamp))).all()
         
         if len(results) < 2:
-            return AnomalyDetectionResponse(
-                metric_name=metric_name,
-                total_points=len(results),
-                anomalies_found=0,
-                mean=0.0,
-                std_dev=0.0,
-                threshold=threshold,
-                points=[]
-            )
+            return {
+                "total_points": len(results),
+                "anomalies_found": 0,
+                "mean": 0.0,
+                "std_dev": 0.0,
+                "timestamps": [],
+                "values": [],
+                "z_scores": [],
+                "is_anomaly": []
+            }
         
         values = [r.value for r in results]
         mean = statistics.mean(values)
         std_dev = statistics.stdev(values) if len(values) > 1 else 0.0
         
-        anomalies_found = 0
-        points = []
+        if std_dev > 0:
+            z_scores = [(value - mean) / std_dev for value in values]
+        else:
+            z_scores = [0.0] * len(values)
+        is_anomaly = [abs(z_score) > threshold for z_score in z_scores]
         
-        for result in results:
-            if std_dev > 0:
-                z_score = (result.value - mean) / std_dev
-            else:
-                z_score = 0.0
-            
-            is_anomaly = abs(z_score) > threshold
-            if is_anomaly:
-                anomalies_found += 1
-            
-            points.append(AnomalyDataPoint(
-                timestamp=result.timestamp,
-                value=result.value,
-                z_score=round(z_score, 2),
-                is_anomaly=is_anomaly
-            ))
-        
-        return AnomalyDetectionResponse(
-            metric_name=metric_name,
-            total_points=len(results),
-            anomalies_found=anomalies_found,
-            mean=round(mean, 2),
-            std_dev=round(std_dev, 2),
-            threshold=threshold,
-            points=points
-        )
+        return {
+            "total_points": len(results),
+            "anomalies_found": sum(is_anomaly),
+            "mean": round(mean, 2),
+            "std_dev": round(std_dev, 2),
+            "timestamps": [r.timestamp for r in results],
+            "values": values,
+            "z_scores": [round(z_score, 2) for z_score in z_scores],
+            "is_anomaly": is_anomaly
+        }
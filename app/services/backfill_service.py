@@ -1,34 +1,75 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.raw_metrics import RawMetrics
-from app.schemas.backfill import BackfillRequest, BackfillResponse
-from typing import List
+from app.schemas.backfill import BackfillRequest, BackfillResponse, BackfillStreamResponse, BackfillLineError
+from app.services.series_service import SeriesService
+from app.services.rollup_service import RollupService
+from app.services.stream_aggregator import stream_aggregator
+from app.utils.backfill_parsers import MAX_LINE_BYTES, CsvLineParser, InvalidBackfillFormatException, parse_ndjson_line
+from app.utils.bulk_utils import bulk_insert_raw_metrics
+from app.utils.label_utils import hash_labels
+from app.utils.series_index import series_index
+from app.utils.time_utils import to_utc_naive
+from app import config
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List
+import logging
+
+logger = logging.getLogger(__name__)
 
 class BackfillService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
+        self.batch_size = config.BACKFILL_STREAM_BATCH_SIZE
+        self.max_errors = config.BACKFILL_STREAM_MAX_ERRORS
     
-    def import_metrics(self, request: BackfillRequest) -> BackfillResponse:
+    async def import_metrics(self, request: BackfillRequest) -> BackfillResponse:
         imported = 0
         failed = 0
         
         try:
+            series_ids = await SeriesService(self.db).resolve_many(
+                (metric.metric_name, metric.labels) for metric in request.metrics
+            )
+
             metric_records = []
             for metric in request.metrics:
                 try:
                     metric_record = RawMetrics(
                         metric_name=metric.metric_name,
                         value=metric.value,
-                        timestamp=metric.timestamp,
-                        labels=metric.labels or {}
+                        timestamp=to_utc_naive(metric.timestamp),
+                        series_id=series_ids[(metric.metric_name, hash_labels(metric.labels))]
                     )
                     metric_records.append(metric_record)
                 except Exception:
                     failed += 1
             
             if metric_records:
-                self.db.bulk_save_objects(metric_records)
-                self.db.commit()
+                await self.db.run_sync(lambda session: session.bulk_save_objects(metric_records))
+                observed_at = datetime.now(timezone.utc)
+                await RollupService(self.db).record_late_points(
+                    (
+                        (record.metric_name, record.series_id, record.timestamp, record.value)
+                        for record in metric_records
+                    ),
+                    observed_at
+                )
+                await self.db.commit()
                 imported = len(metric_records)
+                for metric in request.metrics:
+                    series_index.add(metric.metric_name, metric.labels)
+                stream_aggregator.add(
+                    (
+                        {
+                            "metric_name": record.metric_name,
+                            "series_id": record.series_id,
+                            "timestamp": record.timestamp,
+                            "value": record.value
+                        }
+                        for record in metric_records
+                    ),
+                    observed_at
+                )
             
             return BackfillResponse(
                 status="success" if failed == 0 else "partial",
@@ -38,10 +79,130 @@ class BackfillService:
             )
         
         except Exception as e:
-            self.db.rollback()
+            await self.db.rollback()
             return BackfillResponse(
                 status="error",
                 message=f"Backfill failed: {str(e)}",
                 metrics_imported=imported,
                 failed=len(request.metrics) - imported
             )
+
+    async def import_stream(self, chunks: AsyncIterator[bytes], fmt: str) -> BackfillStreamResponse:
+        """Import an NDJSON or CSV body chunk by chunk.
+
+        Lines are validated as they arrive and written in fixed-size batches,
+        each in its own transaction, so memory stays flat regardless of the
+        upload size. Batches committed before a failure stay committed.
+        """
+        lines_processed = 0
+        imported = 0
+        failed = 0
+        batches = 0
+        errors: List[BackfillLineError] = []
+        batch: List[Dict] = []
+        csv_parser = None
+        line_number = 0
+
+        def reject(number: int, error: str):
+            nonlocal failed
+            failed += 1
+            if len(errors) < self.max_errors:
+                errors.append(BackfillLineError(line=number, error=error))
+
+        try:
+            async for raw_line in self._iter_lines(chunks):
+                line_number += 1
+                if not raw_line.strip():
+                    continue
+
+                if fmt == "csv" and csv_parser is None:
+                    try:
+                        header = raw_line.decode("utf-8")
+                    except UnicodeDecodeError:
+                        raise InvalidBackfillFormatException("CSV header must be UTF-8 encoded")
+                    csv_parser = CsvLineParser(header)
+                    continue
+
+                lines_processed += 1
+                try:
+                    line = raw_line.decode("utf-8")
+                    batch.append(csv_parser.parse(line) if csv_parser else parse_ndjson_line(line))
+                except ValueError as e:
+                    reject(line_number, str(e))
+                    continue
+
+                if len(batch) >= self.batch_size:
+                    imported += await self._write_batch(batch)
+                    batches += 1
+                    batch = []
+                    logger.info(f"Backfill stream: {lines_processed} lines read, {imported} imported, {failed} failed")
+
+            if batch:
+                imported += await self._write_batch(batch)
+                batches += 1
+
+        except InvalidBackfillFormatException:
+            raise
+        except Exception as e:
+            await self.db.rollback()
+            return BackfillStreamResponse(
+                status="error",
+                message=f"Backfill stopped at line {line_number} after importing {imported} metrics: {str(e)}",
+                lines_processed=lines_processed,
+                metrics_imported=imported,
+                failed=failed,
+                batches=batches,
+                errors=errors
+            )
+
+        return BackfillStreamResponse(
+            status="success" if failed == 0 else "partial",
+            message=f"Imported {imported} metrics" + (f", {failed} failed" if failed > 0 else ""),
+            lines_processed=lines_processed,
+            metrics_imported=imported,
+            failed=failed,
+            batches=batches,
+            errors=errors
+        )
+
+    async def _write_batch(self, batch: List[Dict]) -> int:
+        series_ids = await SeriesService(self.db).resolve_many(
+            (row["metric_name"], row["labels"]) for row in batch
+        )
+        for row in batch:
+            row["series_id"] = series_ids[(row["metric_name"], hash_labels(row["labels"]))]
+
+        written = await bulk_insert_raw_metrics(self.db, batch)
+        observed_at = datetime.now(timezone.utc)
+        await RollupService(self.db).record_late_points(
+            ((row["metric_name"], row["series_id"], row["timestamp"], row["value"]) for row in batch), observed_at
+        )
+        await self.db.commit()
+
+        for metric_name, labels_hash in series_ids:
+            series_index.add_hash(metric_name, labels_hash)
+        stream_aggregator.add(batch, observed_at)
+        return written
+
+    async def _iter_lines(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        remainder = b""
+        line_number = 0
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            lines = (remainder + chunk).split(b"\n")
+            remainder = lines.pop()
+            for line in lines:
+                line_number += 1
+                self._check_line_length(line, line_number)
+                yield line.rstrip(b"\r")
+            # An unterminated line must not grow without bound either
+            self._check_line_length(remainder, line_number + 1)
+        if remainder:
+            yield remainder.rstrip(b"\r")
+
+    def _check_line_length(self, line: bytes, line_number: int) -> None:
+        if len(line) > MAX_LINE_BYTES:
+            raise InvalidBackfillFormatException(
+                f"Line {line_number} is longer than {MAX_LINE_BYTES} bytes; is the body newline-delimited?"
+            )
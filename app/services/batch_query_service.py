@@ -0,0 +1,65 @@
+import asyncio
+import logging
+from typing import Dict, List
+from fastapi import status
+from app import config
+from app.db import AsyncSessionLocal
+from app.schemas.query import BatchQuerySpec, RawQueryResponse, RollupQueryResponse
+from app.services.query_service import QueryService
+
+logger = logging.getLogger(__name__)
+
+# Shared by every batch, so concurrent batches together hold at most this many connections
+_slots = asyncio.Semaphore(max(1, config.QUERY_BATCH_CONCURRENCY))
+
+
+class BatchQueryService:
+    """Runs the raw/rollup queries of one `POST /query/batch` concurrently.
+
+    Every query gets its own session, because an AsyncSession cannot run two
+    statements at once. At most QUERY_BATCH_CONCURRENCY queries run at a time
+    across all batches, leaving the rest of the pool to other requests. A
+    failing query is reported in its own result and does not fail the batch.
+    """
+
+    async def run(self, specs: List[BatchQuerySpec]) -> Dict:
+        results = await asyncio.gather(*(self._run_one(spec) for spec in specs))
+        return {
+            "results": results,
+            "total_queries": len(results),
+            "failed_queries": sum(1 for result in results if result["error"] is not None)
+        }
+
+    async def _run_one(self, spec: BatchQuerySpec) -> Dict:
+        outcome = {"type": spec.type, "metric_name": spec.metric_name, "result": None, "error": None}
+        try:
+            async with _slots:
+                async with AsyncSessionLocal() as db:
+                    query_service = QueryService(db)
+                    if spec.type == "raw":
+                        result = RawQueryResponse(**await query_service.query_raw_data(
+                            metric_name=spec.metric_name,
+                            start_time=spec.start_time,
+                            end_time=spec.end_time,
+                            labels=spec.labels,
+                            max_points=spec.max_points
+                        ))
+                    else:
+                        result = RollupQueryResponse(**await query_service.query_rollup_data(
+                            metric_name=spec.metric_name,
+                            start_time=spec.start_time,
+                            end_time=spec.end_time,
+                            window=spec.window,
+                            labels=spec.labels,
+                            quantiles=spec.quantiles
+                        ))
+            return {**outcome, "status_code": status.HTTP_200_OK, "result": result}
+        except ValueError as e:
+            return {**outcome, "status_code": status.HTTP_400_BAD_REQUEST, "error": str(e)}
+        except Exception as e:
+            logger.error(f"Batch {spec.type} query of {spec.metric_name} failed: {e}")
+            return {
+                **outcome,
+                "status_code": status.HTTP_500_INTERNAL_SERVER_ERROR,
+                "error": f"Error querying {spec.type} data: {str(e)}"
+            }
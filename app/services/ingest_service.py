@@ -0,0 +1,101 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.schemas.ingest import BatchIngestRequest, BatchIngestResponse
+from app.utils.bulk_utils import bulk_insert_raw_metrics
+from app.utils.label_utils import hash_labels, normalize_labels
+from app.utils.series_index import series_index
+from app.services.series_service import SeriesService
+from app.services.rollup_service import RollupService
+from app.services.stream_aggregator import stream_aggregator
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+
+class IngestService:
+    def __init__(self, db: AsyncSession, cardinality_limit: int = 100):
+        self.db = db
+        self.cardinality_limit = cardinality_limit
+
+    async def ingest_batch(self, request: BatchIngestRequest) -> BatchIngestResponse:
+        grouped = self._group_by_series(request)
+
+        rows = []
+        rejected = 0
+        errors = []
+        accepted_series = []
+        new_series: Dict[str, int] = {}
+
+        for (metric_name, labels_hash), group in grouped.items():
+            if group["labels"] and not await series_index.contains(self.db, metric_name, labels_hash):
+                pending = new_series.get(metric_name, 0)
+                if not await series_index.check(self.db, metric_name, labels_hash, self.cardinality_limit, pending):
+                    rejected += len(group["rows"])
+                    errors.append(
+                        f"Cardinality limit of {self.cardinality_limit} exceeded for metric '{metric_name}' "
+                        f"(labels {group['labels']})"
+                    )
+                    continue
+                new_series[metric_name] = pending + 1
+
+            accepted_series.append((metric_name, group["labels"]))
+            rows.extend(group["rows"])
+
+        series_ids = await SeriesService(self.db).resolve_many(accepted_series)
+        for row in rows:
+            row["series_id"] = series_ids[(row["metric_name"], hash_labels(row["labels"]))]
+
+        observed_at = datetime.now(timezone.utc)
+        try:
+            accepted = await bulk_insert_raw_metrics(self.db, rows)
+            await RollupService(self.db).record_late_points(
+                ((row["metric_name"], row["series_id"], row["timestamp"], row["value"]) for row in rows), observed_at
+            )
+            await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
+        stream_aggregator.add(rows, observed_at)
+
+        for metric_name, labels in accepted_series:
+            series_index.add(metric_name, labels)
+
+        if accepted == 0:
+            status = "rejected"
+        elif rejected:
+            status = "partial"
+        else:
+            status = "success"
+
+        return BatchIngestResponse(
+            status=status,
+            message=f"Ingested {accepted} metrics" + (f", {rejected} rejected" if rejected else ""),
+            accepted=accepted,
+            rejected=rejected,
+            errors=errors
+        )
+
+    def _group_by_series(self, request: BatchIngestRequest) -> Dict[Tuple[str, str], Dict]:
+        grouped: Dict[Tuple[str, str], Dict] = {}
+
+        def add(metric_name: str, labels: Dict[str, str], tenant_id, points: List[Tuple]):
+            labels = normalize_labels(labels)
+            key = (metric_name, hash_labels(labels))
+            if key not in grouped:
+                grouped[key] = {"labels": labels, "rows": []}
+            grouped[key]["rows"].extend(
+                {
+                    "metric_name": metric_name,
+                    "value": value,
+                    "timestamp": timestamp,
+                    "labels": labels,
+                    "tenant_id": tenant_id
+                }
+                for timestamp, value in points
+            )
+
+        for metric in request.metrics:
+            add(metric.metric_name, metric.labels, metric.tenant_id, [(metric.timestamp, metric.value)])
+
+        for series in request.series:
+            add(series.metric_name, series.labels, series.tenant_id, series.points)
+
+        return grouped
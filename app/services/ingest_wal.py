@@ -0,0 +1,332 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Deque, Dict, List, Optional
+from sqlalchemy import delete
+from app import config
+from app.db import AsyncSessionLocal
+from app.models.ingest_wal_segments import IngestWalSegment
+from app.services.rollup_service import RollupService
+from app.services.series_service import SeriesService
+from app.services.stream_aggregator import stream_aggregator
+from app.services.write_buffer import WriteBufferFullException
+from app.utils.bulk_utils import bulk_insert_raw_metrics
+from app.utils.label_utils import hash_labels
+from app.utils.series_index import series_index
+from app.utils.time_utils import to_utc_naive
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = ".wal"
+REPLAY_CHUNK_ROWS = 5000
+# Markers only need to outlive the window between a segment's commit and its unlink
+MARKER_RETENTION = timedelta(days=1)
+
+
+class IngestWal:
+    """Segmented, append-only local log for durable single-point ingest.
+
+    Appends go to the active segment and are acknowledged once the next
+    batched fsync covering them has completed. Segments are sealed when they
+    reach `segment_bytes` or have been open for `rotate_seconds`, and a
+    replayer bulk loads sealed segments into raw_metrics and deletes them.
+
+    Each replayed segment is recorded in `ingest_wal_segments` in the same
+    transaction as its rows, so a crash between the commit and the unlink
+    never loads a segment twice. Segments left behind by a previous process
+    are picked up on start.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int,
+        fsync_interval_ms: float,
+        rotate_seconds: float,
+        capacity: int
+    ):
+        self.directory = Path(directory)
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval_ms / 1000
+        self.rotate_seconds = rotate_seconds
+        self.capacity = capacity
+        self._fd: Optional[int] = None
+        self._segment: Optional[Path] = None
+        self._segment_opened_at = 0.0
+        self._segment_size = 0
+        self._sequence = 0
+        self._directory_dirty = False
+        self._waiters: List[asyncio.Future] = []
+        self._sealed: Deque[Path] = deque()
+        self._sync_wakeup: Optional[asyncio.Event] = None
+        self._replay_wakeup: Optional[asyncio.Event] = None
+        self._sync_task: Optional[asyncio.Task] = None
+        self._replay_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    @property
+    def running(self) -> bool:
+        return self._sync_task is not None and not self._closed
+
+    def pending_segments(self) -> int:
+        return len(self._sealed)
+
+    async def start(self) -> None:
+        if self._sync_task is not None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        recovered = self._recover()
+        self._closed = False
+        self._open_segment()
+        self._sync_wakeup = asyncio.Event()
+        self._replay_wakeup = asyncio.Event()
+        self._sync_task = asyncio.create_task(self._sync_loop())
+        self._replay_task = asyncio.create_task(self._replay_loop())
+        if recovered:
+            self._replay_wakeup.set()
+        logger.info(
+            f"Ingest WAL started in {self.directory} (segment={self.segment_bytes} bytes, "
+            f"fsync every {self.fsync_interval * 1000:.1f}ms, {recovered} segments recovered)"
+        )
+
+    async def stop(self) -> None:
+        if self._sync_task is None:
+            return
+        self._closed = True
+        self._sync_wakeup.set()
+        await self._sync_task
+        self._seal(self._fd, self._segment, self._segment_size)
+        self._fd = None
+
+        self._replay_task.cancel()
+        try:
+            await self._replay_task
+        except asyncio.CancelledError:
+            pass
+        await self._replay_sealed()
+
+        self._sync_task = None
+        self._replay_task = None
+        if self._sealed:
+            logger.warning(f"Ingest WAL stopped with {len(self._sealed)} segments left for the next start")
+        else:
+            logger.info("Ingest WAL drained and stopped")
+
+    async def append(self, row: Dict) -> None:
+        if not self.running:
+            raise RuntimeError("Ingest WAL is not running")
+        if len(self._waiters) >= self.capacity:
+            raise WriteBufferFullException(
+                f"Ingest WAL has {self.capacity} appends waiting for fsync, retry later"
+            )
+
+        record = json.dumps({
+            "metric_name": row["metric_name"],
+            "value": row["value"],
+            "timestamp": row["timestamp"].isoformat(),
+            "labels": row.get("labels") or {},
+            "tenant_id": row.get("tenant_id")
+        }, separators=(",", ":")).encode("utf-8") + b"\n"
+
+        os.write(self._fd, record)
+        self._segment_size += len(record)
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        if len(self._waiters) == 1:
+            self._sync_wakeup.set()
+
+        await future
+
+    async def _sync_loop(self) -> None:
+        while True:
+            if not self._waiters:
+                if self._closed:
+                    return
+                self._sync_wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._sync_wakeup.wait(), timeout=self.rotate_seconds)
+                except asyncio.TimeoutError:
+                    pass
+            elif not self._closed:
+                await asyncio.sleep(self.fsync_interval)
+
+            rotating = self._should_rotate() and not self._closed
+            if not self._waiters and not rotating:
+                continue
+
+            waiters = self._waiters
+            self._waiters = []
+            fd, segment, size = self._fd, self._segment, self._segment_size
+            if rotating:
+                # New appends go to the next segment while this one is synced
+                self._open_segment()
+
+            try:
+                await asyncio.to_thread(self._fsync, fd)
+            except Exception as e:
+                logger.error(f"WAL fsync of {len(waiters)} appends failed: {e}")
+                for future in waiters:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for future in waiters:
+                    if not future.done():
+                        future.set_result(None)
+
+            if rotating:
+                self._seal(fd, segment, size)
+
+    async def _replay_loop(self) -> None:
+        while True:
+            self._replay_wakeup.clear()
+            try:
+                await asyncio.wait_for(self._replay_wakeup.wait(), timeout=self.rotate_seconds)
+            except asyncio.TimeoutError:
+                pass
+            if not await self._replay_sealed():
+                # The database is unavailable; keep the segments and back off
+                await asyncio.sleep(max(self.rotate_seconds, 1.0))
+
+    async def _replay_sealed(self) -> bool:
+        while self._sealed:
+            segment = self._sealed[0]
+            try:
+                await self._replay(segment)
+            except Exception as e:
+                logger.error(f"Replay of WAL segment {segment.name} failed, will retry: {e}")
+                return False
+            self._sealed.popleft()
+        return True
+
+    async def _replay(self, segment: Path) -> None:
+        rows = await asyncio.to_thread(self._read_segment, segment)
+
+        async with AsyncSessionLocal() as db:
+            if await db.get(IngestWalSegment, segment.name) is None:
+                series_ids = await SeriesService(db).resolve_many(
+                    (row["metric_name"], row["labels"]) for row in rows
+                )
+                for row in rows:
+                    row["series_id"] = series_ids[(row["metric_name"], hash_labels(row["labels"]))]
+
+                observed_at = datetime.now(timezone.utc)
+                try:
+                    for start in range(0, len(rows), REPLAY_CHUNK_ROWS):
+                        await bulk_insert_raw_metrics(db, rows[start:start + REPLAY_CHUNK_ROWS])
+                    await RollupService(db).record_late_points(
+                        ((row["metric_name"], row["series_id"], row["timestamp"], row["value"]) for row in rows), observed_at
+                    )
+                    db.add(IngestWalSegment(segment=segment.name, rows=len(rows)))
+                    await db.commit()
+                except Exception:
+                    await db.rollback()
+                    raise
+
+                for metric_name, labels_hash in series_ids:
+                    series_index.add_hash(metric_name, labels_hash)
+                stream_aggregator.add(rows, observed_at)
+                logger.info(f"Replayed WAL segment {segment.name} ({len(rows)} rows)")
+
+            segment.unlink(missing_ok=True)
+            await db.execute(
+                delete(IngestWalSegment).where(IngestWalSegment.replayed_at < to_utc_naive(
+                    datetime.now(timezone.utc) - MARKER_RETENTION
+                ))
+            )
+            await db.commit()
+
+    def _read_segment(self, segment: Path) -> List[Dict]:
+        rows = []
+        try:
+            data = segment.read_bytes()
+        except FileNotFoundError:
+            return rows
+
+        for number, line in enumerate(data.split(b"\n"), start=1):
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                rows.append({
+                    "metric_name": record["metric_name"],
+                    "value": record["value"],
+                    "timestamp": datetime.fromisoformat(record["timestamp"]),
+                    "labels": record.get("labels") or {},
+                    "tenant_id": record.get("tenant_id")
+                })
+            except (ValueError, KeyError, TypeError) as e:
+                # Only the tail of a segment can be torn by a crash, and it was never acked
+                logger.warning(f"Skipping unreadable record {number} in WAL segment {segment.name}: {e}")
+        return rows
+
+    def _recover(self) -> int:
+        recovered = 0
+        for segment in sorted(self.directory.glob(f"*{SEGMENT_SUFFIX}")):
+            if segment in self._sealed:
+                continue
+            # Segments still locked are the active segment of another live process
+            with open(segment, "rb") as f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+            self._sealed.append(segment)
+            recovered += 1
+        return recovered
+
+    def _open_segment(self) -> None:
+        self._sequence += 1
+        name = f"{int(time.time() * 1000):013d}-{os.getpid()}-{self._sequence:06d}{SEGMENT_SUFFIX}"
+        self._segment = self.directory / name
+        self._fd = os.open(self._segment, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._segment_opened_at = time.monotonic()
+        self._segment_size = 0
+        self._directory_dirty = True
+
+    def _fsync(self, fd: int) -> None:
+        if self._directory_dirty:
+            # A new segment's directory entry must be durable before appends to it are acked
+            self._directory_dirty = False
+            try:
+                directory_fd = os.open(self.directory, os.O_RDONLY)
+                try:
+                    os.fsync(directory_fd)
+                finally:
+                    os.close(directory_fd)
+            except Exception:
+                self._directory_dirty = True
+                raise
+        os.fsync(fd)
+
+    def _seal(self, fd: int, segment: Path, size: int) -> None:
+        os.close(fd)
+        if size:
+            self._sealed.append(segment)
+            self._replay_wakeup.set()
+        else:
+            segment.unlink(missing_ok=True)
+
+    def _should_rotate(self) -> bool:
+        if not self._segment_size:
+            return False
+        return (
+            self._segment_size >= self.segment_bytes
+            or time.monotonic() - self._segment_opened_at >= self.rotate_seconds
+        )
+
+
+ingest_wal = IngestWal(
+    directory=config.INGEST_WAL_DIR,
+    segment_bytes=config.INGEST_WAL_SEGMENT_BYTES,
+    fsync_interval_ms=config.INGEST_WAL_FSYNC_INTERVAL_MS,
+    rotate_seconds=config.INGEST_WAL_ROTATE_SECONDS,
+    capacity=config.INGEST_WAL_CAPACITY
+)
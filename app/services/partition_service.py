@@ -0,0 +1,289 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex
+from app.models.raw_metrics import RawMetrics
+from app.models.rollup_metrics import RollupMetrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+RAW_TABLE = "raw_metrics"
+ROLLUP_TABLE = "rollup_metrics"
+ROLLUP_WINDOWS = ("1m", "5m", "1h")
+DAY_SUFFIX = "_p"
+
+
+def partition_name(parent: str, day: date) -> str:
+    return f"{parent}{DAY_SUFFIX}{day:%Y%m%d}"
+
+
+def rollup_parent(window: str) -> str:
+    return f"{ROLLUP_TABLE}_{window}"
+
+
+class PartitionService:
+    """Daily range partitions for raw_metrics and rollup_metrics (PostgreSQL only).
+
+    raw_metrics is partitioned by RANGE(timestamp); rollup_metrics is
+    partitioned by LIST(window) and each window by RANGE(start_time). Every
+    range parent has a `_default` partition for rows outside the premade
+    days, and retention drops whole days before falling back to row deletes
+    for whatever is left.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def supported(self) -> bool:
+        return self.db.bind.dialect.name == "postgresql"
+
+    def is_partitioned(self, table: str) -> bool:
+        return self._relkind(table) == "p"
+
+    def range_parents(self) -> List[str]:
+        return [RAW_TABLE] + [rollup_parent(window) for window in ROLLUP_WINDOWS]
+
+    def migrate(self) -> None:
+        """Convert plain raw/rollup tables into partitioned ones."""
+        if not self.supported():
+            return
+        if not self.is_partitioned(RAW_TABLE):
+            self._migrate_raw()
+        if not self.is_partitioned(ROLLUP_TABLE):
+            self._migrate_rollups()
+
+    def ensure_partitions(self, days_ahead: int, start: Optional[date] = None) -> int:
+        if not self.supported() or not self.is_partitioned(RAW_TABLE):
+            return 0
+
+        start = start or datetime.now(timezone.utc).date()
+        created = 0
+        for parent in self.range_parents():
+            if self._relkind(parent) != "p":
+                continue
+            existing = {day for _, day in self.daily_partitions(parent)}
+            for offset in range(days_ahead + 1):
+                day = start + timedelta(days=offset)
+                if day not in existing and self._create_day(parent, day):
+                    created += 1
+        return created
+
+    def daily_partitions(self, parent: str) -> List[Tuple[str, date]]:
+        rows = self.db.execute(text("""
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = :parent
+        """), {"parent": parent}).scalars()
+
+        prefix = f"{parent}{DAY_SUFFIX}"
+        partitions = []
+        for name in rows:
+            if not name.startswith(prefix):
+                continue
+            try:
+                partitions.append((name, datetime.strptime(name[len(prefix):], "%Y%m%d").date()))
+            except ValueError:
+                continue
+        return sorted(partitions, key=lambda partition: partition[1])
+
+    def drop_partitions_before(self, parent: str, cutoff: datetime) -> Tuple[int, int]:
+        """Detach and drop every daily partition that ends at or before `cutoff`.
+
+        Returns the number of partitions dropped and their estimated row count.
+        """
+        dropped = 0
+        rows = 0
+        for name, day in self.daily_partitions(parent):
+            if datetime.combine(day + timedelta(days=1), datetime.min.time()) > cutoff:
+                break
+            try:
+                estimate = self.db.execute(
+                    text("SELECT reltuples::bigint FROM pg_class WHERE relname = :name"), {"name": name}
+                ).scalar() or 0
+                self.db.execute(text(f'ALTER TABLE {parent} DETACH PARTITION "{name}"'))
+                self.db.execute(text(f'DROP TABLE "{name}"'))
+                self.db.commit()
+            except Exception:
+                self.db.rollback()
+                raise
+            dropped += 1
+            rows += max(estimate, 0)
+            logger.info(f"Dropped partition {name} (~{max(estimate, 0)} rows)")
+        return dropped, rows
+
+    def drop_empty_legacy(self, parent: str) -> bool:
+        """Drop the pre-partitioning table attached to `parent` once retention has emptied it."""
+        legacy = f"{parent}_legacy"
+        if self._relkind(legacy) is None:
+            return False
+        try:
+            if self.db.execute(text(f'SELECT 1 FROM "{legacy}" LIMIT 1')).first() is not None:
+                self.db.rollback()
+                return False
+            self.db.execute(text(f'ALTER TABLE {parent} DETACH PARTITION "{legacy}"'))
+            self.db.execute(text(f'DROP TABLE "{legacy}"'))
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        logger.info(f"Dropped empty legacy partition {legacy}")
+        return True
+
+    def _create_day(self, parent: str, day: date) -> bool:
+        """Create the partition for `day`, moving in rows the default partition holds for it.
+
+        PostgreSQL refuses a new partition while the default partition has
+        rows in its range, so the default is detached, its rows for the day
+        are moved into the new partition and it is attached again, all in one
+        transaction. Attaching rescans the default partition, which stays
+        small as long as partitions are premade ahead of the data.
+        """
+        name = partition_name(parent, day)
+        default = f"{parent}_default"
+        key = self._range_key(parent)
+        bounds = f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+        in_day = f"{key} >= '{day.isoformat()}' AND {key} < '{(day + timedelta(days=1)).isoformat()}'"
+        try:
+            stray = self._relkind(default) is not None and self.db.execute(
+                text(f"SELECT 1 FROM {default} WHERE {in_day} LIMIT 1")
+            ).first() is not None
+            if stray:
+                self.db.execute(text(f"ALTER TABLE {parent} DETACH PARTITION {default}"))
+                self.db.execute(text(f'CREATE TABLE "{name}" PARTITION OF {parent} {bounds}'))
+                self.db.execute(text(f'INSERT INTO "{name}" SELECT * FROM {default} WHERE {in_day}'))
+                self.db.execute(text(f"DELETE FROM {default} WHERE {in_day}"))
+                self.db.execute(text(f"ALTER TABLE {parent} ATTACH PARTITION {default} DEFAULT"))
+                logger.info(f"Moved rows for {day.isoformat()} out of {default} into {name}")
+            else:
+                self.db.execute(text(f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF {parent} {bounds}'))
+            self.db.commit()
+            return True
+        except Exception as e:
+            # Typically the day overlaps the legacy partition
+            self.db.rollback()
+            logger.warning(f"Skipped partition {name}: {e}")
+            return False
+
+    def _range_key(self, parent: str) -> str:
+        return "timestamp" if parent == RAW_TABLE else "start_time"
+
+    def _migrate_raw(self) -> None:
+        try:
+            self.db.execute(text(f"LOCK TABLE {RAW_TABLE} IN ACCESS EXCLUSIVE MODE"))
+            if self.is_partitioned(RAW_TABLE) or self._has_column(RAW_TABLE, "labels"):
+                self.db.rollback()
+                return
+
+            legacy = f"{RAW_TABLE}_legacy"
+            self._rename_to_legacy(RAW_TABLE, legacy)
+            self.db.execute(text(
+                f"CREATE TABLE {RAW_TABLE} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE (timestamp)"
+            ))
+            self._adopt_sequence(legacy, RAW_TABLE)
+            self._create_model_indexes(RawMetrics)
+
+            max_timestamp = self.db.execute(text(f"SELECT max(timestamp) FROM {legacy}")).scalar()
+            if max_timestamp is None:
+                self.db.execute(text(f"DROP TABLE {legacy}"))
+            else:
+                # Existing rows are attached in place rather than copied
+                bound = max_timestamp.date() + timedelta(days=1)
+                self.db.execute(text(
+                    f"ALTER TABLE {RAW_TABLE} ATTACH PARTITION {legacy} "
+                    f"FOR VALUES FROM (MINVALUE) TO ('{bound.isoformat()}')"
+                ))
+            self.db.execute(text(f"CREATE TABLE {RAW_TABLE}_default PARTITION OF {RAW_TABLE} DEFAULT"))
+            self.db.commit()
+            logger.info(f"Converted {RAW_TABLE} into a partitioned table")
+        except Exception:
+            self.db.rollback()
+            raise
+
+    def _migrate_rollups(self) -> None:
+        try:
+            self.db.execute(text(f"LOCK TABLE {ROLLUP_TABLE} IN ACCESS EXCLUSIVE MODE"))
+            if self.is_partitioned(ROLLUP_TABLE) or self._has_column(ROLLUP_TABLE, "labels"):
+                self.db.rollback()
+                return
+
+            legacy = f"{ROLLUP_TABLE}_legacy"
+            self._rename_to_legacy(ROLLUP_TABLE, legacy)
+            self.db.execute(text(
+                f'CREATE TABLE {ROLLUP_TABLE} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY LIST ("window")'
+            ))
+            self._adopt_sequence(legacy, ROLLUP_TABLE)
+            self._create_model_indexes(RollupMetrics)
+            self.db.execute(text(
+                f'CREATE UNIQUE INDEX uix_rollup_series ON {ROLLUP_TABLE} (series_id, "window", start_time)'
+            ))
+
+            for window in ROLLUP_WINDOWS:
+                parent = rollup_parent(window)
+                self.db.execute(text(
+                    f"CREATE TABLE {parent} PARTITION OF {ROLLUP_TABLE} "
+                    f"FOR VALUES IN ('{window}') PARTITION BY RANGE (start_time)"
+                ))
+                self.db.execute(text(f"CREATE TABLE {parent}_default PARTITION OF {parent} DEFAULT"))
+
+                first, last = self.db.execute(text(
+                    f'SELECT min(start_time), max(start_time) FROM {legacy} WHERE "window" = :window'
+                ), {"window": window}).one()
+                if first is not None:
+                    day = first.date()
+                    while day <= last.date():
+                        self.db.execute(text(
+                            f"CREATE TABLE \"{partition_name(parent, day)}\" PARTITION OF {parent} "
+                            f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+                        ))
+                        day += timedelta(days=1)
+            self.db.execute(text(f"CREATE TABLE {ROLLUP_TABLE}_default PARTITION OF {ROLLUP_TABLE} DEFAULT"))
+
+            # Rollups are small next to raw data, so they are copied into the daily partitions
+            self.db.execute(text(f"INSERT INTO {ROLLUP_TABLE} SELECT * FROM {legacy}"))
+            self.db.execute(text(f"DROP TABLE {legacy}"))
+            self.db.commit()
+            logger.info(f"Converted {ROLLUP_TABLE} into a partitioned table")
+        except Exception:
+            self.db.rollback()
+            raise
+
+    def _rename_to_legacy(self, table: str, legacy: str) -> None:
+        # A partitioned parent cannot carry a primary key without the partition
+        # key; ids stay unique through the shared sequence.
+        for constraint in self.db.execute(text("""
+            SELECT conname FROM pg_constraint
+            WHERE conrelid = CAST(:table AS regclass) AND contype IN ('p', 'u')
+        """), {"table": table}).scalars():
+            self.db.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{constraint}"'))
+
+        self.db.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+        for index in self.db.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE tablename = :table"
+        ), {"table": legacy}).scalars():
+            self.db.execute(text(f'ALTER INDEX "{index}" RENAME TO "{(index + "_legacy")[:63]}"'))
+
+    def _adopt_sequence(self, legacy: str, table: str) -> None:
+        sequence = self.db.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": legacy}).scalar()
+        if sequence:
+            self.db.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id"))
+
+    def _create_model_indexes(self, model) -> None:
+        for index in model.__table__.indexes:
+            self.db.execute(text(str(CreateIndex(index).compile(dialect=postgresql.dialect()))))
+
+    def _has_column(self, table: str, column: str) -> bool:
+        return self.db.execute(text("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = :table AND column_name = :column
+        """), {"table": table, "column": column}).first() is not None
+
+    def _relkind(self, table: str) -> Optional[str]:
+        return self.db.execute(text("""
+            SELECT relkind FROM pg_class
+            WHERE relname = :table AND relnamespace = CAST(current_schema() AS regnamespace)
+        """), {"table": table}).scalar()
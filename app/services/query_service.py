@@ -1,15 +1,36 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import func,literal_column,select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import config
 from app.schemas.query import DataPointSchema
-from app.utils.label_utils import normalize_labels
+from app.utils.columnar import epoch_ms
+from app.utils.downsample import Downsampler
+from app.utils.label_utils import hash_labels,normalize_labels
+from app.utils.query_cache import query_cache
+from app.utils.retention_policy import RetentionPolicy
+from app.utils.time_utils import ceil_to_window,format_window,parse_window,round_to_window,to_utc_naive
 from datetime import timedelta
-from datetime import datetime
-from typing import List, Dict
+from datetime import datetime,timezone
+from typing import AsyncIterator, List, Dict, Optional
+import json
+import math
 from app.models.raw_metrics import RawMetrics
 from app.models.rollup_metrics import RollupMetrics
-from app.schemas.query import RollupDataPoint
+from app.models.rollup_watermarks import RollupWatermark
+from app.schemas.query import RangeDataPoint, RollupDataPoint
+from app.services.series_service import SeriesService
+from app.services.rollup_service import RollupService
+from app.services.stream_aggregator import stream_aggregator
+from app.utils.sketch import merge_sketches, quantiles as sketch_quantiles
+
+EPOCH=datetime(1970,1,1)
+RAW="raw"
+# Steps /query/range picks from, finest first; all are multiples of a stored tier
+RANGE_STEPS=["1m","2m","5m","10m","15m","30m","1h","2h","3h","6h","12h","1d","7d"]
+# Raw rows fetched per round trip by scans that downsample or stream
+RAW_CHUNK_ROWS=10000
 
 class QueryService:
-    def __init__(self,db:Session):
+    def __init__(self,db:AsyncSession):
         self.db=db
         
     async def _query_raw_data(
@@ -19,16 +40,43 @@ class QueryService:
             end_time:datetime,
             labels:Dict[str,str]
     )->List[Dict]:
-        query=self.db.query(RawMetrics).filter(
+        query=await self._raw_points_query(metric_name,start_time,end_time,labels)
+        results=await self.db.execute(query)
+
+        return [{"timestamp":r.timestamp,"value":r.value} for r in results]
+
+    async def _raw_points_query(self,metric_name:str,start_time:datetime,end_time:datetime,labels:Dict[str,str]):
+        """(timestamp, value) of the raw points in [start_time, end_time], in time order."""
+        query=select(RawMetrics.timestamp,RawMetrics.value).where(
             RawMetrics.metric_name==metric_name,
-            RawMetrics.timestamp >= start_time,
-            RawMetrics.timestamp <= end_time
+            RawMetrics.timestamp >= to_utc_naive(start_time),
+            RawMetrics.timestamp <= to_utc_naive(end_time)
         )
         if labels:
-            query=self._filter_by_labels(query,labels,RawMetrics)
-        results=query.order_by(RawMetrics.timestamp).all()
+            query=await self._filter_by_labels(query,metric_name,labels,RawMetrics)
+        return query.order_by(RawMetrics.timestamp)
 
-        return [{"timestamp":r.timestamp,"value":r.value} for r in results]
+    async def _downsample_raw_data(
+            self,
+            metric_name:str,
+            start_time:datetime,
+            end_time:datetime,
+            labels:Dict[str,str],
+            max_points:int,
+            method:str
+    )->List[Dict]:
+        """Raw points reduced to at most `max_points` while they are scanned."""
+        start_time=to_utc_naive(start_time)
+        end_time=to_utc_naive(end_time)
+        downsampler=Downsampler(method,start_time,end_time,max_points)
+        query=await self._raw_points_query(metric_name,start_time,end_time,labels)
+
+        # A server-side cursor keeps only one chunk of rows in memory
+        result=await self.db.stream(query.execution_options(yield_per=RAW_CHUNK_ROWS))
+        async for rows in result.partitions():
+            timestamps,values=zip(*rows)
+            downsampler.add(list(timestamps),values)
+        return [{"timestamp":timestamp,"value":value} for timestamp,value in downsampler.finish()]
     
     async def _query_rollup_data(
             self,
@@ -36,51 +84,310 @@ class QueryService:
             start_time:datetime,
             end_time:datetime,
             labels:Dict[str,str],
-            window:str
+            window:str,
+            with_sketches:bool=True,
+            include_open:bool=True
+    )->List[Dict]:
+        tier=self._source_tier(window)
+        start_time=to_utc_naive(start_time)
+        end_time=to_utc_naive(end_time)
+        if tier!=window:
+            # Like a stored tier, return only the buckets within [start_time, end_time)
+            start_time=ceil_to_window(start_time,window)
+            end_time=max(start_time,round_to_window(end_time,window))
+        series_ids=None
+        if labels:
+            series_ids=await SeriesService(self.db).find_series_ids(metric_name,labels)
+
+        if config.QUERY_CACHE_ENABLED:
+            data_points=await self._cached_rollup_data(metric_name,start_time,end_time,labels,series_ids,tier,window,with_sketches)
+        else:
+            data_points=await self._fetch_rollup_data(metric_name,start_time,end_time,series_ids,tier,window,with_sketches)
+
+        if include_open and stream_aggregator.running:
+            # Open buckets may extend past `end_time`; they are served so the
+            # most recent, still-filling bucket is visible before it is written
+            data_points=self._merge_buckets(
+                data_points,
+                stream_aggregator.open_buckets(
+                    metric_name,tier,start_time,end_time,set(series_ids) if series_ids is not None else None
+                ),
+                window
+            )
+        return data_points
+
+    async def _cached_rollup_data(
+            self,
+            metric_name:str,
+            start_time:datetime,
+            end_time:datetime,
+            labels:Dict[str,str],
+            series_ids:Optional[List[int]],
+            tier:str,
+            window:str,
+            with_sketches:bool
+    )->List[Dict]:
+        """`_fetch_rollup_data` that only fetches what `query_cache` does not hold yet."""
+        width=parse_window(window)
+        # Read before the buckets, so they are at least as new as the generation
+        state=(await self.db.execute(
+            select(RollupWatermark.watermark,RollupWatermark.generation).where(RollupWatermark.metric_name==metric_name)
+        )).first()
+        watermark,generation=state if state is not None else (None,0)
+        key=query_cache.key(metric_name,generation,hash_labels(labels),window,with_sketches)
+        entry=query_cache.get(key,start_time,end_time)
+        covered_from,covered_to,cached=entry if entry is not None else (start_time,start_time,[])
+        data_points=[dp for dp in cached if dp["timestamp"]>=start_time and dp["timestamp"]+width<=end_time]
+        if covered_to>=end_time:
+            return data_points
+
+        fetched=await self._fetch_rollup_data(metric_name,covered_to,end_time,series_ids,tier,window,with_sketches)
+        # Buckets up to the watermark are final; later ones are fetched again next time
+        if watermark is not None:
+            settled_until=min(round_to_window(watermark,window),round_to_window(end_time,window))
+            if settled_until>covered_to:
+                settled=[dp for dp in fetched if dp["timestamp"]+width<=settled_until]
+                query_cache.set(key,covered_from,settled_until,cached+settled)
+        return data_points+fetched
+
+    async def _fetch_rollup_data(
+            self,
+            metric_name:str,
+            start_time:datetime,
+            end_time:datetime,
+            series_ids:Optional[List[int]],
+            tier:str,
+            window:str,
+            with_sketches:bool
     )->List[Dict]:
-        query=self.db.query(RollupMetrics).filter(
+        # The start_time upper bound lets PostgreSQL prune daily partitions
+        conditions=[
             RollupMetrics.metric_name==metric_name,
             RollupMetrics.start_time >= start_time,
+            RollupMetrics.start_time < end_time,
             RollupMetrics.end_time <= end_time,
-            RollupMetrics.window==window
+            RollupMetrics.window==tier
+        ]
+        if series_ids is not None:
+            conditions.append(RollupMetrics.series_id.in_(series_ids))
+
+        if tier!=window and self.db.bind.dialect.name=="postgresql":
+            data_points=await self._reaggregate_rollup_data(conditions,window,with_sketches)
+        else:
+            results=await self.db.scalars(select(RollupMetrics).where(*conditions).order_by(RollupMetrics.start_time))
+            data_points=[
+                {
+                    "series_id":r.series_id,
+                    "timestamp":r.start_time,
+                    "min":r.min,
+                    "max":r.max,
+                    "avg":r.avg,
+                    "sum":r.sum,
+                    "count":r.count,
+                    "sketch":r.sketch
+                }
+                for r in results
+            ]
+            if tier!=window:
+                data_points=self._merge_buckets([],data_points,window)
+        return data_points
+
+    async def _aggregate_raw_data(
+            self,
+            metric_name:str,
+            start_time:datetime,
+            end_time:datetime,
+            labels:Dict[str,str],
+            window:str
+    )->List[Dict]:
+        """Raw points in [start_time, end_time) aggregated into `window` buckets per series."""
+        conditions=[
+            RawMetrics.metric_name==metric_name,
+            RawMetrics.timestamp >= to_utc_naive(start_time),
+            RawMetrics.timestamp < to_utc_naive(end_time)
+        ]
+        if labels:
+            series_ids=await SeriesService(self.db).find_series_ids(metric_name,labels)
+            conditions.append(RawMetrics.series_id.in_(series_ids))
+
+        if self.db.bind.dialect.name!="postgresql":
+            results=await self.db.execute(select(RawMetrics.series_id,RawMetrics.timestamp,RawMetrics.value).where(*conditions))
+            return self._merge_buckets([],[
+                {
+                    "series_id":r.series_id,
+                    "timestamp":r.timestamp,
+                    "min":r.value,
+                    "max":r.value,
+                    "avg":r.value,
+                    "sum":r.value,
+                    "count":1,
+                    "sketch":None
+                }
+                for r in results
+            ],window)
+
+        bucket=func.date_bin(parse_window(window),RawMetrics.timestamp,EPOCH).label("bucket")
+        results=await self.db.execute(
+            select(
+                RawMetrics.series_id,
+                bucket,
+                func.min(RawMetrics.value).label("min"),
+                func.max(RawMetrics.value).label("max"),
+                func.sum(RawMetrics.value).label("sum"),
+                func.count().label("count")
+            )
+            .where(*conditions)
+            .group_by(RawMetrics.series_id,literal_column("bucket"))
+            .order_by(literal_column("bucket"))
+        )
+        return [
+            {
+                "series_id":r.series_id,
+                "timestamp":r.bucket,
+                "min":r.min,
+                "max":r.max,
+                "avg":r.sum/r.count,
+                "sum":r.sum,
+                "count":r.count,
+                "sketch":None
+            }
+            for r in results
+        ]
+
+    async def _max_raw_points(
+            self,
+            metric_name:str,
+            start_time:datetime,
+            end_time:datetime,
+            labels:Dict[str,str]
+    )->int:
+        """Raw point count of the densest matching series in the range."""
+        query=select(func.count().label("points")).where(
+            RawMetrics.metric_name==metric_name,
+            RawMetrics.timestamp >= to_utc_naive(start_time),
+            RawMetrics.timestamp <= to_utc_naive(end_time)
         )
         if labels:
-            query=self._filter_by_labels(query,labels,RollupMetrics)
-        
-        results=query.order_by(RollupMetrics.start_time).all()
+            query=await self._filter_by_labels(query,metric_name,labels,RawMetrics)
+        counts=query.group_by(RawMetrics.series_id).subquery()
+        return await self.db.scalar(select(func.max(counts.c.points))) or 0
+
+    async def _choose_step(
+            self,
+            metric_name:str,
+            start_time:datetime,
+            end_time:datetime,
+            labels:Dict[str,str],
+            max_points:int
+    )->str:
+        """Raw when every series has at most `max_points` points, else the finest step that fits."""
+        desired=(end_time-start_time)/max_points
+        if desired<parse_window(RANGE_STEPS[0]):
+            if await self._max_raw_points(metric_name,start_time,end_time,labels)<=max_points:
+                return RAW
+            return RANGE_STEPS[0]
+        for step in RANGE_STEPS:
+            if parse_window(step)>=desired:
+                return step
+        day=timedelta(days=1)
+        return format_window(-(-desired//day)*day)
 
+    def _source_tier(self,window:str)->str:
+        """The coarsest stored rollup window that evenly divides `window`."""
+        width=parse_window(window)
+        tiers=[tier for tier in RollupService.windows if width%parse_window(tier)==timedelta(0)]
+        if not tiers:
+            raise ValueError(
+                f"Invalid window '{window}'. Must be a multiple of one of: {RollupService.windows}"
+            )
+        return max(tiers,key=parse_window)
+
+    async def _reaggregate_rollup_data(self,conditions:List,window:str,with_sketches:bool)->List[Dict]:
+        """Merge stored buckets into `window` buckets in the database, one row per output point."""
+        bucket=func.date_bin(parse_window(window),RollupMetrics.start_time,EPOCH).label("bucket")
+        columns=[
+            RollupMetrics.series_id,
+            bucket,
+            func.min(RollupMetrics.min).label("min"),
+            func.max(RollupMetrics.max).label("max"),
+            func.sum(RollupMetrics.sum).label("sum"),
+            func.sum(RollupMetrics.count).label("count")
+        ]
+        if with_sketches:
+            columns.append(func.sketch_merge_agg(RollupMetrics.sketch,type_=RollupMetrics.sketch.type).label("sketch"))
+
+        # Grouped by the output alias: repeating date_bin would bind its
+        # arguments again, and PostgreSQL would not match the two expressions
+        results=await self.db.execute(
+            select(*columns)
+            .where(*conditions)
+            .group_by(RollupMetrics.series_id,literal_column("bucket"))
+            .order_by(literal_column("bucket"))
+        )
         return [
             {
-                "timestamp":r.start_time,
+                "series_id":r.series_id,
+                "timestamp":r.bucket,
                 "min":r.min,
                 "max":r.max,
-                "avg":r.avg,
+                "avg":r.sum/r.count,
                 "sum":r.sum,
-                "count":r.count
+                "count":int(r.count),
+                "sketch":r.sketch if with_sketches else None
             }
             for r in results
         ]
+
+    def _merge_buckets(self,data_points:List[Dict],buckets:List[Dict],window:str)->List[Dict]:
+        """Fold `buckets` into `data_points`, moving each into its `window` bucket first."""
+        if not buckets:
+            return data_points
+        merged={(dp["series_id"],dp["timestamp"]):dp for dp in data_points}
+        for bucket in buckets:
+            key=(bucket["series_id"],round_to_window(bucket["timestamp"],window))
+            dp=merged.get(key)
+            if dp is None:
+                merged[key]=dict(bucket,timestamp=key[1])
+                continue
+            dp["min"]=min(dp["min"],bucket["min"])
+            dp["max"]=max(dp["max"],bucket["max"])
+            dp["sum"]+=bucket["sum"]
+            dp["count"]+=bucket["count"]
+            dp["avg"]=dp["sum"]/dp["count"]
+            dp["sketch"]=merge_sketches(dp["sketch"],bucket["sketch"])
+        return sorted(merged.values(),key=lambda dp:dp["timestamp"])
     
-    def _filter_by_labels(self,query,labels:Dict[str,str],model):
-        for key,value in labels.items():
-            query = query.filter(model.labels.op("->>")(key) == value)
-        return query
+    async def _filter_by_labels(self,query,metric_name:str,labels:Dict[str,str],model):
+        series_ids=await SeriesService(self.db).find_series_ids(metric_name,labels)
+        return query.where(model.series_id.in_(series_ids))
     
     async def query_raw_data(
         self,
         metric_name: str,
         start_time: datetime,
         end_time: datetime,
-        labels: Dict[str, str] = None
+        labels: Dict[str, str] = None,
+        max_points: Optional[int] = None,
+        downsample: str = "lttb"
     ) -> Dict:
         normalized_labels = normalize_labels(labels) if labels else {}
         
-        data_points = await self._query_raw_data(
-            metric_name,
-            start_time,
-            end_time,
-            normalized_labels
-        )
+        if max_points:
+            data_points = await self._downsample_raw_data(
+                metric_name,
+                start_time,
+                end_time,
+                normalized_labels,
+                max_points,
+                downsample
+            )
+        else:
+            data_points = await self._query_raw_data(
+                metric_name,
+                start_time,
+                end_time,
+                normalized_labels
+            )
         
         return {
             "metric_name": metric_name,
@@ -91,18 +398,67 @@ class QueryService:
             "total_points": len(data_points)
         }
     
+    async def query_raw_columns(
+        self,
+        metric_name: str,
+        start_time: datetime,
+        end_time: datetime,
+        labels: Dict[str, str] = None,
+        max_points: Optional[int] = None,
+        downsample: str = "lttb"
+    ) -> Dict:
+        """Raw points as parallel epoch-ms timestamp and value columns, built from the row tuples."""
+        normalized_labels = normalize_labels(labels) if labels else {}
+
+        if max_points:
+            data_points = await self._downsample_raw_data(
+                metric_name, start_time, end_time, normalized_labels, max_points, downsample
+            )
+            rows = [(dp["timestamp"], dp["value"]) for dp in data_points]
+        else:
+            query = await self._raw_points_query(metric_name, start_time, end_time, normalized_labels)
+            rows = (await self.db.execute(query)).all()
+
+        return {
+            "metric_name": metric_name,
+            "total_points": len(rows),
+            "columns": {
+                "timestamp": epoch_ms(row[0] for row in rows),
+                "value": [row[1] for row in rows]
+            }
+        }
+
+    async def stream_raw_data(
+        self,
+        metric_name: str,
+        start_time: datetime,
+        end_time: datetime,
+        labels: Dict[str, str] = None
+    ) -> AsyncIterator[bytes]:
+        """Raw points as NDJSON, one chunk of lines per RAW_CHUNK_ROWS rows.
+
+        Rows come from a server-side cursor and are written out directly, so
+        memory stays flat and the first bytes go out after the first chunk.
+        NaN and infinite values are written as null, like the JSON response.
+        """
+        normalized_labels = normalize_labels(labels) if labels else {}
+        query = await self._raw_points_query(metric_name, start_time, end_time, normalized_labels)
+        result = await self.db.stream(query.execution_options(yield_per=RAW_CHUNK_ROWS))
+        async for rows in result.partitions():
+            yield "".join(
+                f'{{"timestamp":"{timestamp.isoformat()}","value":{json.dumps(value if math.isfinite(value) else None)}}}\n'
+                for timestamp, value in rows
+            ).encode()
+
     async def query_rollup_data(
         self,
         metric_name: str,
         start_time: datetime,
         end_time: datetime,
         window: str,
-        labels: Dict[str, str] = None
+        labels: Dict[str, str] = None,
+        quantiles: List[float] = None
     ) -> Dict:
-        valid_windows = ["1m", "5m", "1h"]
-        if window not in valid_windows:
-            raise ValueError(f"Invalid window '{window}'. Must be one of: {valid_windows}")
-        
         normalized_labels = normalize_labels(labels) if labels else {}
         
         data_points = await self._query_rollup_data(
@@ -110,7 +466,8 @@ class QueryService:
             start_time,
             end_time,
             normalized_labels,
-            window
+            window,
+            with_sketches=bool(quantiles)
         )
         
         return {
@@ -123,13 +480,174 @@ class QueryService:
                     max=dp["max"],
                     avg=dp["avg"],
                     sum=dp["sum"],
-                    count=dp["count"]
+                    count=dp["count"],
+                    quantiles=self._quantiles(dp,quantiles) if quantiles else None
                 )
                 for dp in data_points
             ],
             "total_points": len(data_points)
         }
 
+    async def query_range(
+        self,
+        metric_name: str,
+        start_time: datetime,
+        end_time: datetime,
+        labels: Dict[str, str] = None,
+        max_points: int = 1000,
+        step: Optional[str] = None
+    ) -> Dict:
+        """Points over the range at a resolution picked from its length.
+
+        Without `step`, raw points are returned when no series has more than
+        `max_points` of them, else the finest of RANGE_STEPS giving at most
+        `max_points` buckets per series. The newest part of the range, after
+        the rollup watermark, is aggregated from raw_metrics; older parts are
+        read from the finest rollup tier the retention policy still keeps,
+        moving to coarser tiers (and coarser steps) further back.
+        """
+        normalized_labels = normalize_labels(labels) if labels else {}
+        start_time = to_utc_naive(start_time)
+        end_time = to_utc_naive(end_time)
+        if end_time <= start_time:
+            raise ValueError("end_time must be after start_time")
+        if step is None:
+            step = await self._choose_step(metric_name, start_time, end_time, normalized_labels, max_points)
+        elif step != RAW:
+            self._source_tier(step)
+
+        policy = RetentionPolicy.load(config.RETENTION_POLICY_FILE)
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        # Segments are collected newest first
+        segments = []
+        points = []
+        if step == RAW:
+            window = RANGE_STEPS[0]
+            boundary = max(start_time, ceil_to_window(now - policy.period(RAW, metric_name), window))
+            if boundary < end_time:
+                raw_points = await self._query_raw_data(metric_name, boundary, end_time, normalized_labels)
+                points.extend(
+                    RangeDataPoint(
+                        timestamp=dp["timestamp"],
+                        min=dp["value"],
+                        max=dp["value"],
+                        avg=dp["value"],
+                        sum=dp["value"],
+                        count=1,
+                        source=RAW
+                    )
+                    for dp in reversed(raw_points)
+                )
+                segments.append({"source": RAW, "step": None, "start_time": boundary, "end_time": end_time})
+        else:
+            window = step
+            watermark = await self.db.scalar(
+                select(RollupWatermark.watermark).where(RollupWatermark.metric_name == metric_name)
+            )
+            boundary = start_time if watermark is None else min(max(start_time, round_to_window(watermark, step)), end_time)
+            if boundary < end_time:
+                # Not rolled up yet: aggregate raw points at the same step
+                data_points = await self._aggregate_raw_data(metric_name, boundary, end_time, normalized_labels, step)
+                points.extend(self._range_points(data_points, RAW))
+                segments.append({"source": RAW, "step": step, "start_time": boundary, "end_time": end_time})
+
+        tiers = sorted(RollupService.windows, key=parse_window)
+        while boundary > start_time:
+            tier = self._source_tier(window)
+            coarser = [t for t in tiers if parse_window(t) > parse_window(tier)]
+            next_window = None
+            alignment = window
+            if coarser:
+                # Keep the step, rounded up to a multiple of the next tier
+                width = parse_window(coarser[0])
+                next_window = format_window(-(-parse_window(window) // width) * width)
+                # Start on a bucket of both steps, so none straddles the boundary
+                alignment = format_window(timedelta(seconds=math.lcm(
+                    int(parse_window(window).total_seconds()), int(parse_window(next_window).total_seconds())
+                )))
+            segment_start = max(start_time, ceil_to_window(now - policy.period(tier, metric_name), alignment))
+            if segment_start < boundary:
+                data_points = await self._query_rollup_data(
+                    metric_name,
+                    segment_start,
+                    boundary,
+                    normalized_labels,
+                    window,
+                    with_sketches=False,
+                    include_open=False
+                )
+                points.extend(self._range_points(data_points, tier))
+                segments.append({"source": tier, "step": window, "start_time": segment_start, "end_time": boundary})
+                boundary = segment_start
+
+            if next_window is None:
+                break
+            window = next_window
+
+        points.reverse()
+        segments.reverse()
+        return {
+            "metric_name": metric_name,
+            "step": step,
+            "points": points,
+            "segments": segments,
+            "total_points": len(points)
+        }
+
+    async def query_rollup_columns(
+        self,
+        metric_name: str,
+        start_time: datetime,
+        end_time: datetime,
+        window: str,
+        labels: Dict[str, str] = None,
+        quantiles: List[float] = None
+    ) -> Dict:
+        """Rollup buckets as parallel columns; each quantile q adds a column named q<q>."""
+        normalized_labels = normalize_labels(labels) if labels else {}
+
+        data_points = await self._query_rollup_data(
+            metric_name,
+            start_time,
+            end_time,
+            normalized_labels,
+            window,
+            with_sketches=bool(quantiles)
+        )
+
+        columns = {
+            "timestamp": epoch_ms(dp["timestamp"] for dp in data_points),
+            **{name: [dp[name] for dp in data_points] for name in ("min", "max", "avg", "sum", "count")}
+        }
+        if quantiles:
+            estimates = [sketch_quantiles(dp["sketch"], quantiles, dp["min"], dp["max"]) for dp in data_points]
+            for q in quantiles:
+                columns[f"q{q:g}"] = [estimate[q] for estimate in estimates]
+        return {
+            "metric_name": metric_name,
+            "window": window,
+            "total_points": len(data_points),
+            "columns": columns
+        }
+
+    def _range_points(self,data_points:List[Dict],source:str)->List[RangeDataPoint]:
+        return [
+            RangeDataPoint(
+                timestamp=dp["timestamp"],
+                min=dp["min"],
+                max=dp["max"],
+                avg=dp["avg"],
+                sum=dp["sum"],
+                count=dp["count"],
+                source=source
+            )
+            for dp in reversed(data_points)
+        ]
+
+    def _quantiles(self,dp:Dict,quantiles:List[float])->Dict[str,float]:
+        estimates=sketch_quantiles(dp["sketch"],quantiles,dp["min"],dp["max"])
+        return {f"{q:g}":estimate for q,estimate in estimates.items()}
+
     def fill_gaps(
         self,
         data_points: List[DataPointSchema],
@@ -1,50 +1,137 @@
-from datetime import datetime,timedelta
-from typing import Dict
+from datetime import datetime,timezone
+from typing import Dict,List
+from sqlalchemy import delete,select
 from sqlalchemy.orm import Session
 from app.models.raw_metrics import RawMetrics
 from app.models.rollup_metrics import RollupMetrics
+from app.services.partition_service import PartitionService,RAW_TABLE,rollup_parent
+from app.utils.retention_policy import RetentionPolicy,RETENTION_TIERS
+from app.services.rollup_watermark_service import RollupWatermarkService
+from app.services.series_service import clear_series_cache
+from app.utils.query_cache import query_cache
+from app.utils.series_index import series_index
+from app.utils.time_utils import to_utc_naive
+from app import config
+import asyncio
+import logging
+import time
+
+logger=logging.getLogger(__name__)
 
 
 class RetentionService:
-    def __init__(self,db:Session):
-        self.db=db
+    """Applies per-tier (and per-metric) retention.
 
-    async def apply_retention_policies(self)->Dict[str,int]:
-        results={}
+    Expired rows are deleted in batches of `RETENTION_BATCH_SIZE`, each in its
+    own transaction with a `RETENTION_BATCH_PAUSE_MS` pause in between, so a
+    run never holds long locks. On partitioned tables whole days past the
+    longest retention of the tier are dropped first, and the default period
+    is rounded down to a day boundary so it never needs row deletes in the
+    daily partitions.
+    """
 
-        raw_cutoff=datetime.now()-timedelta(days=3)
-        results["raw"]=await self.delete_old_raw_metrics(raw_cutoff)
+    def __init__(self,db:Session,policy:RetentionPolicy=None):
+        self.db=db
+        self.policy=policy or RetentionPolicy.load(config.RETENTION_POLICY_FILE)
+        self.batch_size=config.RETENTION_BATCH_SIZE
+        self.batch_pause=config.RETENTION_BATCH_PAUSE_MS/1000
+        self.partitions=PartitionService(db)
 
-        rollup_1m_cutoff=datetime.now()-timedelta(days=7)
-        results["1m"]=await self.delete_old_rollup_metrics("1m",rollup_1m_cutoff)
+    async def apply_retention_policies(self)->Dict[str,Dict[str,float]]:
+        results={}
+        now=datetime.now(timezone.utc)
 
-        rollup_5m_cutoff=datetime.now()-timedelta(days=30)
-        results["5m"]=await self.delete_old_rollup_metrics("5m",rollup_5m_cutoff)
+        if self._partitioned(RAW_TABLE):
+            created=self.partitions.ensure_partitions(config.PARTITION_PREMAKE_DAYS)
+            if created:
+                logger.info(f"Created {created} upcoming partitions")
 
-        rollup_1h_cutoff=datetime.now()-timedelta(days=90)
-        results["1h"]=await self.delete_old_rollup_metrics("1h",rollup_1h_cutoff)
+        for tier in RETENTION_TIERS:
+            started=time.monotonic()
+            if tier=="raw":
+                stats=await self.delete_old_raw_metrics(now)
+            else:
+                stats=await self.delete_old_rollup_metrics(tier,now)
+            stats["elapsed_seconds"]=round(time.monotonic()-started,3)
+            results[tier]=stats
 
         return results
     
-    async def delete_old_raw_metrics(self,cutoff:datetime)->int:
+    async def delete_old_raw_metrics(self,now:datetime)->Dict[str,float]:
         try:
-            deleted_count=self.db.query(RawMetrics).filter(RawMetrics.timestamp < cutoff).delete(synchronize_session=False)
-            self.db.commit()
-            return deleted_count
+            stats=await self._apply_tier("raw",RawMetrics,RawMetrics.timestamp,RAW_TABLE,[],now)
+            if stats["rows_deleted"]:
+                series_index.invalidate()
+                clear_series_cache()
+            return stats
         
         except Exception as e:
             self.db.rollback()
             raise Exception(f"Error deleting old raw metrics: {e}")
     
-    async def delete_old_rollup_metrics(self,window:str,cutoff:datetime)->int:
+    async def delete_old_rollup_metrics(self,window:str,now:datetime)->Dict[str,float]:
         try:
-            deleted_count=self.db.query(RollupMetrics).filter(
-                RollupMetrics.window==window,
-                RollupMetrics.start_time < cutoff
-            ).delete(synchronize_session=False)
-            self.db.commit()
-            return deleted_count
+            stats=await self._apply_tier(
+                window,RollupMetrics,RollupMetrics.start_time,rollup_parent(window),[RollupMetrics.window==window],now
+            )
+            if stats["rows_deleted"] or stats["partitions_dropped"]:
+                RollupWatermarkService(self.db).bump_generation()
+                self.db.commit()
+                query_cache.invalidate()
+            return stats
         
         except Exception as e:
             self.db.rollback()
-            raise Exception(f"Error deleting old rollup metrics for window {window}: {e}")
\ No newline at end of file
+            raise Exception(f"Error deleting old rollup metrics for window {window}: {e}")
+
+    async def _apply_tier(self,tier:str,model,time_column,parent:str,scope:List,now:datetime)->Dict[str,float]:
+        stats={"rows_deleted":0,"batches":0,"partitions_dropped":0}
+        overrides=self.policy.overrides(tier)
+        partitioned=self._partitioned(parent)
+
+        if partitioned:
+            # Only days past the longest retention of any metric can go as a whole
+            dropped,rows=self.partitions.drop_partitions_before(parent,to_utc_naive(now-self.policy.longest(tier)))
+            stats["partitions_dropped"]+=dropped
+            stats["rows_deleted"]+=rows
+
+        cutoff=to_utc_naive(now-self.policy.period(tier))
+        if partitioned:
+            # Whole days only: the default policy's rows go with their partition,
+            # and row deletes are left to overrides and the _default/_legacy partitions
+            cutoff=datetime.combine(cutoff.date(),datetime.min.time())
+        conditions=scope+[time_column<cutoff]
+        if overrides:
+            conditions.append(model.metric_name.notin_(list(overrides)))
+        self._add(stats,await self._delete_in_batches(model,conditions))
+
+        for metric_name,period in overrides.items():
+            self._add(stats,await self._delete_in_batches(
+                model,scope+[model.metric_name==metric_name,time_column<to_utc_naive(now-period)]
+            ))
+
+        if partitioned:
+            self.partitions.drop_empty_legacy(parent)
+        return stats
+
+    async def _delete_in_batches(self,model,conditions:List)->Dict[str,int]:
+        rows=0
+        batches=0
+        while True:
+            batch_ids=select(model.id).where(*conditions).limit(self.batch_size).scalar_subquery()
+            result=self.db.execute(
+                delete(model).where(model.id.in_(batch_ids),*conditions).execution_options(synchronize_session=False)
+            )
+            self.db.commit()
+            rows+=result.rowcount
+            batches+=1
+            if result.rowcount<self.batch_size:
+                return {"rows_deleted":rows,"batches":batches}
+            await asyncio.sleep(self.batch_pause)
+
+    def _add(self,stats:Dict[str,float],batch_stats:Dict[str,int])->None:
+        for key,value in batch_stats.items():
+            stats[key]+=value
+
+    def _partitioned(self,table:str)->bool:
+        return config.PARTITIONING_ENABLED and self.partitions.supported() and self.partitions.is_partitioned(table)
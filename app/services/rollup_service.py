@@ -1,11 +1,103 @@
-from datetime import datetime
-from typing import List
+from datetime import datetime,timedelta,timezone
+from typing import List,Optional
 from app.models.raw_metrics import RawMetrics
 from app.models.rollup_metrics import RollupMetrics
+from app.models.rollup_dirty_buckets import RollupDirtyBucket
+from app.models.rollup_watermarks import RollupWatermark
+from sqlalchemy import case,func,select,text
+from sqlalchemy.dialects import postgresql,sqlite
 from sqlalchemy.orm import Session
-from typing import Dict
-from app.utils.label_utils import hash_labels
-from app.utils.time_utils import generate_time_buckets,round_to_window,parse_window
+from typing import Dict,Iterable,Set,Tuple
+from app.utils.time_utils import round_to_window,parse_window,to_utc_naive
+from app.services.rollup_watermark_service import RollupWatermarkService
+from app.utils.numpy_rollup import aggregate_windows,numpy_available
+from app.utils.query_cache import query_cache
+from app.utils.sketch import SKETCH_KEY_SQL,add_to_sketch,merge_into,sketch_key,sketch_merge_json
+from app import config
+import logging
+
+logger=logging.getLogger(__name__)
+
+# One window per statement: bucket with date_bin, aggregate and upsert without
+# sending rows to Python. Each returns (raw points covered, rollup rows written).
+def rollup_sql(source:str,on_conflict:str):
+    return text(f"""
+        WITH buckets AS ({source}),
+        upserted AS (
+            INSERT INTO rollup_metrics (metric_name,series_id,"window",start_time,end_time,min,max,sum,avg,count,sketch,created_at)
+            SELECT metric_name,series_id,:window,bucket,bucket+:width,min,max,sum,sum/count,count,sketch,now()
+            FROM buckets
+            ON CONFLICT (series_id,"window",start_time) DO UPDATE SET {on_conflict}
+            RETURNING 1
+        )
+        SELECT (SELECT coalesce(sum(count),0) FROM buckets),(SELECT count(*) FROM upserted)
+    """)
+
+# New raw points in (since, until] are folded into existing finest buckets.
+# Points are first counted per sketch key, so the sketch is built in SQL too.
+RAW_ROLLUP_SQL=rollup_sql(f"""
+    SELECT metric_name,series_id,bucket,min(min) AS min,max(max) AS max,sum(sum) AS sum,sum(count) AS count,
+           jsonb_object_agg(sketch_key,count) AS sketch
+    FROM (
+        SELECT metric_name,series_id,date_bin(:width,timestamp,TIMESTAMP '1970-01-01') AS bucket,
+               {SKETCH_KEY_SQL} AS sketch_key,
+               min(value) AS min,max(value) AS max,sum(value) AS sum,count(*) AS count
+        FROM raw_metrics
+        WHERE metric_name=:metric_name AND timestamp>:since AND timestamp<=:until
+        GROUP BY metric_name,series_id,bucket,sketch_key
+    ) keyed
+    GROUP BY metric_name,series_id,bucket
+""","""
+    min=least(rollup_metrics.min,EXCLUDED.min),
+    max=greatest(rollup_metrics.max,EXCLUDED.max),
+    sum=rollup_metrics.sum+EXCLUDED.sum,
+    count=rollup_metrics.count+EXCLUDED.count,
+    avg=(rollup_metrics.sum+EXCLUDED.sum)/(rollup_metrics.count+EXCLUDED.count),
+    sketch=sketch_merge(rollup_metrics.sketch,EXCLUDED.sketch)
+""")
+
+# Coarser buckets touched by the run are rebuilt from all of their children
+CASCADE_ROLLUP_SQL=rollup_sql("""
+    SELECT metric_name,series_id,date_bin(:width,start_time,TIMESTAMP '1970-01-01') AS bucket,
+           min(min) AS min,max(max) AS max,sum(sum) AS sum,sum(count) AS count,
+           sketch_merge_agg(sketch) AS sketch
+    FROM rollup_metrics
+    WHERE metric_name=:metric_name AND "window"=:source AND start_time>=:since AND start_time<=:until
+    GROUP BY metric_name,series_id,bucket
+""","""
+    end_time=EXCLUDED.end_time,
+    min=EXCLUDED.min,
+    max=EXCLUDED.max,
+    sum=EXCLUDED.sum,
+    avg=EXCLUDED.avg,
+    count=EXCLUDED.count,
+    sketch=EXCLUDED.sketch
+""")
+
+
+def rollup_plan(windows:List[str])->List[Tuple[str,Optional[str]]]:
+    """Order windows finest first and pair each with the window it is merged from.
+
+    A window is built from the coarsest finer window that divides it evenly,
+    or from raw data (`None`) when there is none.
+    """
+    ordered=sorted(windows,key=parse_window)
+    plan=[]
+    for index,window in enumerate(ordered):
+        width=parse_window(window)
+        source=next((finer for finer in reversed(ordered[:index]) if width%parse_window(finer)==timedelta(0)),None)
+        plan.append((window,source))
+    return plan
+
+
+def bucket_closed(bucket_start:datetime,window:str,observed_at:datetime)->bool:
+    """Whether no on-time point can still land in the bucket at `observed_at`.
+
+    With STREAM_AGGREGATION_ENABLED a bucket stops accepting points in memory
+    ROLLUP_LATENESS_SECONDS after it ends; points for it are then queued as
+    dirty buckets instead.
+    """
+    return bucket_start+parse_window(window)+timedelta(seconds=config.ROLLUP_LATENESS_SECONDS)<=observed_at
 
 
 class RollupService:
@@ -14,73 +106,534 @@ class RollupService:
     def __init__(self,db:Session):
         self.db=db
 
-    async def perform_rollups(self,since:datetime)->Dict[str,int]:
+    async def run(self,initial_watermark:datetime)->Dict:
+        """Roll up every metric this worker can claim, one transaction per metric.
+
+        Metrics without a watermark start at `initial_watermark`. Each claimed
+        metric gets its new raw points and its queued late points merged
+        and its watermark advanced in a single commit, so several workers can
+        run side by side and a crash never counts a point twice.
+
+        With STREAM_AGGREGATION_ENABLED new points are rolled up by the API
+        processes instead, and watermarks never pass the slowest live
+        aggregator's flush watermark. While an aggregator has stopped
+        reporting, the buckets it may have held are rebuilt from raw rows (see
+        `rebuild_rollups`) until every metric is past anything it could hold.
+        """
+        watermarks=RollupWatermarkService(self.db)
+        discovered=watermarks.discover(initial_watermark)
+        now=datetime.now(timezone.utc)
+        until=to_utc_naive(now-timedelta(seconds=config.ROLLUP_LATENESS_SECONDS))
+        dead=[]
+        if config.STREAM_AGGREGATION_ENABLED:
+            slowest,dead=watermarks.flush_state(now-timedelta(seconds=config.STREAM_AGGREGATION_STALE_SECONDS))
+            if slowest is not None:
+                until=min(until,slowest)
         stats={
+            "metrics_discovered":discovered,
+            "metrics_processed":0,
+            "metrics_failed":0,
             "raw_metrics_processed":0,
             "rollup_metrics_created":0,
-            "windows_processed":self.windows
+            "dirty_buckets_merged":0,
+            "windows_processed":self.windows,
+            "watermark":until
         }
-        raw_metrics=self.db.query(RawMetrics).filter(RawMetrics.timestamp>=since).order_by(RawMetrics.timestamp).all()
 
-        stats["raw_metrics_processed"]=len(raw_metrics)
+        failed=set()
+        while True:
+            claimed=watermarks.claim(until,exclude=failed)
+            if claimed is None:
+                if dead:
+                    # Anything a dead aggregator held ends within its largest window after it was last seen
+                    held_for=timedelta(seconds=config.STREAM_AGGREGATION_STALE_SECONDS+config.ROLLUP_LATENESS_SECONDS)
+                    watermarks.retire_flushes(dead,held_for+max(parse_window(window) for window in self.windows))
+                return stats
+            metric_name,watermark=claimed
 
-        if not raw_metrics:
-            return stats
-        
-        min_timestamp=min(rm.timestamp for rm in raw_metrics)
-        max_timestamp=max(rm.timestamp for rm in raw_metrics)
+            try:
+                dirty=await self.process_dirty_buckets(metric_name)
+                if not config.STREAM_AGGREGATION_ENABLED:
+                    metric_stats=await self.perform_rollups(metric_name,watermark,until)
+                elif dead:
+                    metric_stats=await self.rebuild_rollups(metric_name,watermark,until)
+                else:
+                    # New points are rolled up at ingest by the stream aggregator
+                    metric_stats={"raw_metrics_processed":0,"rollup_metrics_created":0}
+                watermarks.advance(metric_name,until)
+                self.db.commit()
+            except Exception as e:
+                self.db.rollback()
+                failed.add(metric_name)
+                stats["metrics_failed"]+=1
+                logger.error(f"Rollup of metric '{metric_name}' failed: {e}")
+                continue
 
-        for window in self.windows:
-            rollups=await self.compute_window_aggregation(raw_metrics,window,min_timestamp,max_timestamp)
+            stats["metrics_processed"]+=1
+            stats["raw_metrics_processed"]+=metric_stats["raw_metrics_processed"]
+            stats["rollup_metrics_created"]+=metric_stats["rollup_metrics_created"]
+            stats["dirty_buckets_merged"]+=dirty
 
-            if rollups:
-                self.db.bulk_save_objects(rollups)
-                self.db.commit()
-                stats["rollup_metrics_created"]+=len(rollups)
+    async def perform_rollups(self,metric_name:str,since:datetime,until:datetime)->Dict:
+        """Fold raw points of `metric_name` with `since < timestamp <= until` into the rollups.
+
+        Runs in the caller's transaction. `until` should lag real time by
+        ROLLUP_LATENESS_SECONDS: anything written later with an older
+        timestamp is queued by `record_late_points` instead, so using `until`
+        as the next `since` counts every raw point exactly once. The finest windows
+        merge the new points into their existing buckets (sum+sum,
+        count+count, least/greatest); each coarser window rebuilds the buckets
+        the run touched from the window below (see `rollup_plan`). On
+        PostgreSQL each window is one INSERT ... SELECT ... GROUP BY
+        (ROLLUP_ENGINE=sql); elsewhere the Python scan is used.
+        """
+        since=to_utc_naive(since)
+        until=to_utc_naive(until)
+
+        if until<=since:
+            return {
+                "raw_metrics_processed":0,
+                "rollup_metrics_created":0,
+                "windows_processed":self.windows
+            }
+
+        engine=self.engine()
+        if engine=="sql":
+            return await self._perform_sql_rollups(metric_name,since,until)
+        if engine=="numpy":
+            return await self._perform_numpy_rollups(metric_name,since,until)
+        return await self._perform_python_rollups(metric_name,since,until)
+
+    async def rebuild_rollups(self,metric_name:str,since:datetime,until:datetime)->Dict:
+        """Replace the buckets of `metric_name` ending in (since, until] with what raw_metrics holds.
 
+        The stream aggregation fallback for an aggregator that stopped
+        reporting, whose share of these buckets is lost with its memory. Runs
+        in the caller's transaction after the queued late points are merged.
+        Every live aggregator has merged its share already (`until` is their
+        slowest flush watermark) and writers of late points wait for the
+        caller's claim (see `_scanned_until`), so the raw rows hold exactly
+        what the buckets should count.
+        """
+        since=to_utc_naive(since)
+        until=to_utc_naive(until)
+        stats={
+            "raw_metrics_processed":0,
+            "rollup_metrics_created":0,
+            "windows_processed":self.windows
+        }
+        for window in self.windows:
+            start=round_to_window(since,window)
+            end=round_to_window(until,window)
+            if end<=start:
+                continue
+            rows=self.db.execute(
+                select(RawMetrics.metric_name,RawMetrics.series_id,RawMetrics.timestamp,RawMetrics.value)
+                .where(RawMetrics.metric_name==metric_name,RawMetrics.timestamp>=start,RawMetrics.timestamp<end)
+                .order_by(RawMetrics.timestamp)
+                .execution_options(yield_per=config.ROLLUP_STREAM_BATCH_SIZE)
+            )
+            covered,created=self._merge_stream(
+                window,
+                ((name,series_id,timestamp,value,value,value,1,{sketch_key(value):1}) for name,series_id,timestamp,value in rows),
+                merge=False
+            )
+            if window==self.windows[0]:
+                stats["raw_metrics_processed"]+=covered
+            stats["rollup_metrics_created"]+=created
+        if stats["rollup_metrics_created"]:
+            RollupWatermarkService(self.db).bump_generation(metric_name)
+            query_cache.invalidate(metric_name)
         return stats
-    
-    async def compute_window_aggregation(
-            self,
-            raw_metrics:List[RawMetrics],
-            window:str,
-            min_timestamp:datetime,
-            max_timestamp:datetime
-    )->List[RollupMetrics]:
-        grouped_metrics={}
-        window_delta=parse_window(window)
-
-        for metric in raw_metrics:
-            bucket_start=round_to_window(metric.timestamp,window)
-            labels_hash=hash_labels(metric.labels)
-            key=(metric.metric_name,bucket_start,labels_hash)
-            if key not in grouped_metrics:
-                grouped_metrics[key]={
-                    "metrics": [],
-                    "labels": metric.labels
+
+    def engine(self)->str:
+        if config.ROLLUP_ENGINE=="auto":
+            return "sql" if self.db.bind.dialect.name=="postgresql" else "python"
+        if config.ROLLUP_ENGINE not in ("sql","python","numpy"):
+            raise ValueError(f"Invalid ROLLUP_ENGINE '{config.ROLLUP_ENGINE}'. Must be one of: auto, sql, python, numpy")
+        if config.ROLLUP_ENGINE=="numpy" and not numpy_available():
+            raise ValueError("ROLLUP_ENGINE=numpy requires numpy to be installed")
+        return config.ROLLUP_ENGINE
+
+    async def _perform_sql_rollups(self,metric_name:str,since:datetime,until:datetime)->Dict[str,int]:
+        stats={
+            "raw_metrics_processed":0,
+            "rollup_metrics_created":0,
+            "windows_processed":self.windows
+        }
+        for window,source in rollup_plan(self.windows):
+            raw_count,rollup_count=self.db.execute(
+                RAW_ROLLUP_SQL if source is None else CASCADE_ROLLUP_SQL,
+                {
+                    "metric_name":metric_name,
+                    "window":window,
+                    "source":source,
+                    "width":parse_window(window),
+                    "since":since if source is None else round_to_window(since,window),
+                    "until":until
                 }
-            grouped_metrics[key]["metrics"].append(metric)
-
-        rollups=[]
-
-        for (metric_name,bucket_start,labels_hash),group_data in grouped_metrics.items():
-            group_metrics = group_data["metrics"]
-            labels = group_data["labels"]
-            values=[m.value for m in group_metrics]
-
-            rollup=RollupMetrics(
-                metric_name=metric_name,
-                window=window,
-                start_time=bucket_start,
-                end_time=bucket_start+window_delta,
-                min=min(values),
-                max=max(values),
-                sum=sum(values),
-                avg=sum(values)/len(values),
-                count=len(values),
-                labels=labels
+            ).one()
+            if source is None:
+                stats["raw_metrics_processed"]+=raw_count
+            stats["rollup_metrics_created"]+=rollup_count
+        return stats
+
+    async def _perform_python_rollups(self,metric_name:str,since:datetime,until:datetime)->Dict[str,int]:
+        """Roll up raw points in (since, until], one streaming pass per window.
+
+        Only the finest windows read raw data; coarser windows rebuild their
+        touched buckets from the window below. Rows are read as column
+        tuples through a server-side cursor in time order and each pass keeps
+        running min/max/sum/count only for its open buckets, so memory grows
+        with the number of open buckets, not rows.
+        """
+        stats={
+            "raw_metrics_processed":0,
+            "rollup_metrics_created":0,
+            "windows_processed":self.windows
+        }
+        for window,source in rollup_plan(self.windows):
+            if source is None:
+                rows=self.db.execute(
+                    select(RawMetrics.metric_name,RawMetrics.series_id,RawMetrics.timestamp,RawMetrics.value)
+                    .where(RawMetrics.metric_name==metric_name,RawMetrics.timestamp>since,RawMetrics.timestamp<=until)
+                    .order_by(RawMetrics.timestamp)
+                    .execution_options(yield_per=config.ROLLUP_STREAM_BATCH_SIZE)
+                )
+                partials=(
+                    (name,series_id,timestamp,value,value,value,1,{sketch_key(value):1})
+                    for name,series_id,timestamp,value in rows
+                )
+            else:
+                partials=self.db.execute(
+                    select(
+                        RollupMetrics.metric_name,RollupMetrics.series_id,RollupMetrics.start_time,
+                        RollupMetrics.min,RollupMetrics.max,RollupMetrics.sum,RollupMetrics.count,
+                        RollupMetrics.sketch
+                    )
+                    .where(
+                        RollupMetrics.metric_name==metric_name,
+                        RollupMetrics.window==source,
+                        RollupMetrics.start_time>=round_to_window(since,window),
+                        RollupMetrics.start_time<=until
+                    )
+                    .order_by(RollupMetrics.start_time)
+                    .execution_options(yield_per=config.ROLLUP_STREAM_BATCH_SIZE)
+                )
+
+            covered,created=self._merge_stream(window,partials,merge=source is None)
+            if source is None:
+                stats["raw_metrics_processed"]+=covered
+            stats["rollup_metrics_created"]+=created
+        return stats
+
+    async def _perform_numpy_rollups(self,metric_name:str,since:datetime,until:datetime)->Dict[str,int]:
+        """Roll up raw points in (since, until] with NumPy, every window from one sort.
+
+        Raw rows are fetched in chunks of ROLLUP_NUMPY_CHUNK_ROWS; each chunk is
+        aggregated for all windows at once and merged into the existing
+        buckets, which is exact because every point lands in exactly one chunk.
+        """
+        stats={
+            "raw_metrics_processed":0,
+            "rollup_metrics_created":0,
+            "windows_processed":self.windows
+        }
+        window_seconds={window:int(parse_window(window).total_seconds()) for window in self.windows}
+        rows=self.db.execute(
+            select(RawMetrics.series_id,RawMetrics.timestamp,RawMetrics.value)
+            .where(RawMetrics.metric_name==metric_name,RawMetrics.timestamp>since,RawMetrics.timestamp<=until)
+            .execution_options(yield_per=config.ROLLUP_NUMPY_CHUNK_ROWS)
+        )
+
+        for chunk in rows.partitions():
+            series_ids,timestamps,values=zip(*chunk)
+            stats["raw_metrics_processed"]+=len(values)
+            for window,groups in aggregate_windows(series_ids,timestamps,values,window_seconds).items():
+                width=parse_window(window)
+                rollups=[
+                    {
+                        "metric_name":metric_name,
+                        "series_id":series_id,
+                        "window":window,
+                        "start_time":bucket_start,
+                        "end_time":bucket_start+width,
+                        "min":min_value,
+                        "max":max_value,
+                        "sum":sum_value,
+                        "avg":sum_value/count,
+                        "count":count,
+                        "sketch":sketch
+                    }
+                    for series_id,bucket_start,min_value,max_value,sum_value,count,sketch
+                    in zip(*(column.tolist() for column in groups[:6]),groups[6])
+                ]
+                stats["rollup_metrics_created"]+=self.merge_rollups(rollups)
+        return stats
+
+    def _merge_stream(self,window:str,partials:Iterable[Tuple],merge:bool)->Tuple[int,int]:
+        """Merge time-ordered (metric_name, series_id, time, min, max, sum, count, sketch) into `window` buckets.
+
+        With `merge` the buckets are folded into existing rollup rows,
+        otherwise they replace them. Returns the number of raw points covered
+        and rollup rows written.
+        """
+        open_buckets={}
+        completed=[]
+        covered=0
+        created=0
+
+        for metric_name,series_id,timestamp,min_value,max_value,sum_value,count,sketch in partials:
+            covered+=count
+            bucket_start=round_to_window(timestamp,window)
+            if bucket_start not in open_buckets:
+                # Input arrives in time order, so every older bucket is complete
+                for start in [start for start in open_buckets if start<bucket_start]:
+                    completed.extend(self._build_rollups(window,start,open_buckets.pop(start)))
+                open_buckets[bucket_start]={}
+
+            aggregate=open_buckets[bucket_start].get((metric_name,series_id))
+            if aggregate is None:
+                open_buckets[bucket_start][(metric_name,series_id)]=[min_value,max_value,sum_value,count,sketch]
+            else:
+                if min_value<aggregate[0]:
+                    aggregate[0]=min_value
+                if max_value>aggregate[1]:
+                    aggregate[1]=max_value
+                aggregate[2]+=sum_value
+                aggregate[3]+=count
+                aggregate[4]=merge_into(aggregate[4],sketch)
+
+            if len(completed)>=config.ROLLUP_STREAM_BATCH_SIZE:
+                created+=self._write_rollups(completed,merge)
+                completed=[]
+
+        for start,series in open_buckets.items():
+            completed.extend(self._build_rollups(window,start,series))
+        created+=self._write_rollups(completed,merge)
+        return covered,created
+
+    def _build_rollups(self,window:str,bucket_start:datetime,series:Dict[Tuple[str,int],List])->List[Dict]:
+        bucket_end=bucket_start+parse_window(window)
+        return [
+            {
+                "metric_name":metric_name,
+                "series_id":series_id,
+                "window":window,
+                "start_time":bucket_start,
+                "end_time":bucket_end,
+                "min":min_value,
+                "max":max_value,
+                "sum":sum_value,
+                "avg":sum_value/count,
+                "count":count,
+                "sketch":sketch
+            }
+            for (metric_name,series_id),(min_value,max_value,sum_value,count,sketch) in series.items()
+        ]
+
+    def merge_rollups(self,rollups:List[Dict])->int:
+        """Fold partial buckets into rollup_metrics in the caller's transaction."""
+        written=0
+        for start in range(0,len(rollups),config.ROLLUP_STREAM_BATCH_SIZE):
+            written+=self._write_rollups(rollups[start:start+config.ROLLUP_STREAM_BATCH_SIZE],merge=True)
+        return written
+
+    def _write_rollups(self,rollups:List[Dict],merge:bool)->int:
+        # Written inside the scan's transaction; committing would close the server-side cursor
+        if not rollups:
+            return 0
+        dialect=self.db.bind.dialect.name
+        insert=postgresql.insert if dialect=="postgresql" else sqlite.insert
+        connection=self.db.connection()
+        if merge and dialect=="sqlite" and not connection.info.get("sketch_merge"):
+            # PostgreSQL gets sketch_merge from fix_schema; SQLite borrows the Python one.
+            # Once per connection: SQLite refuses to redefine it while the scan's cursor is open
+            connection.connection.driver_connection.create_function(
+                "sketch_merge",2,sketch_merge_json,deterministic=True
+            )
+            connection.info["sketch_merge"]=True
+        statement=insert(RollupMetrics)
+        existing=RollupMetrics.__table__.c
+        new=statement.excluded
+        if merge:
+            set_={
+                "min":case((new.min<existing.min,new.min),else_=existing.min),
+                "max":case((new.max>existing.max,new.max),else_=existing.max),
+                "sum":existing.sum+new.sum,
+                "count":existing.count+new.count,
+                "avg":(existing.sum+new.sum)/(existing.count+new.count),
+                "sketch":func.sketch_merge(existing.sketch,new.sketch,type_=RollupMetrics.sketch.type)
+            }
+        else:
+            set_={column:new[column] for column in ("end_time","min","max","sum","avg","count","sketch")}
+        self.db.execute(
+            statement.on_conflict_do_update(index_elements=["series_id","window","start_time"],set_=set_),
+            rollups
+        )
+        return len(rollups)
+
+    async def record_late_points(self,points:Iterable[Tuple[str,int,datetime,float]],observed_at:Optional[datetime]=None)->int:
+        """Queue the partial aggregates of points no rollup pass will see otherwise.
+
+        `points` are (metric_name, series_id, timestamp, value) and the session
+        is the writer's AsyncSession, so the queue commits with the raw data.
+        Without STREAM_AGGREGATION_ENABLED a point older than
+        ROLLUP_LATENESS_SECONDS is queued for every window when the forward
+        scan of its metric has already passed it (see `_scanned_until`); later
+        points are left to the scan. With STREAM_AGGREGATION_ENABLED a point
+        is queued for the windows whose bucket is already closed at
+        `observed_at` (see `bucket_closed`), the rest belong to the stream
+        aggregator; the watermark is still locked, so a rebuild of the metric
+        from raw rows (see `rebuild_rollups`) never sees a point without its
+        queued aggregate. Points are combined into one min/max/sum/count/sketch
+        row per bucket.
+        """
+        observed_at=to_utc_naive(observed_at or datetime.now(timezone.utc))
+        cutoff=observed_at-timedelta(seconds=config.ROLLUP_LATENESS_SECONDS)
+        late=[]
+        for metric_name,series_id,timestamp,value in points:
+            timestamp=to_utc_naive(timestamp)
+            if config.STREAM_AGGREGATION_ENABLED:
+                windows=[window for window in self.windows if bucket_closed(round_to_window(timestamp,window),window,observed_at)]
+            else:
+                windows=self.windows if timestamp<cutoff else []
+            if windows:
+                late.append((metric_name,series_id,timestamp,float(value),windows))
+        if not late:
+            return 0
+
+        # The raw rows may still be pending in the session; the earliest one seeds a new metric's watermark
+        await self.db.flush()
+        scanned=await self._scanned_until({metric_name for metric_name,*_ in late})
+        if not config.STREAM_AGGREGATION_ENABLED:
+            # A metric without raw rows has no watermark, and no scan will see its point
+            late=[point for point in late if point[0] not in scanned or point[2]<=scanned[point[0]]]
+
+        buckets={}
+        for metric_name,series_id,timestamp,value,windows in late:
+            for window in windows:
+                key=(metric_name,series_id,window,round_to_window(timestamp,window))
+                aggregate=buckets.get(key)
+                if aggregate is None:
+                    buckets[key]=[value,value,value,1,{sketch_key(value):1}]
+                    continue
+                if value<aggregate[0]:
+                    aggregate[0]=value
+                if value>aggregate[1]:
+                    aggregate[1]=value
+                aggregate[2]+=value
+                aggregate[3]+=1
+                add_to_sketch(aggregate[4],value)
+
+        self.db.add_all([
+            RollupDirtyBucket(
+                metric_name=metric_name,series_id=series_id,window=window,bucket_start=bucket_start,
+                min=min_value,max=max_value,sum=sum_value,count=count,sketch=sketch
             )
-            rollups.append(rollup)
+            for (metric_name,series_id,window,bucket_start),(min_value,max_value,sum_value,count,sketch) in buckets.items()
+        ])
+        return len(buckets)
+
+    async def _scanned_until(self,metric_names:Set[str])->Dict[str,datetime]:
+        """Each metric's rollup watermark, locked FOR SHARE until the writer commits.
+
+        A rollup job holding the metric's row commits first, and the next one
+        cannot claim it before the writer commits, so a point at or before
+        the returned watermark is in no scan and a later point is in the next
+        one. A metric the job has not discovered yet starts just before its
+        earliest raw point, so its first scan covers all of its history.
+        """
+        names=sorted(metric_names)
+        watermarks=await self._locked_watermarks(names)
+        missing=[name for name in names if name not in watermarks]
+        if missing:
+            earliest=(await self.db.execute(
+                select(RawMetrics.metric_name,func.min(RawMetrics.timestamp))
+                .where(RawMetrics.metric_name.in_(missing))
+                .group_by(RawMetrics.metric_name)
+            )).all()
+            if not earliest:
+                return watermarks
+            insert=postgresql.insert if self.db.bind.dialect.name=="postgresql" else sqlite.insert
+            await self.db.execute(
+                insert(RollupWatermark)
+                .values([
+                    {"metric_name":name,"watermark":to_utc_naive(timestamp)-timedelta(microseconds=1),"updated_at":func.now()}
+                    for name,timestamp in earliest
+                ])
+                .on_conflict_do_nothing(index_elements=["metric_name"])
+            )
+            watermarks.update(await self._locked_watermarks(missing))
+        return watermarks
+
+    async def _locked_watermarks(self,metric_names:List[str])->Dict[str,datetime]:
+        rows=await self.db.execute(
+            select(RollupWatermark.metric_name,RollupWatermark.watermark)
+            .where(RollupWatermark.metric_name.in_(metric_names))
+            .order_by(RollupWatermark.metric_name)
+            .with_for_update(read=True)
+        )
+        return {metric_name:watermark for metric_name,watermark in rows}
+
+    async def process_dirty_buckets(self,metric_name:str)->int:
+        """Merge the partial aggregates queued for `metric_name` by backfill and late ingest.
+
+        Runs in the caller's transaction. Queued rows are combined per bucket
+        and folded into rollup_metrics with the additive upsert of
+        `merge_rollups`, so a bucket keeps everything it already counts even
+        after its raw rows have expired. The stream aggregator merges with
+        the same upsert, so queued buckets need not wait for it to flush.
+        """
+        queued=RollupDirtyBucket.metric_name==metric_name
+        merged=0
+        while True:
+            entries=(
+                self.db.query(RollupDirtyBucket)
+                .filter(queued)
+                .order_by(RollupDirtyBucket.id)
+                .limit(config.ROLLUP_DIRTY_BATCH_SIZE)
+                .all()
+            )
+            if not entries:
+                if merged:
+                    # Cached results, in any process, may hold the old version of these buckets
+                    RollupWatermarkService(self.db).bump_generation(metric_name)
+                    query_cache.invalidate(metric_name)
+                return merged
+
+            # One row per bucket: an upsert cannot touch the same row twice
+            buckets={}
+            for entry in entries:
+                key=(entry.series_id,entry.window,entry.bucket_start)
+                aggregate=buckets.get(key)
+                if aggregate is None:
+                    buckets[key]=[entry.min,entry.max,entry.sum,entry.count,dict(entry.sketch) if entry.sketch is not None else None]
+                    continue
+                aggregate[0]=min(aggregate[0],entry.min)
+                aggregate[1]=max(aggregate[1],entry.max)
+                aggregate[2]+=entry.sum
+                aggregate[3]+=entry.count
+                aggregate[4]=merge_into(aggregate[4],entry.sketch)
+
+            self.merge_rollups([
+                {
+                    "metric_name":metric_name,
+                    "series_id":series_id,
+                    "window":window,
+                    "start_time":bucket_start,
+                    "end_time":bucket_start+parse_window(window),
+                    "min":min_value,
+                    "max":max_value,
+                    "sum":sum_value,
+                    "avg":sum_value/count,
+                    "count":count,
+                    "sketch":sketch
+                }
+                for (series_id,window,bucket_start),(min_value,max_value,sum_value,count,sketch) in buckets.items()
+            ])
+            self.db.query(RollupDirtyBucket).filter(
+                RollupDirtyBucket.id.in_([e.id for e in entries])
+            ).delete(synchronize_session=False)
 
-        return rollups
-        
\ No newline at end of file
+            merged+=len(buckets)
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy import delete, func, literal, select, true
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from app.models.rollup_watermarks import RollupWatermark
+from app.models.series import Series
+from app.models.stream_flush_watermarks import StreamFlushWatermark
+from app.utils.time_utils import to_utc_naive
+
+
+class RollupWatermarkService:
+    """Per-metric rollup progress stored in `rollup_watermarks`.
+
+    A worker claims a metric by locking its row with FOR UPDATE SKIP LOCKED,
+    so concurrent rollup workers always pick disjoint metrics. The claim is
+    held until the caller commits the rollups together with the advanced
+    watermark.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def discover(self, initial_watermark: datetime) -> int:
+        """Add a watermark row for every metric in the series table that has none."""
+        insert = postgresql.insert if self.db.bind.dialect.name == "postgresql" else sqlite.insert
+        result = self.db.execute(
+            insert(RollupWatermark)
+            .from_select(
+                ["metric_name", "watermark", "updated_at"],
+                # The WHERE keeps SQLite from parsing ON CONFLICT as part of the SELECT
+                select(Series.metric_name, literal(to_utc_naive(initial_watermark)), func.now())
+                .where(true())
+                .distinct()
+            )
+            .on_conflict_do_nothing(index_elements=["metric_name"])
+        )
+        self.db.commit()
+        return max(result.rowcount or 0, 0)
+
+    def is_empty(self) -> bool:
+        return self.db.scalar(select(RollupWatermark.metric_name).limit(1)) is None
+
+    def claim(self, until: datetime, exclude: Iterable[str] = ()) -> Optional[Tuple[str, datetime]]:
+        """Lock the metric furthest behind `until` that no other worker holds."""
+        query = select(RollupWatermark.metric_name, RollupWatermark.watermark).where(
+            RollupWatermark.watermark < to_utc_naive(until)
+        )
+        exclude = list(exclude)
+        if exclude:
+            query = query.where(RollupWatermark.metric_name.notin_(exclude))
+        row = self.db.execute(
+            query
+            .order_by(RollupWatermark.watermark)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        ).first()
+        return (row.metric_name, row.watermark) if row else None
+
+    def advance(self, metric_name: str, watermark: datetime) -> None:
+        self.db.execute(
+            RollupWatermark.__table__.update()
+            .where(RollupWatermark.metric_name == metric_name)
+            .values(watermark=to_utc_naive(watermark), updated_at=func.now())
+        )
+
+    def bump_generation(self, metric_name: Optional[str] = None) -> None:
+        """Mark settled buckets of `metric_name` (or of every metric) as changed, in the caller's transaction."""
+        statement = RollupWatermark.__table__.update().values(generation=RollupWatermark.generation + 1)
+        if metric_name is not None:
+            statement = statement.where(RollupWatermark.metric_name == metric_name)
+        self.db.execute(statement)
+
+    def record_flush(self, process_id: str, flushed_until: datetime, updated_at: datetime) -> None:
+        """Upsert a stream aggregator's flush watermark in the caller's transaction."""
+        insert = postgresql.insert if self.db.bind.dialect.name == "postgresql" else sqlite.insert
+        statement = insert(StreamFlushWatermark).values(
+            process_id=process_id,
+            flushed_until=to_utc_naive(flushed_until),
+            updated_at=to_utc_naive(updated_at)
+        )
+        self.db.execute(statement.on_conflict_do_update(
+            index_elements=["process_id"],
+            set_={"flushed_until": statement.excluded.flushed_until, "updated_at": statement.excluded.updated_at}
+        ))
+
+    def forget_flush(self, process_id: str) -> None:
+        self.db.execute(delete(StreamFlushWatermark).where(StreamFlushWatermark.process_id == process_id))
+
+    def flush_state(self, stale_before: datetime) -> Tuple[Optional[datetime], List[Tuple[str, datetime]]]:
+        """The slowest live flush watermark, and (process_id, updated_at) of aggregators that stopped reporting."""
+        rows = self.db.execute(
+            select(StreamFlushWatermark.process_id, StreamFlushWatermark.flushed_until, StreamFlushWatermark.updated_at)
+        ).all()
+        stale_before = to_utc_naive(stale_before)
+        live = [row.flushed_until for row in rows if row.updated_at >= stale_before]
+        dead = [(row.process_id, row.updated_at) for row in rows if row.updated_at < stale_before]
+        return (min(live) if live else None), dead
+
+    def retire_flushes(self, dead: List[Tuple[str, datetime]], held_for: timedelta) -> int:
+        """Forget dead aggregators once every metric is rolled up `held_for` past their last heartbeat.
+
+        Nothing they held in memory can belong to a later bucket, so their
+        buckets have all been rebuilt from raw rows by then.
+        """
+        slowest = self.db.scalar(select(func.min(RollupWatermark.watermark)))
+        if slowest is None:
+            return 0
+        retired = 0
+        for process_id, updated_at in dead:
+            if updated_at + held_for > slowest:
+                continue
+            # Only if it has not reported since
+            self.db.execute(delete(StreamFlushWatermark).where(
+                StreamFlushWatermark.process_id == process_id,
+                StreamFlushWatermark.updated_at == updated_at
+            ))
+            retired += 1
+        self.db.commit()
+        return retired
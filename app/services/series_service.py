@@ -0,0 +1,109 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models.series import Series
+from app.utils.label_utils import hash_labels, normalize_labels
+from typing import Dict, Iterable, List, Optional, Tuple
+import threading
+
+_series_cache: Dict[Tuple[str, str], int] = {}
+_cache_lock = threading.Lock()
+
+
+class SeriesService:
+    """Resolves (metric_name, labels) to a `series_id` in the series table.
+
+    Series rows are immutable once created, so resolved ids are cached until
+    `clear_series_cache` is called. New series are inserted in a savepoint of
+    the caller's transaction and commit with its data; their ids are cached
+    on a later lookup, so a rollback of the caller can never leave a cached
+    id behind.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def resolve(self, metric_name: str, labels: Optional[Dict[str, str]]) -> int:
+        resolved = await self.resolve_many([(metric_name, labels)])
+        return resolved[(metric_name, hash_labels(labels))]
+
+    async def resolve_many(
+        self,
+        series: Iterable[Tuple[str, Optional[Dict[str, str]]]]
+    ) -> Dict[Tuple[str, str], int]:
+        resolved: Dict[Tuple[str, str], int] = {}
+        missing: Dict[Tuple[str, str], Dict[str, str]] = {}
+
+        with _cache_lock:
+            for metric_name, labels in series:
+                key = (metric_name, hash_labels(labels))
+                if key in _series_cache:
+                    resolved[key] = _series_cache[key]
+                elif key not in missing:
+                    missing[key] = normalize_labels(labels)
+
+        if not missing:
+            return resolved
+
+        found = await self._lookup(missing.keys())
+        with _cache_lock:
+            _series_cache.update(found)
+        resolved.update(found)
+
+        to_create = [key for key in missing if key not in found]
+        if to_create:
+            await self._create({key: missing[key] for key in to_create})
+            # Not cached: these rows are only committed with the caller's transaction
+            resolved.update(await self._lookup(to_create))
+        return resolved
+
+    async def find_series_ids(self, metric_name: str, labels: Optional[Dict[str, str]] = None) -> List[int]:
+        query = select(Series.series_id).where(Series.metric_name == metric_name)
+        if labels:
+            for key, value in labels.items():
+                query = query.where(Series.labels.op("->>")(key) == value)
+        return list(await self.db.scalars(query))
+
+    async def get_labels(self, series_ids: Iterable[int]) -> Dict[int, Dict[str, str]]:
+        series_ids = list(series_ids)
+        if not series_ids:
+            return {}
+        rows = await self.db.execute(
+            select(Series.series_id, Series.labels).where(Series.series_id.in_(series_ids))
+        )
+        return {series_id: labels or {} for series_id, labels in rows}
+
+    async def _lookup(self, keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], int]:
+        keys = list(keys)
+        found = {}
+        by_metric: Dict[str, List[str]] = {}
+        for metric_name, labels_hash in keys:
+            by_metric.setdefault(metric_name, []).append(labels_hash)
+
+        for metric_name, hashes in by_metric.items():
+            rows = await self.db.execute(
+                select(Series.series_id, Series.labels_hash)
+                .where(Series.metric_name == metric_name, Series.labels_hash.in_(hashes))
+            )
+            for series_id, labels_hash in rows:
+                found[(metric_name, labels_hash)] = series_id
+        return found
+
+    async def _create(self, series: Dict[Tuple[str, str], Dict[str, str]]) -> None:
+        values = [
+            {"metric_name": metric_name, "labels_hash": labels_hash, "labels": labels}
+            for (metric_name, labels_hash), labels in series.items()
+        ]
+        dialect = self.db.bind.dialect.name
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        async with self.db.begin_nested():
+            await self.db.execute(
+                insert(Series).on_conflict_do_nothing(index_elements=["metric_name", "labels_hash"]),
+                values
+            )
+
+
+def clear_series_cache() -> None:
+    """Forget every resolved id, e.g. after series rows were deleted or remapped."""
+    with _cache_lock:
+        _series_cache.clear()
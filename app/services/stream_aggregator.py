@@ -0,0 +1,282 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from app import config
+from app.db import SessionLocal
+from app.services.rollup_service import RollupService, bucket_closed
+from app.services.rollup_watermark_service import RollupWatermarkService
+from app.utils.sketch import add_to_sketch, merge_sketches, sketch_key
+from app.utils.time_utils import parse_window, round_to_window, to_utc_naive
+
+logger = logging.getLogger(__name__)
+
+# (series_id, bucket_start) -> [metric_name, min, max, sum, count, sketch]
+Buckets = Dict[Tuple[int, datetime], List]
+
+
+class StreamAggregator:
+    """In-process rollup of ingested points into open 1m/5m/1h buckets.
+
+    Write paths hand every committed point to `add` together with the time
+    they decided which of its buckets were still open (see
+    `RollupService.record_late_points`). Points for closed buckets were queued
+    as dirty buckets in the same transaction and are skipped here; the rest
+    are folded into running min/max/sum/count and a quantile sketch per
+    series and bucket.
+
+    A background task merges buckets into rollup_metrics once they have been
+    closed for ROLLUP_LATENESS_SECONDS. Merges are upserts that add to the
+    stored bucket, so several API processes can aggregate the same series.
+    Open buckets are served to `/query/rollup` from memory, and are flushed on
+    shutdown.
+
+    Every flush also records, in the same transaction, how far this process
+    has merged (`stream_flush_watermarks`). The rollup job never advances a
+    watermark past the slowest live process, and rebuilds from raw rows the
+    buckets of a process that stopped reporting, so a crash loses nothing. A
+    process that could not flush for STREAM_AGGREGATION_STALE_SECONDS has
+    been taken for crashed: it drops what it holds and rejoins under a new id.
+    """
+
+    def __init__(self, windows: List[str], flush_interval_seconds: float):
+        self.windows = windows
+        self.flush_interval = flush_interval_seconds
+        self._buckets: Dict[str, Buckets] = {window: {} for window in windows}
+        self._flushing: Dict[str, Buckets] = {window: {} for window in windows}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self.process_id: Optional[str] = None
+        self._flushed_at = 0.0
+        # Id this process was known by before rejoining, until the rejoin is recorded
+        self._rejoined_from: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._closed
+
+    def open_bucket_count(self) -> int:
+        return sum(len(buckets) for buckets in self._buckets.values())
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._closed = False
+        self.process_id = _new_process_id()
+        # Registered before any point is added: the rollup job must wait for this process
+        await asyncio.to_thread(self._write, [], self._flushed_until(datetime.now(timezone.utc).replace(tzinfo=None)))
+        self._flushed_at = time.monotonic()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Stream aggregator started (windows={self.windows}, "
+            f"flush every {self.flush_interval:.1f}s, lateness={config.ROLLUP_LATENESS_SECONDS:.0f}s)"
+        )
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._closed = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        # The process is going away, so open buckets are written as partials
+        if not await self._flush(None):
+            logger.warning(f"Stream aggregator stopped with {self.open_bucket_count()} buckets unwritten")
+        else:
+            logger.info("Stream aggregator flushed and stopped")
+
+    def add(self, rows: Iterable[Dict], observed_at: datetime) -> int:
+        """Fold committed rows (metric_name, series_id, timestamp, value) into open buckets."""
+        if not self.running:
+            return 0
+
+        observed_at = to_utc_naive(observed_at)
+        added = 0
+        for row in rows:
+            timestamp = to_utc_naive(row["timestamp"])
+            value = float(row["value"])
+            for window in self.windows:
+                bucket_start = round_to_window(timestamp, window)
+                if bucket_closed(bucket_start, window, observed_at):
+                    continue
+                key = (row["series_id"], bucket_start)
+                aggregate = self._buckets[window].get(key)
+                if aggregate is None:
+                    self._buckets[window][key] = [row["metric_name"], value, value, value, 1, {sketch_key(value): 1}]
+                    continue
+                if value < aggregate[1]:
+                    aggregate[1] = value
+                if value > aggregate[2]:
+                    aggregate[2] = value
+                aggregate[3] += value
+                aggregate[4] += 1
+                add_to_sketch(aggregate[5], value)
+            added += 1
+        return added
+
+    def open_buckets(
+        self,
+        metric_name: str,
+        window: str,
+        start_time: datetime,
+        end_time: datetime,
+        series_ids: Optional[Set[int]] = None
+    ) -> List[Dict]:
+        """Buckets of `metric_name` starting in [start_time, end_time) not yet in rollup_metrics."""
+        start_time = to_utc_naive(start_time)
+        end_time = to_utc_naive(end_time)
+        merged: Dict[Tuple[int, datetime], List] = {}
+        for buckets in (self._flushing.get(window, {}), self._buckets.get(window, {})):
+            for (series_id, bucket_start), aggregate in buckets.items():
+                if aggregate[0] != metric_name or not start_time <= bucket_start < end_time:
+                    continue
+                if series_ids is not None and series_id not in series_ids:
+                    continue
+                key = (series_id, bucket_start)
+                merged[key] = _merge(merged[key], aggregate) if key in merged else list(aggregate)
+
+        return [
+            {
+                "series_id": series_id,
+                "timestamp": bucket_start,
+                "min": aggregate[1],
+                "max": aggregate[2],
+                "sum": aggregate[3],
+                "avg": aggregate[3] / aggregate[4],
+                "count": aggregate[4],
+                "sketch": aggregate[5]
+            }
+            for (series_id, bucket_start), aggregate in merged.items()
+        ]
+
+    async def _run(self) -> None:
+        while not self._closed:
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            if not self._closed:
+                await self._flush(datetime.now(timezone.utc).replace(tzinfo=None))
+
+    async def _flush(self, observed_at: Optional[datetime]) -> bool:
+        """Merge buckets closed at `observed_at` (all of them for None) into rollup_metrics."""
+        if time.monotonic() - self._flushed_at > config.STREAM_AGGREGATION_STALE_SECONDS:
+            self._rejoin()
+
+        for window in self.windows:
+            closed = {
+                key: aggregate
+                for key, aggregate in self._buckets[window].items()
+                if observed_at is None or bucket_closed(key[1], window, observed_at)
+            }
+            for key in closed:
+                del self._buckets[window][key]
+            self._flushing[window] = closed
+
+        rollups = [
+            {
+                "metric_name": aggregate[0],
+                "series_id": series_id,
+                "window": window,
+                "start_time": bucket_start,
+                "end_time": bucket_start + parse_window(window),
+                "min": aggregate[1],
+                "max": aggregate[2],
+                "sum": aggregate[3],
+                "avg": aggregate[3] / aggregate[4],
+                "count": aggregate[4],
+                "sketch": aggregate[5]
+            }
+            for window, buckets in self._flushing.items()
+            for (series_id, bucket_start), aggregate in buckets.items()
+        ]
+        flushed_until = self._flushed_until(observed_at) if observed_at is not None else None
+        try:
+            await asyncio.to_thread(self._write, rollups, flushed_until, self._rejoined_from)
+            self._flushed_at = time.monotonic()
+            self._rejoined_from = None
+            if rollups:
+                logger.debug(f"Stream aggregator merged {len(rollups)} buckets")
+            return True
+        except Exception as e:
+            # Keep the buckets and retry on the next flush
+            logger.error(f"Stream aggregator flush of {len(rollups)} buckets failed: {e}")
+            for window, buckets in self._flushing.items():
+                for key, aggregate in buckets.items():
+                    current = self._buckets[window].get(key)
+                    self._buckets[window][key] = aggregate if current is None else _merge(current, aggregate)
+            return False
+        finally:
+            self._flushing = {window: {} for window in self.windows}
+
+    def _rejoin(self) -> None:
+        """Drop everything held and take a new id; the rollup job rebuilds the dropped buckets.
+
+        Repeated on every flush until the rejoin is recorded, since the job
+        may rebuild whatever was added in the meantime as well.
+        """
+        dropped = self.open_bucket_count()
+        for window in self.windows:
+            self._buckets[window] = {}
+        if self._rejoined_from is None:
+            self._rejoined_from, self.process_id = self.process_id, _new_process_id()
+        logger.warning(
+            f"Stream aggregator {self._rejoined_from} has not flushed for over "
+            f"{config.STREAM_AGGREGATION_STALE_SECONDS:.0f}s and rejoins as {self.process_id}; "
+            f"dropped {dropped} buckets the rollup job rebuilds from raw rows"
+        )
+
+    def _flushed_until(self, observed_at: datetime) -> datetime:
+        # Every bucket ending by then is closed at `observed_at`
+        return observed_at - timedelta(seconds=config.ROLLUP_LATENESS_SECONDS)
+
+    def _write(self, rollups: List[Dict], flushed_until: Optional[datetime], rejoined_from: Optional[str] = None) -> None:
+        """Merge `rollups` and record the flush watermark (or drop it for a final flush) in one transaction."""
+        process_id = self.process_id
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        db = SessionLocal()
+        try:
+            RollupService(db).merge_rollups(rollups)
+            watermarks = RollupWatermarkService(db)
+            if flushed_until is None:
+                watermarks.forget_flush(process_id)
+            else:
+                watermarks.record_flush(process_id, flushed_until, now)
+            if rejoined_from is not None:
+                # Still dead to the rollup job, which keeps rebuilding past anything it held
+                stale = timedelta(seconds=config.STREAM_AGGREGATION_STALE_SECONDS + 1)
+                watermarks.record_flush(rejoined_from, now - stale, now - stale)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+def _new_process_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def _merge(aggregate: List, other: List) -> List:
+    return [
+        aggregate[0],
+        min(aggregate[1], other[1]),
+        max(aggregate[2], other[2]),
+        aggregate[3] + other[3],
+        aggregate[4] + other[4],
+        merge_sketches(aggregate[5], other[5])
+    ]
+
+
+stream_aggregator = StreamAggregator(
+    windows=RollupService.windows,
+    flush_interval_seconds=config.STREAM_AGGREGATION_FLUSH_SECONDS
+)
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from app import config
+from app.db import AsyncSessionLocal
+from app.utils.bulk_utils import bulk_insert_raw_metrics
+from app.utils.series_index import series_index
+from app.services.rollup_service import RollupService
+from app.services.stream_aggregator import stream_aggregator
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBufferFullException(Exception):
+    pass
+
+
+class WriteBuffer:
+    """In-process group commit for single-point ingest.
+
+    Requests enqueue a row and wait; a background flusher writes the queue in
+    one transaction once it holds `max_batch` rows or the oldest row has waited
+    `max_delay_ms`, then resolves every waiter with the outcome of that commit.
+    """
+
+    def __init__(self, max_batch: int, max_delay_ms: float, capacity: int):
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.capacity = capacity
+        self._pending: List[Tuple[Dict, asyncio.Future]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._closed
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._closed = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Ingest write buffer started (max_batch={self.max_batch}, "
+            f"max_delay={self.max_delay * 1000:.1f}ms, capacity={self.capacity})"
+        )
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._closed = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        logger.info("Ingest write buffer drained and stopped")
+
+    async def submit(self, row: Dict) -> None:
+        if not self.running:
+            raise RuntimeError("Write buffer is not running")
+        if len(self._pending) >= self.capacity:
+            raise WriteBufferFullException(
+                f"Ingest buffer is full ({self.capacity} pending rows), retry later"
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((row, future))
+        if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+
+        await future
+
+    async def _run(self) -> None:
+        while True:
+            if not self._pending:
+                if self._closed:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            if len(self._pending) < self.max_batch and not self._closed:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple[Dict, asyncio.Future]]) -> None:
+        rows = [row for row, _ in batch]
+        try:
+            await self._write(rows)
+        except Exception as e:
+            logger.error(f"Group commit of {len(rows)} rows failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+    async def _write(self, rows: List[Dict]) -> None:
+        observed_at = datetime.now(timezone.utc)
+        async with AsyncSessionLocal() as db:
+            try:
+                await bulk_insert_raw_metrics(db, rows)
+                await RollupService(db).record_late_points(
+                    ((row["metric_name"], row["series_id"], row["timestamp"], row["value"]) for row in rows), observed_at
+                )
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        stream_aggregator.add(rows, observed_at)
+
+        for row in rows:
+            series_index.add(row["metric_name"], row.get("labels"))
+
+
+ingest_buffer = WriteBuffer(
+    max_batch=config.INGEST_BUFFER_MAX_BATCH,
+    max_delay_ms=config.INGEST_BUFFER_MAX_DELAY_MS,
+    capacity=config.INGEST_BUFFER_CAPACITY
+)
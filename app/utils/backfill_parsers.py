@@ -0,0 +1,94 @@
+from datetime import datetime
+from typing import Dict
+import csv
+import json
+import math
+
+# Same limit as IngestRequest.metric_name
+MAX_METRIC_NAME_LENGTH = 100
+# A longer line means a malformed or newline-free body; it is never buffered further
+MAX_LINE_BYTES = 64 * 1024
+
+
+class InvalidBackfillFormatException(ValueError):
+    pass
+
+
+def parse_ndjson_line(line: str) -> Dict:
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON: {e.msg}")
+    if not isinstance(record, dict):
+        raise ValueError("Each line must be a JSON object")
+    return validate_record(record.get("metric_name"), record.get("value"), record.get("timestamp"), record.get("labels"))
+
+
+class CsvLineParser:
+    """Parses CSV lines against a header naming at least metric_name, value and timestamp.
+
+    An optional `labels` column holds a JSON object.
+    """
+
+    required_columns = ("metric_name", "value", "timestamp")
+
+    def __init__(self, header: str):
+        self.columns = [c.strip() for c in next(csv.reader([header]))]
+        missing = [c for c in self.required_columns if c not in self.columns]
+        if missing:
+            raise InvalidBackfillFormatException(f"CSV header is missing columns: {', '.join(missing)}")
+        self.index = {name: i for i, name in enumerate(self.columns)}
+
+    def parse(self, line: str) -> Dict:
+        fields = next(csv.reader([line]))
+        if len(fields) != len(self.columns):
+            raise ValueError(f"Expected {len(self.columns)} fields, got {len(fields)}")
+
+        labels = None
+        if "labels" in self.index and fields[self.index["labels"]]:
+            try:
+                labels = json.loads(fields[self.index["labels"]])
+            except json.JSONDecodeError:
+                raise ValueError("labels must be a JSON object")
+
+        return validate_record(
+            fields[self.index["metric_name"]],
+            fields[self.index["value"]],
+            fields[self.index["timestamp"]],
+            labels
+        )
+
+
+def validate_record(metric_name, value, timestamp, labels) -> Dict:
+    if not isinstance(metric_name, str) or not metric_name.strip():
+        raise ValueError("metric_name must be a non-empty string")
+    if len(metric_name.strip()) > MAX_METRIC_NAME_LENGTH:
+        raise ValueError(f"metric_name must be at most {MAX_METRIC_NAME_LENGTH} characters")
+
+    if isinstance(value, bool):
+        raise ValueError("value must be numeric")
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("value must be numeric")
+    if not math.isfinite(value):
+        raise ValueError("value must be finite")
+
+    if not isinstance(timestamp, str):
+        raise ValueError("timestamp must be an ISO 8601 string")
+    try:
+        timestamp = datetime.fromisoformat(timestamp)
+    except ValueError:
+        raise ValueError(f"Invalid timestamp '{timestamp}'")
+
+    if labels is None:
+        labels = {}
+    if not isinstance(labels, dict) or not all(isinstance(k, str) and isinstance(v, str) for k, v in labels.items()):
+        raise ValueError("labels must be an object of string values")
+
+    return {
+        "metric_name": metric_name.strip(),
+        "value": value,
+        "timestamp": timestamp,
+        "labels": labels
+    }
@@ -0,0 +1,73 @@
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.raw_metrics import RawMetrics
+from app.utils.time_utils import to_utc_naive
+from datetime import datetime, timezone
+from typing import Dict, List, Sequence
+
+RAW_METRIC_COLUMNS = ("metric_name", "value", "timestamp", "series_id", "tenant_id", "created_at")
+
+
+def supports_copy(db: AsyncSession) -> bool:
+    return db.bind.dialect.driver == "asyncpg"
+
+
+async def bulk_insert_raw_metrics(db: AsyncSession, rows: List[Dict]) -> int:
+    """Write raw metric rows in the session's transaction.
+
+    Uses PostgreSQL COPY when running on asyncpg and a multi-row INSERT
+    everywhere else. The caller owns the commit.
+    """
+    if not rows:
+        return 0
+
+    created_at = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    if supports_copy(db):
+        await copy_rows(
+            db,
+            RawMetrics.__tablename__,
+            RAW_METRIC_COLUMNS,
+            [
+                (
+                    row["metric_name"],
+                    float(row["value"]),
+                    to_utc_naive(row["timestamp"]),
+                    row["series_id"],
+                    row.get("tenant_id"),
+                    created_at
+                )
+                for row in rows
+            ]
+        )
+    else:
+        await db.execute(
+            insert(RawMetrics),
+            [
+                {
+                    "metric_name": row["metric_name"],
+                    "value": row["value"],
+                    "timestamp": to_utc_naive(row["timestamp"]),
+                    "series_id": row["series_id"],
+                    "tenant_id": row.get("tenant_id"),
+                    "created_at": created_at
+                }
+                for row in rows
+            ]
+        )
+
+    return len(rows)
+
+
+async def copy_rows(db: AsyncSession, table: str, columns: Sequence[str], rows: List[Sequence]) -> int:
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    driver_connection = raw_connection.driver_connection
+
+    if not driver_connection.is_in_transaction():
+        # The asyncpg adapter only opens the session's transaction on the
+        # first statement; issue one so COPY joins it instead of autocommitting.
+        await connection.exec_driver_sql("SELECT 1")
+
+    await driver_connection.copy_records_to_table(table, records=rows, columns=list(columns))
+    return len(rows)
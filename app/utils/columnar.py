@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Tuple
+import json
+
+try:
+    import msgpack
+except ImportError:  # optional: only needed for format=msgpack
+    msgpack = None
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional: only needed for format=arrow
+    pa = None
+
+
+# Every column shares the row order of "timestamp"
+COLUMNAR_FORMATS = ("columnar", "msgpack", "arrow")
+
+MEDIA_TYPES = {
+    "columnar": "application/json",
+    "msgpack": "application/msgpack",
+    "arrow": "application/vnd.apache.arrow.stream"
+}
+
+EPOCH = datetime(1970, 1, 1)
+MILLISECOND = timedelta(milliseconds=1)
+
+
+def check_format(format: str, formats: Iterable[str]) -> None:
+    formats = list(formats)
+    if format not in formats:
+        raise ValueError(f"Invalid format '{format}'. Must be one of: {formats}")
+    if format == "msgpack" and msgpack is None:
+        raise ValueError("format=msgpack needs the msgpack package on the server (pip install msgpack)")
+    if format == "arrow" and pa is None:
+        raise ValueError("format=arrow needs the pyarrow package on the server (pip install pyarrow)")
+
+
+def epoch_ms(timestamps: Iterable[datetime]) -> List[int]:
+    """Naive UTC timestamps as integer milliseconds since the epoch."""
+    return [(timestamp - EPOCH) // MILLISECOND for timestamp in timestamps]
+
+
+def encode(format: str, result: Dict) -> Tuple[bytes, str]:
+    """Serialize a result with parallel "columns" and return (body, media type).
+
+    `columnar` and `msgpack` encode the result as is; `arrow` writes the
+    columns as one record batch in an IPC stream, with `timestamp` as a UTC
+    millisecond timestamp column and every other field JSON-encoded in the
+    schema metadata.
+    """
+    if format == "columnar":
+        body = json.dumps(result, separators=(",", ":")).encode()
+    elif format == "msgpack":
+        body = msgpack.packb(result)
+    elif format == "arrow":
+        metadata = {key: value for key, value in result.items() if key != "columns"}
+        body = _arrow_stream(metadata, result["columns"])
+    else:
+        raise ValueError(f"Invalid format '{format}'. Must be one of: {list(COLUMNAR_FORMATS)}")
+    return body, MEDIA_TYPES[format]
+
+
+def _arrow_stream(metadata: Dict, columns: Dict[str, List]) -> bytes:
+    arrays = {
+        name: pa.array(values, type=pa.timestamp("ms", tz="UTC")) if name == "timestamp" else pa.array(values)
+        for name, values in columns.items()
+    }
+    batch = pa.RecordBatch.from_pydict(arrays)
+    schema = batch.schema.with_metadata({key: json.dumps(value) for key, value in metadata.items()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_batch(batch.replace_schema_metadata(schema.metadata))
+    return sink.getvalue().to_pybytes()
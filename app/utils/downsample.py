@@ -0,0 +1,172 @@
+from datetime import datetime
+from itertools import groupby
+from typing import List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional: buckets are reduced in pure Python without it
+    np = None
+
+
+METHODS = ("lttb", "minmax")
+
+Point = Tuple[datetime, float]
+
+
+class Downsampler:
+    """Reduce a time-ordered stream of points to at most `max_points` points.
+
+    [start_time, end_time] is cut into equal-width time buckets, one per
+    output point (`lttb`) or per min/max pair (`minmax`), so rows can be fed
+    in chunks as they are scanned and only the buckets still being decided
+    are held in memory. Each chunk is split into per-bucket runs and every
+    run is reduced with NumPy when it is installed.
+
+    `lttb` is Largest-Triangle-Three-Buckets: it keeps the first and last
+    point and, per bucket, the point forming the largest triangle with the
+    previously kept point and the average of the next non-empty bucket.
+    `minmax` keeps the lowest and highest point of every bucket, so no spike
+    is lost.
+    """
+
+    def __init__(self, method: str, start_time: datetime, end_time: datetime, max_points: int):
+        if method not in METHODS:
+            raise ValueError(f"Invalid downsampling method '{method}'. Must be one of: {list(METHODS)}")
+        minimum = 3 if method == "lttb" else 2
+        if max_points < minimum:
+            raise ValueError(f"max_points must be at least {minimum} for {method} downsampling")
+
+        self.method = method
+        self.start_time = start_time
+        self.buckets = max_points - 2 if method == "lttb" else max_points // 2
+        self.bucket_seconds = max((end_time - start_time).total_seconds(), 1e-6) / self.buckets
+        self.points: List[Point] = []
+        self.scanned = 0
+        # Bucket being filled: (bucket id, [seconds parts], [value parts], [timestamp parts])
+        self._current: Optional[Tuple[int, List, List, List]] = None
+        # lttb: closed bucket waiting for the average of the next one
+        self._pending: Optional[Tuple[Sequence[float], Sequence[float], Sequence[datetime]]] = None
+        self._anchor: Optional[Tuple[float, float]] = None
+        self._last: Optional[Point] = None
+
+    def add(self, timestamps: Sequence[datetime], values: Sequence[float]) -> None:
+        """Feed the next chunk of points, in timestamp order after the previous chunk."""
+        if not len(timestamps):
+            return
+
+        if np is not None:
+            seconds = np.fromiter(
+                ((timestamp - self.start_time).total_seconds() for timestamp in timestamps), dtype=np.float64
+            )
+            values = np.asarray(values, dtype=np.float64)
+            ids = np.clip(np.floor(seconds / self.bucket_seconds), 0, self.buckets - 1).astype(np.int64)
+            starts = np.flatnonzero(np.concatenate(([True], ids[1:] != ids[:-1]))).tolist()
+            runs = [
+                (int(ids[begin]), begin, end)
+                for begin, end in zip(starts, starts[1:] + [len(ids)])
+            ]
+        else:
+            seconds = [(timestamp - self.start_time).total_seconds() for timestamp in timestamps]
+            values = [float(value) for value in values]
+            ids = [min(max(int(second // self.bucket_seconds), 0), self.buckets - 1) for second in seconds]
+            runs = []
+            begin = 0
+            for bucket, run in groupby(ids):
+                end = begin + sum(1 for _ in run)
+                runs.append((bucket, begin, end))
+                begin = end
+
+        if self._anchor is None and self.method == "lttb":
+            # The first point is always kept
+            self._emit(timestamps[0], float(values[0]))
+            self._anchor = (float(seconds[0]), float(values[0]))
+
+        for bucket, begin, end in runs:
+            if self._current is not None and self._current[0] != bucket:
+                self._close(*self._current[1:])
+                self._current = None
+            if self._current is None:
+                self._current = (bucket, [], [], [])
+            self._current[1].append(seconds[begin:end])
+            self._current[2].append(values[begin:end])
+            self._current[3].append(timestamps[begin:end])
+
+        self.scanned += len(timestamps)
+        self._last = (timestamps[-1], float(values[-1]))
+
+    def finish(self) -> List[Point]:
+        if self._current is not None:
+            self._close(*self._current[1:])
+            self._current = None
+        if self.method == "lttb" and self._pending is not None and self._last is not None:
+            # The last bucket is weighed against the last point, which is kept as well
+            last_seconds = (self._last[0] - self.start_time).total_seconds()
+            self._select(last_seconds, self._last[1])
+            self._pending = None
+        if self.method == "lttb" and self._last is not None:
+            self._emit(*self._last)
+        return self.points
+
+    def _close(self, seconds_parts: List, value_parts: List, timestamp_parts: List) -> None:
+        seconds = _concat(seconds_parts)
+        values = _concat(value_parts)
+        timestamps = [timestamp for part in timestamp_parts for timestamp in part]
+
+        if self.method == "minmax":
+            low = _argmin(values)
+            high = _argmax(values)
+            for index in sorted({low, high}):
+                self._emit(timestamps[index], float(values[index]))
+            return
+
+        if self._pending is not None:
+            self._select(_mean(seconds), _mean(values))
+        self._pending = (seconds, values, timestamps)
+
+    def _select(self, next_seconds: float, next_value: float) -> None:
+        """Keep the pending bucket's point with the largest triangle area."""
+        seconds, values, timestamps = self._pending
+        anchor_seconds, anchor_value = self._anchor
+        if np is not None:
+            areas = np.abs(
+                (anchor_seconds - next_seconds) * (values - anchor_value)
+                - (anchor_seconds - seconds) * (next_value - anchor_value)
+            )
+            index = int(np.argmax(areas))
+        else:
+            index = max(
+                range(len(values)),
+                key=lambda i: abs(
+                    (anchor_seconds - next_seconds) * (values[i] - anchor_value)
+                    - (anchor_seconds - seconds[i]) * (next_value - anchor_value)
+                )
+            )
+        self._emit(timestamps[index], float(values[index]))
+        self._anchor = (float(seconds[index]), float(values[index]))
+
+    def _emit(self, timestamp: datetime, value: float) -> None:
+        if self.points and self.points[-1] == (timestamp, value):
+            return
+        self.points.append((timestamp, value))
+
+
+def _concat(parts: List):
+    if np is not None:
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+    return [item for part in parts for item in part]
+
+
+def _argmin(values) -> int:
+    if np is not None:
+        return int(np.argmin(values))
+    return min(range(len(values)), key=values.__getitem__)
+
+
+def _argmax(values) -> int:
+    if np is not None:
+        return int(np.argmax(values))
+    return max(range(len(values)), key=values.__getitem__)
+
+
+def _mean(values) -> float:
+    return float(np.mean(values)) if np is not None else sum(values) / len(values)
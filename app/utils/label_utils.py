@@ -1,38 +1,23 @@
 from app.models.raw_metrics import RawMetrics
-from sqlalchemy.orm import Session
-from typing import Optional, Dict
+from app.models.series import Series
+from sqlalchemy import exists, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional, Dict, Set
 import hashlib
 import json
 
 
-def check_cardinality(
-    db: Session,
-    metric_name: str,
-    labels: dict,
-    limit: int = None
-) -> bool:
-    if not labels:
-        return True
-
-    distinct_label_sets = (
-        db.query(RawMetrics.labels)
-        .filter(RawMetrics.metric_name == metric_name)
-        .distinct()
-        .all()
-    )
-
-    existing_combinations = set()
-    for (label_dict,) in distinct_label_sets:    
-        label_items = frozenset(label_dict.items())
-        existing_combinations.add(label_items)
-
-    new_label_items = frozenset(labels.items())
-
-    if new_label_items not in existing_combinations:
-        if limit is not None and len(existing_combinations) >= limit:
-            return False
+async def get_label_hashes(db: AsyncSession, metric_name: Optional[str] = None) -> Dict[str, Set[str]]:
+    """Label hashes of every series that still has raw data, grouped by metric."""
+    has_raw_rows = exists().where(RawMetrics.series_id == Series.series_id)
+    query = select(Series.metric_name, Series.labels_hash).where(has_raw_rows)
+    if metric_name is not None:
+        query = query.where(Series.metric_name == metric_name)
 
-    return True
+    series: Dict[str, Set[str]] = {}
+    for name, labels_hash in await db.execute(query):
+        series.setdefault(name, set()).add(labels_hash)
+    return series
 
 def normalize_labels(labels:Optional[Dict[str,str]])->Dict[str,str]:
     if not labels:
@@ -0,0 +1,94 @@
+from datetime import datetime
+from typing import Dict, List, Sequence, Tuple
+from app.utils.sketch import LOG_GAMMA, MAX_KEY, MIN_INDEXABLE_VALUE, NEGATIVE_PREFIX, ZERO_KEY, Sketch
+
+try:
+    import numpy as np
+except ImportError:  # optional: only needed for ROLLUP_ENGINE=numpy
+    np = None
+
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def numpy_available() -> bool:
+    return np is not None
+
+
+def aggregate_windows(
+    series_ids: Sequence[int],
+    timestamps: Sequence,
+    values: Sequence[float],
+    window_seconds: Dict[str, int]
+) -> Dict[str, Tuple]:
+    """Vectorized min/max/sum/count per (series, bucket) for several windows.
+
+    Rows are sorted once by (series_id, timestamp). Bucket ids are integer
+    floor divisions of epoch microseconds, so every window's groups are
+    contiguous runs of that single ordering and reduce with `ufunc.reduceat`.
+    Timestamps are naive UTC datetimes.
+
+    Returns, per window, arrays of (series_id, bucket_start, min, max, sum,
+    count) followed by a list with each group's quantile sketch.
+    """
+    if np is None:
+        raise RuntimeError("numpy is not installed; install it to use ROLLUP_ENGINE=numpy")
+
+    series_ids = np.asarray(series_ids, dtype=np.int64)
+    # Much cheaper than letting numpy convert datetime objects to datetime64
+    seconds = np.fromiter(((timestamp - EPOCH).total_seconds() for timestamp in timestamps), dtype=np.float64)
+    micros = np.rint(seconds * 1_000_000).astype(np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return {}
+
+    order = np.lexsort((micros, series_ids))
+    series_ids = series_ids[order]
+    micros = micros[order]
+    values = values[order]
+    series_change = series_ids[1:] != series_ids[:-1]
+    sketch_codes, sketch_keys = _sketch_codes(values)
+
+    results = {}
+    for window, seconds in window_seconds.items():
+        width = seconds * 1_000_000
+        buckets = micros // width
+        starts = np.flatnonzero(np.concatenate(([True], series_change | (buckets[1:] != buckets[:-1]))))
+        results[window] = (
+            series_ids[starts],
+            (buckets[starts] * width).astype("datetime64[us]"),
+            np.minimum.reduceat(values, starts),
+            np.maximum.reduceat(values, starts),
+            np.add.reduceat(values, starts),
+            np.diff(np.append(starts, len(values))),
+            _group_sketches(starts, len(values), sketch_codes, sketch_keys)
+        )
+    return results
+
+
+def _sketch_codes(values) -> Tuple:
+    """Dense integer code per value for its `sketch_key`, and the key of each code."""
+    magnitudes = np.abs(values)
+    indexable = magnitudes > MIN_INDEXABLE_VALUE
+    indexes = np.zeros(len(values), dtype=np.int64)
+    indexes[indexable] = np.minimum(np.ceil(np.log(magnitudes[indexable]) / LOG_GAMMA), MAX_KEY)
+    # 0 = positive, 1 = negative, 2 = zero
+    signs = np.where(indexable, (values < 0).astype(np.int64), 2)
+    unique, codes = np.unique(indexes * 3 + signs, return_inverse=True)
+    keys = [
+        ZERO_KEY if sign == 2 else f"{NEGATIVE_PREFIX}{index}" if sign == 1 else str(index)
+        for index, sign in (divmod(combined, 3) for combined in unique.tolist())
+    ]
+    return codes.reshape(-1), keys
+
+
+def _group_sketches(starts, length: int, codes, keys: List[str]) -> List[Sketch]:
+    groups = np.zeros(length, dtype=np.int64)
+    groups[starts[1:]] = 1
+    groups = np.cumsum(groups)
+    pairs, counts = np.unique(groups * len(keys) + codes, return_counts=True)
+    sketches: List[Sketch] = [{} for _ in range(len(starts))]
+    for pair, count in zip(pairs.tolist(), counts.tolist()):
+        group, code = divmod(pair, len(keys))
+        sketches[group][keys[code]] = count
+    return sketches
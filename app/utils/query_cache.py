@@ -0,0 +1,139 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Hashable, List, Optional, Tuple
+from app import config
+import pickle
+import threading
+import time
+
+
+class MemoryCacheBackend:
+    """Byte-bounded LRU of pickled values with a per-entry TTL.
+
+    The interface (`get`, `set`, `clear`, `stats`) only deals in keys and
+    bytes, so a shared backend such as Redis can replace it without touching
+    `QueryCache`.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float = 0):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[bytes, Optional[float]]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: bytes) -> bool:
+        if len(value) > self.max_bytes:
+            return False
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at)
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+    def _remove(self, key: Hashable) -> None:
+        value, _ = self._entries.pop(key)
+        self._bytes -= len(value)
+
+
+class QueryCache:
+    """Settled rollup query results, per (metric, labels, window, sketches).
+
+    An entry holds the points of [covered_from, covered_to), where
+    covered_to never passes the metric's rollup watermark, so it only holds
+    buckets the rollup job has finished. A query starting inside an entry
+    reuses its points and fetches only the trailing part from the database;
+    whatever of that part has settled since extends the entry.
+
+    Buckets below the watermark can still change when late points or a
+    backfill are merged into them or retention deletes them, usually in
+    another process. Those writers bump the metric's `generation` in
+    rollup_watermarks in the same transaction, and callers pass the
+    generation they read into `key`, so every process stops using the old
+    entries at once. `invalidate` does the same for this process only.
+    """
+
+    def __init__(self, backend: MemoryCacheBackend):
+        self.backend = backend
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def key(self, metric_name: str, generation: int, labels_hash: str, window: str, with_sketches: bool) -> Tuple:
+        # Either generation changing orphans the old entries, which age out of the LRU
+        return (metric_name, generation, self._generations.get(metric_name, 0), labels_hash, window, with_sketches)
+
+    def get(self, key: Tuple, start_time: datetime, end_time: datetime) -> Optional[Tuple[datetime, datetime, List[Dict]]]:
+        """The cached (covered_from, covered_to, points) usable for a query starting at `start_time`."""
+        value = self.backend.get(key)
+        entry = pickle.loads(value) if value is not None else None
+        with self._lock:
+            if entry is None or not entry[0] <= start_time < entry[1]:
+                self.misses += 1
+                return None
+            if entry[1] < end_time:
+                self.partial_hits += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def set(self, key: Tuple, covered_from: datetime, covered_to: datetime, points: List[Dict]) -> bool:
+        return self.backend.set(key, pickle.dumps((covered_from, covered_to, points), protocol=pickle.HIGHEST_PROTOCOL))
+
+    def invalidate(self, metric_name: Optional[str] = None) -> None:
+        with self._lock:
+            if metric_name is None:
+                self._generations = {}
+                self.backend.clear()
+            else:
+                self._generations[metric_name] = self._generations.get(metric_name, 0) + 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = {"hits": self.hits, "partial_hits": self.partial_hits, "misses": self.misses}
+        return {**stats, **self.backend.stats()}
+
+
+query_cache = QueryCache(
+    MemoryCacheBackend(
+        max_bytes=config.QUERY_CACHE_MAX_BYTES,
+        ttl_seconds=config.QUERY_CACHE_TTL_SECONDS
+    )
+)
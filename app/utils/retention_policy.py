@@ -0,0 +1,78 @@
+from datetime import timedelta
+from typing import Dict, Optional
+import json
+
+RETENTION_TIERS = ("raw", "1m", "5m", "1h")
+
+DEFAULT_RETENTION_DAYS = {
+    "raw": 3,
+    "1m": 7,
+    "5m": 30,
+    "1h": 90
+}
+
+
+class InvalidRetentionPolicyException(ValueError):
+    pass
+
+
+class RetentionPolicy:
+    """Retention periods per tier, with optional per-metric overrides.
+
+    Loaded from a JSON file shaped like::
+
+        {
+            "default": {"raw": 3, "1m": 7, "5m": 30, "1h": 90},
+            "metrics": {"cpu_usage": {"raw": 14, "1h": 365}}
+        }
+
+    Values are days; tiers missing from `default` keep the built-in periods
+    and tiers missing from a metric override fall back to `default`.
+    """
+
+    def __init__(self, default: Optional[Dict[str, float]] = None, metrics: Optional[Dict[str, Dict[str, float]]] = None):
+        self.default = {**DEFAULT_RETENTION_DAYS, **self._validate(default or {}, "default")}
+        self.metrics = {
+            metric_name: self._validate(tiers, f"metrics.{metric_name}")
+            for metric_name, tiers in (metrics or {}).items()
+        }
+
+    @classmethod
+    def load(cls, path: Optional[str]) -> "RetentionPolicy":
+        if not path:
+            return cls()
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise InvalidRetentionPolicyException(f"Cannot read retention policy file {path}: {e}")
+        if not isinstance(data, dict):
+            raise InvalidRetentionPolicyException("Retention policy must be a JSON object")
+        return cls(default=data.get("default"), metrics=data.get("metrics"))
+
+    def period(self, tier: str, metric_name: Optional[str] = None) -> timedelta:
+        days = self.metrics.get(metric_name, {}).get(tier, self.default[tier])
+        return timedelta(days=days)
+
+    def overrides(self, tier: str) -> Dict[str, timedelta]:
+        """Metrics whose retention for `tier` differs from the default."""
+        return {
+            metric_name: timedelta(days=tiers[tier])
+            for metric_name, tiers in self.metrics.items()
+            if tier in tiers and tiers[tier] != self.default[tier]
+        }
+
+    def longest(self, tier: str) -> timedelta:
+        return max([self.period(tier)] + list(self.overrides(tier).values()))
+
+    def _validate(self, tiers: Dict, where: str) -> Dict[str, float]:
+        if not isinstance(tiers, dict):
+            raise InvalidRetentionPolicyException(f"'{where}' must be an object of tier -> days")
+        for tier, days in tiers.items():
+            if tier not in RETENTION_TIERS:
+                raise InvalidRetentionPolicyException(
+                    f"Unknown tier '{tier}' in '{where}'. Must be one of: {list(RETENTION_TIERS)}"
+                )
+            if isinstance(days, bool) or not isinstance(days, (int, float)) or days <= 0:
+                raise InvalidRetentionPolicyException(f"'{where}.{tier}' must be a positive number of days")
+        return dict(tiers)
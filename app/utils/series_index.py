@@ -0,0 +1,134 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.utils.label_utils import get_label_hashes, hash_labels
+from app import config
+from typing import Dict, Optional, Set
+import threading
+import time
+
+
+class SeriesIndex:
+    """Known series per metric, keyed by `hash_labels(labels)`.
+
+    Warmed once from the series that still have raw rows and kept current by
+    the write paths, so cardinality checks are set lookups instead of a
+    DISTINCT scan per ingest.
+    Metrics that were never loaded (or were invalidated) are reloaded lazily,
+    and the whole index is resynced every `resync_seconds` to pick up series
+    removed by retention running in another process.
+    """
+
+    def __init__(self, resync_seconds: float = 0):
+        self.resync_seconds = resync_seconds
+        self._series: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self._synced_at: Optional[float] = None
+
+    async def warm(self, db: AsyncSession) -> int:
+        series = await get_label_hashes(db)
+
+        with self._lock:
+            self._series = series
+            self._synced_at = time.monotonic()
+
+        return sum(len(hashes) for hashes in series.values())
+
+    async def resync(self, db: AsyncSession) -> int:
+        return await self.warm(db)
+
+    def invalidate(self, metric_name: Optional[str] = None) -> None:
+        with self._lock:
+            if metric_name is None:
+                self._series = {}
+                self._synced_at = None
+            else:
+                self._series.pop(metric_name, None)
+
+    async def contains(self, db: AsyncSession, metric_name: str, labels_hash: str) -> bool:
+        return labels_hash in await self._get(db, metric_name)
+
+    async def series_count(self, db: AsyncSession, metric_name: str) -> int:
+        return len(await self._get(db, metric_name))
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {metric_name: len(hashes) for metric_name, hashes in self._series.items()}
+
+    async def check(self, db: AsyncSession, metric_name: str, labels_hash: str, limit: Optional[int], pending: int = 0) -> bool:
+        hashes = await self._get(db, metric_name)
+        if labels_hash in hashes or limit is None:
+            return True
+        return len(hashes) + pending < limit
+
+    async def reserve(self, db: AsyncSession, metric_name: str, labels_hash: str, limit: Optional[int]) -> bool:
+        """Check a series against the index and add it in the same step.
+
+        For writers that acknowledge a point before its series reaches the
+        database: the series counts towards the limit from now on, so
+        concurrent new series cannot all pass against the same count. The
+        database is only read to load a metric that is not in memory yet.
+        """
+        hashes = await self._get(db, metric_name)
+        with self._lock:
+            if labels_hash in hashes:
+                return True
+            if limit is not None and len(hashes) >= limit:
+                return False
+            hashes.add(labels_hash)
+            return True
+
+    def add(self, metric_name: str, labels: Optional[Dict[str, str]]) -> None:
+        self.add_hash(metric_name, hash_labels(labels))
+
+    def add_hash(self, metric_name: str, labels_hash: str) -> None:
+        with self._lock:
+            if metric_name in self._series:
+                self._series[metric_name].add(labels_hash)
+
+    async def _get(self, db: AsyncSession, metric_name: str) -> Set[str]:
+        if self._is_stale():
+            self.invalidate()
+
+        with self._lock:
+            hashes = self._series.get(metric_name)
+        if hashes is not None:
+            return hashes
+
+        hashes = (await get_label_hashes(db, metric_name)).get(metric_name, set())
+        with self._lock:
+            if self._synced_at is None:
+                self._synced_at = time.monotonic()
+            return self._series.setdefault(metric_name, hashes)
+
+    def _is_stale(self) -> bool:
+        return (
+            self.resync_seconds > 0
+            and self._synced_at is not None
+            and time.monotonic() - self._synced_at > self.resync_seconds
+        )
+
+
+series_index = SeriesIndex(resync_seconds=config.SERIES_INDEX_RESYNC_SECONDS)
+
+
+async def check_cardinality(
+    db: AsyncSession,
+    metric_name: str,
+    labels: dict,
+    limit: int = None
+) -> bool:
+    if not labels:
+        return True
+
+    return await series_index.check(db, metric_name, hash_labels(labels), limit)
+
+
+async def reserve_series(
+    db: AsyncSession,
+    metric_name: str,
+    labels: dict,
+    limit: int = None
+) -> bool:
+    if not labels:
+        return True
+
+    return await series_index.reserve(db, metric_name, hash_labels(labels), limit)
@@ -0,0 +1,146 @@
+import json
+import math
+import sys
+from typing import Dict, Iterable, List, Optional
+
+# DDSketch with 1% relative accuracy: a value v > 0 is counted in bucket
+# ceil(log_gamma(v)), whose representative value is within 1% of v. Sketches
+# are plain {key: count} maps, so merging is adding counts per key, which the
+# database can do as well. Changing the accuracy invalidates stored sketches.
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+# Magnitudes below this are counted as zero
+MIN_INDEXABLE_VALUE = 1e-9
+# Highest key whose representative value is still a finite float; larger
+# magnitudes, infinity included, are counted in it
+MAX_KEY = math.floor(math.log(sys.float_info.max) / LOG_GAMMA)
+ZERO_KEY = "z"
+NEGATIVE_PREFIX = "n"
+
+Sketch = Dict[str, int]
+
+# PostgreSQL side: the same key as `sketch_key`, and a merge that, like
+# `merge_sketches`, is NULL when either side is NULL (a bucket with unknown
+# distribution stays unknown).
+SKETCH_KEY_SQL = f"""
+    CASE
+        WHEN value > {MIN_INDEXABLE_VALUE}
+            THEN least(ceil(ln(least(value, {sys.float_info.max!r})) / {LOG_GAMMA!r}), {MAX_KEY})::int::text
+        WHEN value < -{MIN_INDEXABLE_VALUE}
+            THEN '{NEGATIVE_PREFIX}' || least(ceil(ln(least(-value, {sys.float_info.max!r})) / {LOG_GAMMA!r}), {MAX_KEY})::int::text
+        ELSE '{ZERO_KEY}'
+    END
+"""
+
+SKETCH_MERGE_FUNCTION_SQL = """
+    CREATE OR REPLACE FUNCTION sketch_merge(a jsonb, b jsonb) RETURNS jsonb
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+        SELECT CASE WHEN a IS NULL OR b IS NULL THEN NULL ELSE (
+            SELECT coalesce(jsonb_object_agg(key, total), '{}'::jsonb)
+            FROM (
+                SELECT key, sum(value::bigint) AS total
+                FROM (SELECT * FROM jsonb_each_text(a) UNION ALL SELECT * FROM jsonb_each_text(b)) entries
+                GROUP BY key
+            ) merged
+        ) END
+    $$
+"""
+
+SKETCH_MERGE_AGGREGATE_SQL = """
+    CREATE OR REPLACE AGGREGATE sketch_merge_agg(jsonb) (
+        SFUNC = sketch_merge,
+        STYPE = jsonb,
+        INITCOND = '{}'
+    )
+"""
+
+
+def sketch_key(value: float) -> str:
+    if value > MIN_INDEXABLE_VALUE:
+        return str(_magnitude_key(value))
+    if value < -MIN_INDEXABLE_VALUE:
+        return f"{NEGATIVE_PREFIX}{_magnitude_key(-value)}"
+    return ZERO_KEY
+
+
+def _magnitude_key(magnitude: float) -> int:
+    if math.isinf(magnitude):
+        return MAX_KEY
+    return min(math.ceil(math.log(magnitude) / LOG_GAMMA), MAX_KEY)
+
+
+def new_sketch(values: Iterable[float]) -> Sketch:
+    sketch: Sketch = {}
+    for value in values:
+        key = sketch_key(value)
+        sketch[key] = sketch.get(key, 0) + 1
+    return sketch
+
+
+def add_to_sketch(sketch: Sketch, value: float) -> None:
+    key = sketch_key(value)
+    sketch[key] = sketch.get(key, 0) + 1
+
+
+def merge_sketches(sketch: Optional[Sketch], other: Optional[Sketch]) -> Optional[Sketch]:
+    if sketch is None or other is None:
+        return None
+    return merge_into(dict(sketch), other)
+
+
+def merge_into(sketch: Optional[Sketch], other: Optional[Sketch]) -> Optional[Sketch]:
+    """Add `other` into `sketch` in place and return it (None if either is None)."""
+    if sketch is None or other is None:
+        return None
+    for key, count in other.items():
+        sketch[key] = sketch.get(key, 0) + count
+    return sketch
+
+
+def sketch_merge_json(sketch: Optional[str], other: Optional[str]) -> Optional[str]:
+    """`sketch_merge` for SQLite, which stores JSON columns as text."""
+    if sketch is None or other is None:
+        return None
+    return json.dumps(merge_sketches(json.loads(sketch), json.loads(other)))
+
+
+def quantiles(
+    sketch: Optional[Sketch],
+    qs: List[float],
+    min_value: Optional[float] = None,
+    max_value: Optional[float] = None
+) -> Dict[float, Optional[float]]:
+    """Estimate each quantile in `qs` (0..1) from a sketch.
+
+    Estimates are clamped to the bucket's exact min/max when given, so q=0
+    and q=1 are exact. Returns None for every quantile when there is no sketch.
+    """
+    if not sketch:
+        return {q: None for q in qs}
+
+    ordered = sorted((_key_value(key), key, count) for key, count in sketch.items())
+    total = sum(count for _, _, count in ordered)
+    estimates: Dict[float, Optional[float]] = {}
+    for q in qs:
+        rank = q * (total - 1)
+        seen = 0
+        for _, key, count in ordered:
+            seen += count
+            if seen > rank:
+                break
+        estimate = _key_value(key)
+        if min_value is not None:
+            estimate = max(estimate, min_value)
+        if max_value is not None:
+            estimate = min(estimate, max_value)
+        estimates[q] = estimate
+    return estimates
+
+
+def _key_value(key: str) -> float:
+    if key == ZERO_KEY:
+        return 0.0
+    if key.startswith(NEGATIVE_PREFIX):
+        return -_key_value(key[len(NEGATIVE_PREFIX):])
+    return 2 * GAMMA ** int(key) / (GAMMA + 1)
@@ -1,24 +1,34 @@
-from datetime import datetime,timedelta
+from datetime import datetime,timedelta,timezone
 from typing import List,Tuple
 
+WINDOW_UNITS={
+    "s":timedelta(seconds=1),
+    "m":timedelta(minutes=1),
+    "h":timedelta(hours=1),
+    "d":timedelta(days=1),
+    "w":timedelta(weeks=1)
+}
+
 def parse_window(window:str)->timedelta:
-    window_map={
-        "1m":timedelta(minutes=1),
-        "5m":timedelta(minutes=5),
-        "1h":timedelta(hours=1)
-    }
-    if window not in window_map:
+    """Parse a window such as 30s, 15m, 6h, 1d or 2w."""
+    count,unit=window[:-1],window[-1:]
+    if unit not in WINDOW_UNITS or not (count.isascii() and count.isdigit()) or int(count)==0:
         raise ValueError(f"Unsupported window: {window}")
     
-    return window_map[window]
+    return int(count)*WINDOW_UNITS[unit]
+
+EPOCH=datetime(1970,1,1)
 
 def round_to_window(dt:datetime,window:str)->datetime:
-    window_delta=parse_window(window)
-    timestamp=dt.timestamp()
-    window_seconds=window_delta.total_seconds()
-    rounded_timestamp=(timestamp//window_seconds)*window_seconds
+    """Floor `dt` to the window grid anchored at the UTC epoch, like date_bin in SQL.
 
-    return datetime.fromtimestamp(rounded_timestamp,tz=dt.tzinfo)
+    Naive datetimes are UTC, whatever the server's local time zone is.
+    """
+    window_delta=parse_window(window)
+    if dt.tzinfo is None:
+        return EPOCH+((dt-EPOCH)//window_delta)*window_delta
+    epoch=EPOCH.replace(tzinfo=timezone.utc)
+    return (epoch+((dt-epoch)//window_delta)*window_delta).astimezone(dt.tzinfo)
 
 def generate_time_buckets(start_time:datetime,end_time:datetime,window:str)->List[Tuple[datetime,datetime]]:
     window_delta=parse_window(window)
@@ -28,4 +38,20 @@ def generate_time_buckets(start_time:datetime,end_time:datetime,window:str)->Lis
         bucket_end=current+window_delta
         buckets.append((current,bucket_end))
         current=bucket_end
-    return buckets
\ No newline at end of file
+    return buckets
+
+def to_utc_naive(dt:datetime)->datetime:
+    if dt.tzinfo is None:
+        return dt
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+def ceil_to_window(dt:datetime,window:str)->datetime:
+    rounded=round_to_window(dt,window)
+    return rounded if rounded==dt else rounded+parse_window(window)
+
+def format_window(delta:timedelta)->str:
+    """Inverse of parse_window, using the largest unit that divides `delta`."""
+    for unit,unit_delta in sorted(WINDOW_UNITS.items(),key=lambda item:item[1],reverse=True):
+        if delta%unit_delta==timedelta(0):
+            return f"{delta//unit_delta}{unit}"
+    raise ValueError(f"Window {delta} is not a whole number of seconds")
@@ -90,7 +90,9 @@ async function loadData() {
         let url;
         
         if (rollup === 'raw') {
-            url = `${API_URL}/query/raw?metric_name=${metric}&start_time=${startTime}&end_time=${endTime}`;
+            // One point per pixel of chart width is all the chart can show
+            const maxPoints = Math.max(3, document.getElementById('chart').clientWidth);
+            url = `${API_URL}/query/raw?metric_name=${metric}&start_time=${startTime}&end_time=${endTime}&max_points=${maxPoints}`;
         } else {
             url = `${API_URL}/query/rollup?metric_name=${metric}&start_time=${startTime}&end_time=${endTime}&window=${rollup}`;
         }
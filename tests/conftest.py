@@ -0,0 +1,70 @@
+import asyncio
+import os
+
+import pytest
+
+# app.db builds its engines at import; they only connect when used
+os.environ.setdefault("DB_URL", "postgresql://localhost/metrics_test")
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import app.models  # noqa: F401 - registers every table on Base
+from app.db import Base
+from app.services.series_service import clear_series_cache
+from app.utils.query_cache import query_cache
+from app.utils.series_index import series_index
+from app.utils.sketch import SKETCH_MERGE_AGGREGATE_SQL, SKETCH_MERGE_FUNCTION_SQL
+
+
+class Database:
+    """A fresh SQLite file with every table, reachable from sync and async sessions."""
+
+    def __init__(self, path):
+        self.engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(self.engine)
+        self.async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        self.Session = sessionmaker(bind=self.engine, autoflush=False)
+        self.AsyncSession = async_sessionmaker(self.async_engine, autoflush=False, expire_on_commit=False)
+
+    def close(self):
+        self.engine.dispose()
+        asyncio.run(self.async_engine.dispose())
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = Database(tmp_path / "metrics.db")
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def postgres():
+    """Sync sessions on the PostgreSQL database in TEST_POSTGRES_URL, emptied first.
+
+    For the PostgreSQL-only features (partitioning, the SQL rollup engine);
+    skipped without it.
+    """
+    url = os.getenv("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA public CASCADE"))
+        conn.execute(text("CREATE SCHEMA public"))
+        conn.execute(text(SKETCH_MERGE_FUNCTION_SQL))
+        conn.execute(text(SKETCH_MERGE_AGGREGATE_SQL))
+    Base.metadata.create_all(engine)
+    yield sessionmaker(bind=engine, autoflush=False)
+    engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches():
+    """Process-wide caches would otherwise carry ids and results from one test's database into the next."""
+    series_index.invalidate()
+    clear_series_cache()
+    query_cache.invalidate()
+    yield
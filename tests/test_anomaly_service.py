@@ -0,0 +1,70 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+from app.controllers.anomaly_controller import AnomalyController
+from app.models import RawMetrics
+from app.services.anomaly_service import AnomalyService
+
+START = datetime(2024, 6, 1, 12)
+VALUES = [10.0, 11.0, 9.0, 10.5, 9.5, 10.0, 50.0, 10.0, 10.5, 9.0]
+
+
+def add_points(database):
+    with database.Session() as db:
+        db.add_all(
+            RawMetrics(metric_name="cpu", series_id=1, timestamp=START + timedelta(seconds=15 * index), value=value)
+            for index, value in enumerate(VALUES)
+        )
+        db.commit()
+
+
+def detect(database, method, **kwargs):
+    async def run():
+        async with database.AsyncSession() as db:
+            return await getattr(AnomalyService(db), method)("cpu", START, START + timedelta(hours=1), 2.0, **kwargs)
+    return asyncio.run(run())
+
+
+def test_columns_match_the_point_models(database):
+    add_points(database)
+
+    response = detect(database, "detect_anomalies")
+    columns = detect(database, "detect_anomalies_columns")
+
+    assert columns["anomalies_found"] == response.anomalies_found == 1
+    assert (columns["total_points"], columns["mean"], columns["std_dev"], columns["threshold"]) == (
+        response.total_points, response.mean, response.std_dev, response.threshold
+    )
+    assert columns["columns"] == {
+        "timestamp": [1717243200000 + 15000 * index for index in range(len(VALUES))],
+        "value": [point.value for point in response.points],
+        "z_score": [point.z_score for point in response.points],
+        "is_anomaly": [point.is_anomaly for point in response.points]
+    }
+    assert columns["columns"]["is_anomaly"].index(True) == VALUES.index(50.0)
+
+
+def test_too_few_points_give_empty_columns(database):
+    with database.Session() as db:
+        db.add(RawMetrics(metric_name="cpu", series_id=1, timestamp=START, value=1.0))
+        db.commit()
+
+    columns = detect(database, "detect_anomalies_columns")
+
+    assert columns["total_points"] == 1
+    assert columns["columns"] == {"timestamp": [], "value": [], "z_score": [], "is_anomaly": []}
+
+
+def test_controller_encodes_columnar_responses(database):
+    add_points(database)
+
+    async def run():
+        async with database.AsyncSession() as db:
+            return await AnomalyController.detect_anomalies(
+                "cpu", START, START + timedelta(hours=1), 2.0, None, db, format="columnar"
+            )
+    response = asyncio.run(run())
+
+    assert response.media_type == "application/json"
+    assert json.loads(response.body)["columns"]["value"] == VALUES
@@ -0,0 +1,24 @@
+import asyncio
+from datetime import datetime
+
+from app.models import RawMetrics
+from app.schemas.backfill import BackfillRequest
+from app.services.backfill_service import BackfillService
+
+
+def test_import_stores_offset_timestamps_as_naive_utc(database):
+    request = BackfillRequest.model_validate({"metrics": [
+        {"metric_name": "cpu", "value": 1.0, "timestamp": "2024-06-01T12:00:00+02:00", "labels": {"host": "a"}},
+        {"metric_name": "cpu", "value": 2.0, "timestamp": "2024-06-01T12:00:00Z", "labels": {"host": "a"}}
+    ]})
+
+    async def run():
+        async with database.AsyncSession() as db:
+            return await BackfillService(db).import_metrics(request)
+
+    response = asyncio.run(run())
+    assert response.metrics_imported == 2
+
+    with database.Session() as db:
+        timestamps = sorted(row.timestamp for row in db.query(RawMetrics))
+    assert timestamps == [datetime(2024, 6, 1, 10), datetime(2024, 6, 1, 12)]
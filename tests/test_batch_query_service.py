@@ -0,0 +1,107 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from pydantic import ValidationError
+
+import app.services.batch_query_service as batch_query_service
+from app import config
+from app.controllers.query_controller import QueryController
+from app.models import RawMetrics, RollupMetrics, Series
+from app.schemas.query import BatchQueryRequest, BatchQueryResponse, BatchQuerySpec
+from app.services.batch_query_service import BatchQueryService
+from app.services.query_service import QueryService
+from app.utils.label_utils import hash_labels
+
+START = datetime(2024, 6, 1, 12)
+END = START + timedelta(hours=1)
+
+
+@pytest.fixture
+def batch_database(database, monkeypatch):
+    monkeypatch.setattr(batch_query_service, "AsyncSessionLocal", database.AsyncSession)
+    # A fresh semaphore on each test's event loop
+    monkeypatch.setattr(batch_query_service, "_slots", asyncio.Semaphore(2))
+    with database.Session() as db:
+        for series_id, metric_name in ((1, "cpu"), (2, "mem")):
+            db.add(Series(series_id=series_id, metric_name=metric_name, labels={"host": "a"}, labels_hash=hash_labels({"host": "a"})))
+            db.add_all(
+                RawMetrics(metric_name=metric_name, series_id=series_id, timestamp=START + timedelta(minutes=minute), value=float(minute))
+                for minute in range(3)
+            )
+            db.add(RollupMetrics(metric_name=metric_name, series_id=series_id, window="1m", start_time=START,
+                                 end_time=START + timedelta(minutes=1), min=0.0, max=0.0, sum=0.0, avg=0.0, count=1))
+        db.commit()
+    return database
+
+
+def spec(type, metric_name, **kwargs):
+    return BatchQuerySpec(type=type, metric_name=metric_name, start_time=START, end_time=END, **kwargs)
+
+
+def test_results_come_back_in_request_order(batch_database):
+    specs = [spec("rollup", "mem", window="1m"), spec("raw", "cpu"), spec("raw", "mem", labels={"host": "a"})]
+
+    response = asyncio.run(BatchQueryService().run(specs))
+
+    assert (response["total_queries"], response["failed_queries"]) == (3, 0)
+    assert [(result["type"], result["metric_name"], result["status_code"]) for result in response["results"]] == [
+        ("rollup", "mem", 200), ("raw", "cpu", 200), ("raw", "mem", 200)
+    ]
+    assert [point.count for point in response["results"][0]["result"].points] == [1]
+    assert [point.value for point in response["results"][1]["result"].points] == [0.0, 1.0, 2.0]
+
+    async def alone():
+        async with batch_database.AsyncSession() as db:
+            return await QueryService(db).query_raw_data("mem", START, END, {"host": "a"})
+    assert response["results"][2]["result"].points == asyncio.run(alone())["points"]
+
+
+def test_a_failing_query_does_not_fail_the_batch(batch_database):
+    specs = [spec("raw", "cpu"), spec("rollup", "cpu", window="30s")]
+
+    response = asyncio.run(BatchQueryService().run(specs))
+
+    assert response["failed_queries"] == 1
+    ok, failed = response["results"]
+    assert (ok["status_code"], ok["error"]) == (200, None)
+    assert (failed["status_code"], failed["result"]) == (400, None)
+    assert failed["error"].startswith("Invalid window '30s'")
+
+
+def test_queries_run_concurrently_up_to_the_limit(batch_database, monkeypatch):
+    running = []
+    peak = []
+
+    async def slow_query(self, **kwargs):
+        running.append(kwargs["metric_name"])
+        peak.append(len(running))
+        await asyncio.sleep(0.05)
+        running.remove(kwargs["metric_name"])
+        return {"metric_name": kwargs["metric_name"], "points": [], "total_points": 0}
+
+    monkeypatch.setattr(QueryService, "query_raw_data", slow_query)
+
+    response = asyncio.run(BatchQueryService().run([spec("raw", f"m{index}") for index in range(5)]))
+
+    assert response["failed_queries"] == 0
+    assert max(peak) == 2
+
+
+def test_controller_runs_the_batch(batch_database):
+    request = BatchQueryRequest(queries=[spec("raw", "cpu"), spec("raw", "missing")])
+
+    response = BatchQueryResponse.model_validate(asyncio.run(QueryController.query_batch(request)))
+
+    assert [result.result.total_points for result in response.results] == [3, 0]
+    assert response.failed_queries == 0
+
+
+def test_batch_requests_are_validated(monkeypatch):
+    monkeypatch.setattr(config, "QUERY_BATCH_MAX_QUERIES", 2)
+    with pytest.raises(ValidationError, match="window is required"):
+        BatchQuerySpec(type="rollup", metric_name="cpu", start_time=START, end_time=END)
+    with pytest.raises(ValidationError, match="cannot be empty"):
+        BatchQueryRequest(queries=[])
+    with pytest.raises(ValidationError, match="more than 2 queries"):
+        BatchQueryRequest(queries=[spec("raw", "cpu")] * 3)
@@ -0,0 +1,59 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from app.utils import columnar
+from app.utils.columnar import check_format, encode, epoch_ms
+
+RESULT = {
+    "metric_name": "cpu",
+    "total_points": 2,
+    "columns": {"timestamp": [1717243200000, 1717243200500], "value": [1.5, -2.0]}
+}
+
+
+def test_epoch_ms_of_naive_utc_timestamps():
+    assert epoch_ms([datetime(1970, 1, 1), datetime(2024, 6, 1, 12, 0, 0, 500999)]) == [0, 1717243200500]
+    assert epoch_ms([datetime(1969, 12, 31, 23, 59, 59, 999500)]) == [-1]
+
+
+def test_columnar_is_compact_json():
+    body, media_type = encode("columnar", RESULT)
+
+    assert media_type == "application/json"
+    assert b" " not in body
+    assert json.loads(body) == RESULT
+
+
+def test_msgpack_round_trip():
+    msgpack = pytest.importorskip("msgpack")
+
+    body, media_type = encode("msgpack", RESULT)
+
+    assert media_type == "application/msgpack"
+    assert msgpack.unpackb(body) == RESULT
+
+
+def test_arrow_round_trip():
+    pa = pytest.importorskip("pyarrow")
+
+    body, media_type = encode("arrow", RESULT)
+
+    assert media_type == "application/vnd.apache.arrow.stream"
+    table = pa.ipc.open_stream(body).read_all()
+    assert table.schema.field("timestamp").type == pa.timestamp("ms", tz="UTC")
+    assert table.column("value").to_pylist() == [1.5, -2.0]
+    assert [value.value for value in table.column("timestamp")] == RESULT["columns"]["timestamp"]
+    assert {key.decode(): json.loads(value) for key, value in table.schema.metadata.items()} == {
+        "metric_name": "cpu", "total_points": 2
+    }
+
+
+def test_check_format(monkeypatch):
+    check_format("columnar", ("json", "columnar"))
+    with pytest.raises(ValueError, match="Invalid format 'csv'"):
+        check_format("csv", ("json", "columnar"))
+    monkeypatch.setattr(columnar, "msgpack", None)
+    with pytest.raises(ValueError, match="pip install msgpack"):
+        check_format("msgpack", ("json", "msgpack"))
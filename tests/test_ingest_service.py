@@ -0,0 +1,58 @@
+import asyncio
+from datetime import datetime
+
+from app.models import RawMetrics, Series
+from app.schemas.ingest import BatchIngestRequest
+from app.services.ingest_service import IngestService
+
+
+def ingest_batch(database, request, cardinality_limit=100):
+    async def run():
+        async with database.AsyncSession() as db:
+            return await IngestService(db, cardinality_limit).ingest_batch(BatchIngestRequest.model_validate(request))
+    return asyncio.run(run())
+
+
+def test_batch_writes_single_metrics_and_series_points(database):
+    response = ingest_batch(database, {
+        "metrics": [
+            {"metric_name": "cpu", "value": 1.0, "timestamp": "2024-06-01T12:00:00Z", "labels": {"host": "a"}},
+            {"metric_name": "cpu", "value": 2.0, "timestamp": "2024-06-01T12:00:10Z", "labels": {"host": "a"}}
+        ],
+        "series": [
+            {"metric_name": "mem", "labels": {"host": "a"}, "points": [["2024-06-01T12:00:00Z", 3.0], ["2024-06-01T12:00:10Z", 4.0]]}
+        ]
+    })
+
+    assert (response.status, response.accepted, response.rejected) == ("success", 4, 0)
+    with database.Session() as db:
+        series = {row.series_id: row.metric_name for row in db.query(Series)}
+        rows = sorted((series[row.series_id], row.timestamp, row.value) for row in db.query(RawMetrics))
+    assert sorted(series.values()) == ["cpu", "mem"]
+    assert rows == [
+        ("cpu", datetime(2024, 6, 1, 12), 1.0),
+        ("cpu", datetime(2024, 6, 1, 12, 0, 10), 2.0),
+        ("mem", datetime(2024, 6, 1, 12), 3.0),
+        ("mem", datetime(2024, 6, 1, 12, 0, 10), 4.0)
+    ]
+
+
+def test_series_past_the_cardinality_limit_are_rejected_whole(database):
+    response = ingest_batch(database, {
+        "series": [
+            {"metric_name": "cpu", "labels": {"host": host}, "points": [["2024-06-01T12:00:00Z", 1.0], ["2024-06-01T12:00:10Z", 2.0]]}
+            for host in ("a", "b", "c")
+        ]
+    }, cardinality_limit=2)
+
+    assert (response.status, response.accepted, response.rejected) == ("partial", 4, 2)
+    assert response.errors == ["Cardinality limit of 2 exceeded for metric 'cpu' (labels {'host': 'c'})"]
+
+    # Known series keep being accepted, new ones are still rejected
+    response = ingest_batch(database, {
+        "series": [
+            {"metric_name": "cpu", "labels": {"host": host}, "points": [["2024-06-01T12:01:00Z", 1.0]]}
+            for host in ("a", "d")
+        ]
+    }, cardinality_limit=2)
+    assert (response.accepted, response.rejected) == (1, 1)
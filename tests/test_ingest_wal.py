@@ -0,0 +1,97 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+from app.models import IngestWalSegment, RawMetrics, Series
+from app.services import ingest_wal as ingest_wal_module
+from app.services.ingest_wal import IngestWal
+
+
+def make_wal(database, tmp_path, monkeypatch, **options):
+    monkeypatch.setattr(ingest_wal_module, "AsyncSessionLocal", database.AsyncSession)
+    settings = {"segment_bytes": 1 << 20, "fsync_interval_ms": 1, "rotate_seconds": 60, "capacity": 1000}
+    settings.update(options)
+    return IngestWal(str(tmp_path / "wal"), **settings)
+
+
+def row(second, host="a"):
+    return {"metric_name": "cpu", "value": float(second), "timestamp": datetime(2024, 6, 1, 12) + timedelta(seconds=second),
+            "labels": {"host": host}}
+
+
+def stored_values(database):
+    with database.Session() as db:
+        return sorted(row.value for row in db.query(RawMetrics))
+
+
+def test_acknowledged_appends_are_replayed_into_raw_metrics(database, tmp_path, monkeypatch):
+    wal = make_wal(database, tmp_path, monkeypatch, segment_bytes=400)
+
+    async def run():
+        await wal.start()
+        for second in range(10):
+            await wal.append(row(second, host="a" if second % 2 else "b"))
+        await wal.stop()
+
+    asyncio.run(run())
+    assert stored_values(database) == [float(second) for second in range(10)]
+    with database.Session() as db:
+        assert db.query(Series).count() == 2
+        # Small segments rotated several times, each recorded with its rows
+        markers = db.query(IngestWalSegment).all()
+    assert len(markers) > 1
+    assert sum(marker.rows for marker in markers) == 10
+    assert list((tmp_path / "wal").iterdir()) == []
+
+
+def test_a_segment_already_marked_as_replayed_is_not_loaded_twice(database, tmp_path, monkeypatch):
+    wal = make_wal(database, tmp_path, monkeypatch)
+    directory = tmp_path / "wal"
+    directory.mkdir()
+    lines = [json.dumps({**row(second), "timestamp": row(second)["timestamp"].isoformat()}) for second in range(3)]
+    (directory / "0000000000001-1-000001.wal").write_text("\n".join(lines) + "\n")
+    (directory / "0000000000001-1-000002.wal").write_text("\n".join(lines) + "\n")
+    with database.Session() as db:
+        # The first one was committed before the previous process could unlink it
+        db.add(IngestWalSegment(segment="0000000000001-1-000001.wal", rows=3))
+        db.commit()
+
+    async def run():
+        await wal.start()
+        await wal.stop()
+
+    asyncio.run(run())
+    assert stored_values(database) == [0.0, 1.0, 2.0]
+    assert list(directory.iterdir()) == []
+
+
+def test_a_torn_last_record_is_skipped(database, tmp_path, monkeypatch):
+    wal = make_wal(database, tmp_path, monkeypatch)
+    directory = tmp_path / "wal"
+    directory.mkdir()
+    record = json.dumps({**row(0), "timestamp": row(0)["timestamp"].isoformat()})
+    (directory / "0000000000001-1-000001.wal").write_text(record + "\n" + record[:20])
+
+    async def run():
+        await wal.start()
+        await wal.stop()
+
+    asyncio.run(run())
+    assert stored_values(database) == [0.0]
+
+
+def test_a_new_segment_syncs_its_directory_before_the_first_ack(database, tmp_path, monkeypatch):
+    wal = make_wal(database, tmp_path, monkeypatch)
+    synced = []
+    fsync = ingest_wal_module.os.fsync
+    monkeypatch.setattr(ingest_wal_module.os, "fsync", lambda fd: (synced.append(fd), fsync(fd)))
+
+    async def run():
+        await wal.start()
+        await wal.append(row(0))
+        await wal.append(row(1))
+        await wal.stop()
+
+    asyncio.run(run())
+    # Directory then segment for the first append, the segment alone afterwards
+    assert len(synced) == 3
@@ -0,0 +1,93 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import delete
+
+from app import config
+from app.models import RawMetrics, RollupMetrics
+from app.services.rollup_service import RollupService
+from app.utils.numpy_rollup import aggregate_windows
+from app.utils.sketch import new_sketch
+
+np = pytest.importorskip("numpy")
+
+START = datetime(2024, 6, 1, 12)
+WINDOW_SECONDS = {"1m": 60, "5m": 300, "1h": 3600}
+
+
+def random_points(count, seed=7):
+    rng = random.Random(seed)
+    return [
+        (rng.randint(1, 4), START + timedelta(seconds=rng.uniform(0, 2 * 3600)), rng.choice([0.0, -1.5, rng.uniform(-50, 50)]))
+        for _ in range(count)
+    ]
+
+
+def test_aggregate_windows_matches_grouping_in_python():
+    points = random_points(2000)
+    series_ids, timestamps, values = zip(*points)
+
+    results = aggregate_windows(series_ids, timestamps, values, WINDOW_SECONDS)
+
+    for window, seconds in WINDOW_SECONDS.items():
+        expected = {}
+        for series_id, timestamp, value in points:
+            bucket = START + (timestamp - START) // timedelta(seconds=seconds) * timedelta(seconds=seconds)
+            expected.setdefault((series_id, bucket), []).append(value)
+
+        ids, starts, mins, maxes, sums, counts, sketches = results[window]
+        groups = {
+            (series_id, start.astype(datetime)): (low, high, total, count, sketch)
+            for series_id, start, low, high, total, count, sketch
+            in zip(ids.tolist(), starts, mins.tolist(), maxes.tolist(), sums.tolist(), counts.tolist(), sketches)
+        }
+        assert groups.keys() == expected.keys()
+        for key, group_values in expected.items():
+            low, high, total, count, sketch = groups[key]
+            assert (low, high, count) == (min(group_values), max(group_values), len(group_values))
+            assert total == pytest.approx(sum(group_values))
+            assert sketch == new_sketch(group_values)
+
+
+def test_aggregate_windows_of_nothing():
+    assert aggregate_windows([], [], [], WINDOW_SECONDS) == {}
+
+
+def rollup_with(Session, monkeypatch, engine):
+    monkeypatch.setattr(config, "ROLLUP_ENGINE", engine)
+    with Session() as db:
+        db.execute(delete(RollupMetrics))
+        stats = asyncio.run(RollupService(db).perform_rollups("cpu", START - timedelta(seconds=1), START + timedelta(hours=2)))
+        db.commit()
+        rows = [
+            (row.series_id, row.window, row.start_time, row.end_time, row.min, row.max, row.count, row.sketch,
+             pytest.approx(row.sum), pytest.approx(row.avg))
+            for row in db.query(RollupMetrics).order_by(RollupMetrics.series_id, RollupMetrics.window, RollupMetrics.start_time)
+        ]
+    return stats["raw_metrics_processed"], rows
+
+
+def add_points(Session, points):
+    with Session() as db:
+        db.add_all(
+            RawMetrics(metric_name="cpu", series_id=series_id, timestamp=timestamp, value=value)
+            for series_id, timestamp, value in points
+        )
+        db.commit()
+
+
+def test_numpy_engine_matches_python_engine(database, monkeypatch):
+    add_points(database.Session, random_points(1500))
+    # Small chunks, so buckets are merged across chunks as well
+    monkeypatch.setattr(config, "ROLLUP_NUMPY_CHUNK_ROWS", 97)
+
+    assert rollup_with(database.Session, monkeypatch, "numpy") == rollup_with(database.Session, monkeypatch, "python")
+
+
+def test_numpy_engine_matches_sql_engine(postgres, monkeypatch):
+    add_points(postgres, random_points(1500))
+    monkeypatch.setattr(config, "ROLLUP_NUMPY_CHUNK_ROWS", 97)
+
+    assert rollup_with(postgres, monkeypatch, "numpy") == rollup_with(postgres, monkeypatch, "sql")
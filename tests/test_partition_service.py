@@ -0,0 +1,70 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+
+from app.models import RawMetrics
+from app.services.partition_service import RAW_TABLE, PartitionService, partition_name, rollup_parent
+
+
+def partitioned(Session):
+    with Session() as db:
+        PartitionService(db).migrate()
+
+
+def add_raw(Session, *timestamps):
+    with Session() as db:
+        db.add_all(RawMetrics(metric_name="cpu", value=1.0, timestamp=timestamp, series_id=1) for timestamp in timestamps)
+        db.commit()
+
+
+def count(Session, table):
+    with Session() as db:
+        return db.execute(text(f'SELECT count(*) FROM "{table}"')).scalar()
+
+
+def test_sqlite_is_left_alone(database):
+    with database.Session() as db:
+        service = PartitionService(db)
+        service.migrate()
+        assert not service.supported()
+        assert service.ensure_partitions(3) == 0
+
+
+def test_premade_days_cover_raw_and_every_rollup_window(postgres):
+    partitioned(postgres)
+    with postgres() as db:
+        service = PartitionService(db)
+        assert service.ensure_partitions(2, start=date(2024, 6, 1)) == 4 * 3
+        # Existing days are not created again
+        assert service.ensure_partitions(2, start=date(2024, 6, 1)) == 0
+        for parent in (RAW_TABLE, rollup_parent("1m"), rollup_parent("5m"), rollup_parent("1h")):
+            assert [day for _, day in service.daily_partitions(parent)] == [
+                date(2024, 6, 1), date(2024, 6, 2), date(2024, 6, 3)
+            ]
+
+
+def test_rows_that_reached_the_default_partition_move_into_their_new_day(postgres):
+    partitioned(postgres)
+    add_raw(postgres, datetime(2024, 6, 1, 12), datetime(2024, 6, 1, 23, 59), datetime(2024, 6, 2, 1))
+    assert count(postgres, f"{RAW_TABLE}_default") == 3
+
+    with postgres() as db:
+        assert PartitionService(db).ensure_partitions(0, start=date(2024, 6, 1)) == 4
+
+    assert count(postgres, partition_name(RAW_TABLE, date(2024, 6, 1))) == 2
+    assert count(postgres, f"{RAW_TABLE}_default") == 1
+    assert count(postgres, RAW_TABLE) == 3
+
+
+def test_only_whole_days_before_the_cutoff_are_dropped(postgres):
+    partitioned(postgres)
+    with postgres() as db:
+        PartitionService(db).ensure_partitions(2, start=date(2024, 6, 1))
+    add_raw(postgres, *(datetime(2024, 6, 1) + timedelta(hours=hours) for hours in range(0, 72, 6)))
+
+    with postgres() as db:
+        service = PartitionService(db)
+        dropped, _ = service.drop_partitions_before(RAW_TABLE, datetime(2024, 6, 2, 12))
+        assert dropped == 1
+        assert [day for _, day in service.daily_partitions(RAW_TABLE)] == [date(2024, 6, 2), date(2024, 6, 3)]
+    assert count(postgres, RAW_TABLE) == 8
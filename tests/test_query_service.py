@@ -0,0 +1,139 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import app.services.query_service as query_service
+import app.services.rollup_service as rollup_service
+from app import config
+from app.controllers.ingest_controller import IngestController
+from app.models import RollupMetrics, Series
+from app.schemas.ingest import IngestRequest
+from app.services.query_service import QueryService
+from app.services.rollup_service import RollupService
+from app.utils.query_cache import MemoryCacheBackend, QueryCache
+
+
+class FakeResult:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def partitions(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+class FakeSession:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def stream(self, query):
+        return FakeResult(self.chunks)
+
+
+def reject_constant(name):
+    raise AssertionError(f"{name} is not valid JSON")
+
+
+def stream_lines(chunks):
+    async def collect():
+        service = QueryService(FakeSession(chunks))
+        body = b"".join([chunk async for chunk in service.stream_raw_data("cpu", datetime(2024, 6, 1), datetime(2024, 6, 2))])
+        return body.decode().splitlines()
+    return asyncio.run(collect())
+
+
+def test_stream_raw_data_writes_non_finite_values_as_null():
+    timestamp = datetime(2024, 6, 1, 12)
+    lines = stream_lines([
+        [(timestamp, 1.5), (timestamp, float("nan"))],
+        [(timestamp, float("inf")), (timestamp, float("-inf"))]
+    ])
+
+    # Every line must be strict JSON, which has no NaN or Infinity
+    values = [json.loads(line, parse_constant=reject_constant)["value"] for line in lines]
+    assert values == [1.5, None, None, None]
+    assert json.loads(lines[0])["timestamp"] == "2024-06-01T12:00:00"
+
+
+def ingest(database, value, timestamp):
+    async def run():
+        async with database.AsyncSession() as db:
+            await IngestController.ingest_metric(
+                IngestRequest(metric_name="cpu", value=value, timestamp=timestamp, labels={"host": "a"}), db
+            )
+    asyncio.run(run())
+
+
+def rollup_counts(database):
+    async def run():
+        async with database.AsyncSession() as db:
+            result = await QueryService(db).query_rollup_data(
+                "cpu", datetime(2024, 6, 1, 12), datetime(2024, 6, 1, 13), "1m"
+            )
+        return [(point.timestamp, point.count) for point in result["points"]]
+    return asyncio.run(run())
+
+
+def test_rollup_merges_in_another_process_reach_the_query_cache(database, monkeypatch):
+    monkeypatch.setattr(config, "QUERY_CACHE_ENABLED", True)
+    api_cache = QueryCache(MemoryCacheBackend(max_bytes=1 << 20))
+    monkeypatch.setattr(query_service, "query_cache", api_cache)
+    # The rollup job's invalidations only reach its own memory
+    monkeypatch.setattr(rollup_service, "query_cache", QueryCache(MemoryCacheBackend(max_bytes=1 << 20)))
+    initial_watermark = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=1)
+
+    ingest(database, 1.0, datetime(2024, 6, 1, 12, 0, 30))
+    with database.Session() as db:
+        asyncio.run(RollupService(db).run(initial_watermark))
+    assert rollup_counts(database) == [(datetime(2024, 6, 1, 12), 1)]
+    assert rollup_counts(database) == [(datetime(2024, 6, 1, 12), 1)]
+    assert api_cache.hits == 1
+
+    ingest(database, 2.0, datetime(2024, 6, 1, 12, 0, 40))
+    with database.Session() as db:
+        asyncio.run(RollupService(db).run(initial_watermark))
+    assert rollup_counts(database) == [(datetime(2024, 6, 1, 12), 2)]
+
+
+def test_reaggregated_buckets_stay_within_the_requested_range(database):
+    with database.Session() as db:
+        db.add(Series(series_id=1, metric_name="cpu", labels={}, labels_hash="h"))
+        db.add_all(
+            RollupMetrics(
+                metric_name="cpu", series_id=1, window="5m",
+                start_time=datetime(2024, 6, 1, 12) + timedelta(minutes=minute),
+                end_time=datetime(2024, 6, 1, 12) + timedelta(minutes=minute + 5),
+                min=1.0, max=1.0, avg=1.0, sum=5.0, count=5
+            )
+            for minute in range(0, 60, 5)
+        )
+        db.commit()
+
+    async def buckets(start_time, end_time):
+        async with database.AsyncSession() as db:
+            result = await QueryService(db).query_rollup_data("cpu", start_time, end_time, "15m")
+        return [(point.timestamp, point.count) for point in result["points"]]
+
+    assert asyncio.run(buckets(datetime(2024, 6, 1, 12, 7), datetime(2024, 6, 1, 12, 50))) == [
+        (datetime(2024, 6, 1, 12, 15), 15),
+        (datetime(2024, 6, 1, 12, 30), 15)
+    ]
+    assert asyncio.run(buckets(datetime(2024, 6, 1, 12), datetime(2024, 6, 1, 13)))[0] == (datetime(2024, 6, 1, 12), 15)
+
+
+def test_raw_columns_match_the_raw_points(database):
+    for seconds, value in ((0, 1.0), (20, 3.5), (40, -2.0)):
+        ingest(database, value, datetime(2024, 6, 1, 12, 0, seconds))
+
+    async def run():
+        async with database.AsyncSession() as db:
+            service = QueryService(db)
+            args = ("cpu", datetime(2024, 6, 1, 12), datetime(2024, 6, 1, 13), {"host": "a"})
+            return await service.query_raw_data(*args), await service.query_raw_columns(*args)
+    points, columns = asyncio.run(run())
+
+    assert columns["total_points"] == points["total_points"] == 3
+    assert columns["columns"] == {
+        "timestamp": [1717243200000, 1717243220000, 1717243240000],
+        "value": [point.value for point in points["points"]]
+    }
@@ -0,0 +1,107 @@
+import asyncio
+import json
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import text
+
+from app import config
+from app.models import RawMetrics, RollupMetrics
+from app.services.partition_service import RAW_TABLE, PartitionService
+from app.services.retention_service import RetentionService
+from app.utils.retention_policy import InvalidRetentionPolicyException, RetentionPolicy
+
+
+@pytest.fixture(autouse=True)
+def small_batches(monkeypatch):
+    monkeypatch.setattr(config, "RETENTION_BATCH_SIZE", 3)
+    monkeypatch.setattr(config, "RETENTION_BATCH_PAUSE_MS", 0)
+
+
+def utc_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def add_raw(Session, metric_name, ages_in_days):
+    now = utc_now()
+    with Session() as db:
+        db.add_all(
+            RawMetrics(metric_name=metric_name, value=1.0, timestamp=now - timedelta(days=age), series_id=1)
+            for age in ages_in_days
+        )
+        db.commit()
+
+
+def raw_counts(Session):
+    with Session() as db:
+        return dict(db.execute(text("SELECT metric_name, count(*) FROM raw_metrics GROUP BY metric_name")).all())
+
+
+def test_expired_raw_rows_are_deleted_in_batches(database):
+    add_raw(database.Session, "cpu", [0.5, 1, 2, 3.5, 4, 5, 6, 7, 8])
+
+    with database.Session() as db:
+        stats = asyncio.run(RetentionService(db, RetentionPolicy()).delete_old_raw_metrics(datetime.now(timezone.utc)))
+
+    assert stats["rows_deleted"] == 6
+    # Two full batches of 3 and the empty one that ends the loop
+    assert stats["batches"] == 3
+    assert raw_counts(database.Session) == {"cpu": 3}
+
+
+def test_per_metric_overrides_keep_or_drop_their_own_rows(database):
+    policy = RetentionPolicy(metrics={"disk": {"raw": 10}, "net": {"raw": 1}})
+    for metric_name in ("cpu", "disk", "net"):
+        add_raw(database.Session, metric_name, [0.5, 2, 5])
+
+    with database.Session() as db:
+        asyncio.run(RetentionService(db, policy).delete_old_raw_metrics(datetime.now(timezone.utc)))
+
+    assert raw_counts(database.Session) == {"cpu": 2, "disk": 3, "net": 1}
+
+
+def test_rollup_tiers_only_touch_their_window(database):
+    now = utc_now()
+    with database.Session() as db:
+        for window, age in (("1m", 8), ("1m", 1), ("5m", 8)):
+            start = now - timedelta(days=age)
+            db.add(RollupMetrics(metric_name="cpu", series_id=1, window=window, start_time=start, end_time=start,
+                                 min=1.0, max=1.0, sum=1.0, avg=1.0, count=1))
+        db.commit()
+
+        stats = asyncio.run(RetentionService(db, RetentionPolicy()).delete_old_rollup_metrics("1m", datetime.now(timezone.utc)))
+        assert stats["rows_deleted"] == 1
+        assert sorted((row.window, row.start_time < now - timedelta(days=7)) for row in db.query(RollupMetrics)) == [
+            ("1m", False), ("5m", True)
+        ]
+
+
+def test_invalid_policy_files_are_rejected(tmp_path):
+    path = tmp_path / "policy.json"
+    path.write_text(json.dumps({"metrics": {"cpu": {"2m": 3}}}))
+    with pytest.raises(InvalidRetentionPolicyException):
+        RetentionPolicy.load(str(path))
+    path.write_text(json.dumps({"default": {"raw": 0}}))
+    with pytest.raises(InvalidRetentionPolicyException):
+        RetentionPolicy.load(str(path))
+
+
+def test_partitioned_raw_data_leaves_with_whole_days(postgres, monkeypatch):
+    monkeypatch.setattr(config, "PARTITIONING_ENABLED", True)
+    today = datetime.now(timezone.utc).date()
+    with postgres() as db:
+        PartitionService(db).migrate()
+        PartitionService(db).ensure_partitions(6, start=today - timedelta(days=6))
+    # One row every 6 hours for the last 6 days
+    add_raw(postgres, "cpu", [hours / 24 for hours in range(0, 144, 6)])
+
+    with postgres() as db:
+        stats = asyncio.run(RetentionService(db, RetentionPolicy()).delete_old_raw_metrics(datetime.now(timezone.utc)))
+        cutoff_day = (utc_now() - timedelta(days=3)).date()
+        remaining = db.execute(text("SELECT min(timestamp) FROM raw_metrics")).scalar()
+        days = [day for _, day in PartitionService(db).daily_partitions(RAW_TABLE)]
+
+    # Nothing in the cutoff day was row-deleted; older days were dropped whole
+    assert stats["partitions_dropped"] >= 1
+    assert remaining.date() == cutoff_day
+    assert min(days) == cutoff_day
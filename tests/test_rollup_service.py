@@ -0,0 +1,192 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import delete
+
+from app import config
+from app.controllers.ingest_controller import IngestController
+from app.models import RawMetrics, RollupDirtyBucket, RollupMetrics, RollupWatermark
+from app.schemas.ingest import IngestRequest
+from app.services.rollup_service import RollupService, rollup_plan
+
+
+@pytest.fixture
+def python_engine(monkeypatch):
+    monkeypatch.setattr(config, "ROLLUP_ENGINE", "python")
+
+
+def utc_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def ingest(database, metric_name, value, timestamp):
+    async def run():
+        async with database.AsyncSession() as db:
+            return await IngestController.ingest_metric(
+                IngestRequest(metric_name=metric_name, value=value, timestamp=timestamp, labels={"host": "a"}), db
+            )
+    return asyncio.run(run())
+
+
+def run_job(database, initial_watermark):
+    with database.Session() as db:
+        return asyncio.run(RollupService(db).run(initial_watermark))
+
+
+def perform_rollups(database, metric_name, since, until):
+    with database.Session() as db:
+        stats = asyncio.run(RollupService(db).perform_rollups(metric_name, since, until))
+        db.commit()
+        return stats
+
+
+def rollups(database, window):
+    with database.Session() as db:
+        return [
+            (row.start_time, row.count, row.sum)
+            for row in db.query(RollupMetrics).filter(RollupMetrics.window == window).order_by(RollupMetrics.start_time)
+        ]
+
+
+def test_late_first_point_of_an_unseen_metric(database):
+    timestamp = datetime(2024, 6, 1, 12, 0, 30)
+
+    response = ingest(database, "disk", 4.0, timestamp)
+
+    assert response.status == "success"
+    with database.Session() as db:
+        # The scan starts just before the point, so it is left to the scan rather than queued
+        assert db.get(RollupWatermark, "disk").watermark == timestamp - timedelta(microseconds=1)
+        assert db.query(RollupDirtyBucket).count() == 0
+
+    stats = run_job(database, utc_now() - timedelta(hours=1))
+    assert stats["metrics_failed"] == 0
+    assert rollups(database, "1m") == [(datetime(2024, 6, 1, 12), 1, 4.0)]
+    assert rollups(database, "1h") == [(datetime(2024, 6, 1, 12), 1, 4.0)]
+
+
+def test_late_points_are_added_to_buckets_whose_raw_rows_expired(database):
+    timestamp = datetime(2024, 6, 1, 12, 0, 30)
+    ingest(database, "disk", 4.0, timestamp)
+    run_job(database, utc_now() - timedelta(hours=1))
+    with database.Session() as db:
+        db.execute(delete(RawMetrics))
+        db.commit()
+
+    ingest(database, "disk", 6.0, timestamp + timedelta(seconds=10))
+    ingest(database, "disk", 1.0, timestamp + timedelta(minutes=5))
+    with database.Session() as db:
+        assert db.query(RollupDirtyBucket).count() == 6
+
+    stats = run_job(database, utc_now() - timedelta(hours=1))
+    assert stats["dirty_buckets_merged"] == 5
+    assert rollups(database, "1m") == [(datetime(2024, 6, 1, 12), 2, 10.0), (datetime(2024, 6, 1, 12, 5), 1, 1.0)]
+    assert rollups(database, "1h") == [(datetime(2024, 6, 1, 12), 3, 11.0)]
+    with database.Session() as db:
+        assert db.query(RollupDirtyBucket).count() == 0
+
+
+def test_rollup_plan_merges_each_window_from_the_coarsest_divisor():
+    assert rollup_plan(["1h", "1m", "5m", "15m"]) == [("1m", None), ("5m", "1m"), ("15m", "5m"), ("1h", "15m")]
+    assert rollup_plan(["7m", "1h", "1m"]) == [("1m", None), ("7m", "1m"), ("1h", "1m")]
+    assert rollup_plan(["90s", "1m", "3m"]) == [("1m", None), ("90s", None), ("3m", "90s")]
+
+
+def test_coarser_windows_match_raw_aggregates(database, python_engine):
+    start = datetime(2024, 6, 1, 12)
+    with database.Session() as db:
+        db.add_all(
+            RawMetrics(metric_name="cpu", series_id=1, timestamp=start + timedelta(seconds=seconds), value=float(seconds % 17))
+            for seconds in range(0, 2 * 3600, 45)
+        )
+        db.commit()
+        raw = [(row.timestamp, row.value) for row in db.query(RawMetrics)]
+
+    stats = perform_rollups(database, "cpu", start - timedelta(seconds=1), start + timedelta(hours=2))
+
+    # Raw rows are read once, for the 1m tier
+    assert stats["raw_metrics_processed"] == len(raw)
+    for window, width in (("5m", timedelta(minutes=5)), ("1h", timedelta(hours=1))):
+        expected = {}
+        for timestamp, value in raw:
+            bucket = expected.setdefault(start + (timestamp - start) // width * width, [])
+            bucket.append(value)
+        with database.Session() as db:
+            rows = db.query(RollupMetrics).filter(RollupMetrics.window == window).order_by(RollupMetrics.start_time).all()
+        assert [(row.start_time, row.count, row.sum, row.min, row.max) for row in rows] == [
+            (bucket, len(values), sum(values), min(values), max(values)) for bucket, values in sorted(expected.items())
+        ]
+
+
+def test_coarser_windows_are_built_from_the_window_below(database, python_engine):
+    start = datetime(2024, 6, 1, 12)
+    with database.Session() as db:
+        # 1m buckets whose raw rows are gone: only the cascade can see them
+        db.add_all(
+            RollupMetrics(metric_name="cpu", series_id=1, window="1m", start_time=start + timedelta(minutes=minute),
+                          end_time=start + timedelta(minutes=minute + 1), min=1.0, max=3.0, sum=4.0, avg=2.0, count=2)
+            for minute in range(10)
+        )
+        db.commit()
+
+    perform_rollups(database, "cpu", start, start + timedelta(minutes=10))
+
+    assert rollups(database, "5m") == [(start, 10, 20.0), (start + timedelta(minutes=5), 10, 20.0)]
+    assert rollups(database, "1h") == [(start, 20, 40.0)]
+
+
+def test_series_of_one_metric_get_their_own_buckets(database, python_engine):
+    start = datetime(2024, 6, 1, 12)
+    with database.Session() as db:
+        db.add_all([
+            RawMetrics(metric_name="cpu", series_id=1, timestamp=start + timedelta(seconds=10), value=1.0),
+            RawMetrics(metric_name="cpu", series_id=2, timestamp=start + timedelta(seconds=20), value=5.0),
+        ])
+        db.commit()
+
+    perform_rollups(database, "cpu", start, start + timedelta(minutes=1))
+
+    with database.Session() as db:
+        rows = db.query(RollupMetrics).filter(RollupMetrics.window == "1m").order_by(RollupMetrics.series_id).all()
+        assert [(row.series_id, row.count, row.sum) for row in rows] == [(1, 1, 1.0), (2, 1, 5.0)]
+
+
+def test_a_bucket_split_across_runs_is_merged_once(database, python_engine):
+    start = datetime(2024, 6, 1, 12)
+    with database.Session() as db:
+        db.add_all(
+            RawMetrics(metric_name="cpu", series_id=1, timestamp=start + timedelta(seconds=seconds), value=value)
+            for seconds, value in ((10, 4.0), (20, 1.0), (40, 9.0), (50, 2.0))
+        )
+        db.commit()
+
+    middle = start + timedelta(seconds=30)
+    perform_rollups(database, "cpu", start, middle)
+    perform_rollups(database, "cpu", middle, start + timedelta(minutes=1))
+    # Nothing new: the finest tier adds nothing and the coarser tiers are rebuilt as they were
+    perform_rollups(database, "cpu", start + timedelta(minutes=1), start + timedelta(minutes=2))
+
+    with database.Session() as db:
+        rows = db.query(RollupMetrics).order_by(RollupMetrics.window).all()
+        assert [(row.window, row.count, row.sum, row.min, row.max, row.avg) for row in rows] == [
+            (window, 4, 16.0, 1.0, 9.0, 4.0) for window in ("1h", "1m", "5m")
+        ]
+        assert {row.window: sum(row.sketch.values()) for row in rows} == {"1m": 4, "5m": 4, "1h": 4}
+
+
+def test_processing_dirty_buckets_twice_merges_them_once(database):
+    timestamp = datetime(2024, 6, 1, 12, 0, 30)
+    ingest(database, "disk", 4.0, timestamp)
+    run_job(database, utc_now() - timedelta(hours=1))
+    ingest(database, "disk", 6.0, timestamp + timedelta(seconds=10))
+
+    with database.Session() as db:
+        service = RollupService(db)
+        assert asyncio.run(service.process_dirty_buckets("disk")) == 3
+        db.commit()
+        assert asyncio.run(service.process_dirty_buckets("disk")) == 0
+        db.commit()
+
+    assert rollups(database, "1m") == [(datetime(2024, 6, 1, 12), 2, 10.0)]
+    assert rollups(database, "1h") == [(datetime(2024, 6, 1, 12), 2, 10.0)]
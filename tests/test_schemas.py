@@ -0,0 +1,26 @@
+import pytest
+from pydantic import ValidationError
+
+from app.schemas.backfill import BackfillMetric
+from app.schemas.ingest import IngestRequest, SeriesPoints
+
+
+@pytest.mark.parametrize("value", ["Infinity", "-Infinity", "NaN"])
+def test_non_finite_values_are_rejected(value):
+    with pytest.raises(ValidationError):
+        IngestRequest.model_validate_json(
+            f'{{"metric_name":"cpu","value":{value},"timestamp":"2024-06-01T12:00:00Z"}}'
+        )
+    with pytest.raises(ValidationError):
+        BackfillMetric.model_validate_json(
+            f'{{"metric_name":"cpu","value":{value},"timestamp":"2024-06-01T12:00:00Z"}}'
+        )
+    with pytest.raises(ValidationError):
+        SeriesPoints.model_validate_json(
+            f'{{"metric_name":"cpu","points":[["2024-06-01T12:00:00Z",1.0],["2024-06-01T12:00:10Z",{value}]]}}'
+        )
+
+
+def test_finite_values_are_accepted():
+    request = IngestRequest.model_validate_json('{"metric_name":"cpu","value":1e300,"timestamp":"2024-06-01T12:00:00Z"}')
+    assert request.value == 1e300
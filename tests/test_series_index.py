@@ -0,0 +1,65 @@
+import asyncio
+from datetime import datetime
+
+from app.models import RawMetrics, Series
+from app.utils.label_utils import hash_labels
+from app.utils.series_index import SeriesIndex
+
+
+def add_series(database, metric_name, hosts):
+    with database.Session() as db:
+        for host in hosts:
+            series = Series(metric_name=metric_name, labels={"host": host}, labels_hash=hash_labels({"host": host}))
+            db.add(series)
+            db.flush()
+            db.add(RawMetrics(metric_name=metric_name, value=1.0, timestamp=datetime(2024, 6, 1), series_id=series.series_id))
+        db.commit()
+
+
+def test_metrics_are_loaded_lazily_and_checked_against_the_limit(database):
+    add_series(database, "cpu", ["a", "b"])
+    index = SeriesIndex()
+
+    async def run():
+        async with database.AsyncSession() as db:
+            return (
+                await index.contains(db, "cpu", hash_labels({"host": "a"})),
+                await index.check(db, "cpu", hash_labels({"host": "c"}), limit=3),
+                await index.check(db, "cpu", hash_labels({"host": "c"}), limit=3, pending=1),
+                await index.check(db, "cpu", hash_labels({"host": "a"}), limit=2),
+                await index.series_count(db, "mem")
+            )
+
+    assert asyncio.run(run()) == (True, True, False, True, 0)
+    assert index.counts() == {"cpu": 2, "mem": 0}
+
+
+def test_concurrent_reservations_never_pass_the_limit(database):
+    add_series(database, "cpu", ["a"])
+    index = SeriesIndex()
+
+    async def run():
+        async with database.AsyncSession() as db:
+            await index.series_count(db, "cpu")
+            return await asyncio.gather(*(
+                index.reserve(db, "cpu", hash_labels({"host": str(host)}), limit=10) for host in range(20)
+            ))
+
+    accepted = asyncio.run(run())
+    assert accepted.count(True) == 9
+    assert index.counts() == {"cpu": 10}
+
+
+def test_invalidate_reloads_from_the_database(database):
+    add_series(database, "cpu", ["a"])
+    index = SeriesIndex()
+
+    async def count():
+        async with database.AsyncSession() as db:
+            return await index.series_count(db, "cpu")
+
+    assert asyncio.run(count()) == 1
+    add_series(database, "cpu", ["b"])
+    assert asyncio.run(count()) == 1
+    index.invalidate("cpu")
+    assert asyncio.run(count()) == 2
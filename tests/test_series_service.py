@@ -0,0 +1,47 @@
+import asyncio
+from datetime import datetime
+
+from app.models import RawMetrics, Series
+from app.services import series_service
+from app.services.series_service import SeriesService, clear_series_cache
+
+
+def test_new_series_commit_with_the_callers_transaction(database):
+    async def rolled_back():
+        async with database.AsyncSession() as db:
+            db.add(RawMetrics(metric_name="cpu", value=1.0, timestamp=datetime(2024, 6, 1), series_id=0))
+            await SeriesService(db).resolve("cpu", {"host": "a"})
+            await db.rollback()
+
+    asyncio.run(rolled_back())
+    with database.Session() as db:
+        # Neither the series nor the caller's pending row became durable
+        assert db.query(Series).count() == 0
+        assert db.query(RawMetrics).count() == 0
+    assert series_service._series_cache == {}
+
+    async def committed():
+        async with database.AsyncSession() as db:
+            series_id = await SeriesService(db).resolve("cpu", {"host": "a"})
+            await db.commit()
+            return series_id, await SeriesService(db).resolve("cpu", {"host": "a"})
+
+    created, looked_up = asyncio.run(committed())
+    assert created == looked_up
+    with database.Session() as db:
+        assert [row.series_id for row in db.query(Series)] == [created]
+    assert list(series_service._series_cache.values()) == [created]
+
+
+def test_clear_series_cache_forgets_resolved_ids(database):
+    async def resolve():
+        async with database.AsyncSession() as db:
+            series_id = await SeriesService(db).resolve("cpu", {"host": "a"})
+            await db.commit()
+            return series_id
+
+    asyncio.run(resolve())
+    asyncio.run(resolve())
+    assert len(series_service._series_cache) == 1
+    clear_series_cache()
+    assert series_service._series_cache == {}
@@ -0,0 +1,23 @@
+import math
+
+from app.utils.sketch import MAX_KEY, NEGATIVE_PREFIX, ZERO_KEY, new_sketch, quantiles, sketch_key
+
+
+def test_keys_stay_within_one_percent():
+    for value in (0.001, 1.0, 42.0, 1e6, 1e300):
+        estimate = quantiles({sketch_key(value): 1}, [0.5])[0.5]
+        assert math.isclose(estimate, value, rel_tol=0.01)
+    assert sketch_key(0.0) == ZERO_KEY
+    assert sketch_key(-5.0) == NEGATIVE_PREFIX + sketch_key(5.0)
+
+
+def test_infinite_values_fall_in_the_highest_key():
+    assert sketch_key(float("inf")) == str(MAX_KEY)
+    assert sketch_key(float("-inf")) == f"{NEGATIVE_PREFIX}{MAX_KEY}"
+    assert sketch_key(1.79e308) == str(MAX_KEY)
+
+    sketch = new_sketch([1.0, 2.0, float("inf")])
+    estimates = quantiles(sketch, [0.0, 0.5, 1.0], 1.0, float("inf"))
+    assert estimates[0.0] == 1.0
+    assert math.isclose(estimates[0.5], 2.0, rel_tol=0.01)
+    assert estimates[1.0] > 1e300
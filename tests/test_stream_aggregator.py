@@ -0,0 +1,168 @@
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, update
+
+from app import config
+from app.models import RawMetrics, RollupMetrics, RollupWatermark, Series, StreamFlushWatermark
+from app.services import stream_aggregator
+from app.services.rollup_service import RollupService
+from app.services.stream_aggregator import StreamAggregator
+from app.utils.time_utils import round_to_window
+
+WINDOWS = ["1m", "5m", "1h"]
+
+
+@pytest.fixture
+def streaming(database, monkeypatch):
+    monkeypatch.setattr(config, "STREAM_AGGREGATION_ENABLED", True)
+    monkeypatch.setattr(config, "ROLLUP_LATENESS_SECONDS", 5.0)
+    monkeypatch.setattr(config, "STREAM_AGGREGATION_STALE_SECONDS", 60.0)
+    monkeypatch.setattr(stream_aggregator, "SessionLocal", database.Session)
+    with database.Session() as db:
+        db.add_all(Series(series_id=series_id, metric_name="cpu", labels={}, labels_hash=str(series_id)) for series_id in (1, 2))
+        db.commit()
+    return database.Session
+
+
+def utc_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def points(count, start, seed):
+    rng = random.Random(seed)
+    return [
+        {"metric_name": "cpu", "series_id": rng.randint(1, 2), "value": rng.uniform(0, 10),
+         "timestamp": start + timedelta(seconds=rng.uniform(0, 1800))}
+        for _ in range(count)
+    ]
+
+
+def store(Session, rows):
+    with Session() as db:
+        db.add_all(RawMetrics(**row) for row in rows)
+        db.commit()
+
+
+def totals(Session):
+    with Session() as db:
+        return {
+            window: db.query(func.coalesce(func.sum(RollupMetrics.count), 0)).filter(RollupMetrics.window == window).scalar()
+            for window in WINDOWS
+        }
+
+
+def flushes(Session):
+    with Session() as db:
+        return {row.process_id: row.flushed_until for row in db.query(StreamFlushWatermark)}
+
+
+def test_flush_merges_closed_buckets_and_records_its_watermark(streaming):
+    start = datetime(2024, 6, 1, 12)
+    observed_at = start + timedelta(minutes=1, seconds=10)
+
+    async def scenario():
+        aggregator = StreamAggregator(WINDOWS, 3600)
+        await aggregator.start()
+        aggregator.add([
+            {"metric_name": "cpu", "series_id": 1, "value": 2.0, "timestamp": start + timedelta(seconds=10)},
+            {"metric_name": "cpu", "series_id": 1, "value": 4.0, "timestamp": start + timedelta(seconds=70)},
+        ], start + timedelta(seconds=30))
+        await aggregator._flush(observed_at)
+
+        # Only the first minute is closed; the rest is still served from memory
+        assert totals(streaming) == {"1m": 1, "5m": 0, "1h": 0}
+        assert flushes(streaming) == {aggregator.process_id: observed_at - timedelta(seconds=5)}
+        assert [bucket["count"] for bucket in aggregator.open_buckets("cpu", "1h", start, start + timedelta(hours=1))] == [2]
+
+        await aggregator.stop()
+
+    asyncio.run(scenario())
+    # Stopping writes the open buckets as partials and leaves the job to its own watermarks
+    assert totals(streaming) == {"1m": 2, "5m": 2, "1h": 2}
+    assert flushes(streaming) == {}
+
+
+def test_job_waits_for_the_slowest_live_aggregator(streaming):
+    start = round_to_window(utc_now() - timedelta(hours=3), "1h")
+
+    async def scenario():
+        aggregator = StreamAggregator(WINDOWS, 3600)
+        await aggregator.start()
+        await aggregator._flush(start + timedelta(hours=1))
+        with streaming() as db:
+            stats = await RollupService(db).run(start)
+        await aggregator.stop()
+        return stats
+
+    stats = asyncio.run(scenario())
+
+    assert stats["watermark"] == start + timedelta(hours=1, seconds=-5)
+    with streaming() as db:
+        assert db.get(RollupWatermark, "cpu").watermark == start + timedelta(hours=1, seconds=-5)
+
+
+def test_buckets_of_a_dead_aggregator_are_rebuilt_from_raw_rows(streaming):
+    start = round_to_window(utc_now() - timedelta(hours=3), "1h")
+    crashed_rows, live_rows = points(300, start, seed=1), points(200, start, seed=2)
+    store(streaming, crashed_rows + live_rows)
+
+    async def scenario():
+        crashed, live = StreamAggregator(WINDOWS, 3600), StreamAggregator(WINDOWS, 3600)
+        await crashed.start()
+        await live.start()
+        crashed.add(crashed_rows, start)
+        live.add(live_rows, start)
+        await live._flush(start + timedelta(hours=2))
+        # The crashed process never flushes again
+        crashed._task.cancel()
+        with streaming() as db:
+            db.execute(
+                update(StreamFlushWatermark)
+                .where(StreamFlushWatermark.process_id == crashed.process_id)
+                .values(updated_at=utc_now() - timedelta(seconds=120))
+            )
+            db.commit()
+        assert totals(streaming) == {window: len(live_rows) for window in WINDOWS}
+
+        with streaming() as db:
+            stats = await RollupService(db).run(start - timedelta(minutes=1))
+        assert stats["raw_metrics_processed"] == len(crashed_rows) + len(live_rows)
+        assert totals(streaming) == {window: len(crashed_rows) + len(live_rows) for window in WINDOWS}
+        # Still registered: it may hold buckets later than the watermark
+        assert crashed.process_id in flushes(streaming)
+
+        await live.stop()
+        with streaming() as db:
+            db.execute(update(StreamFlushWatermark).values(updated_at=start - timedelta(hours=2)))
+            db.commit()
+            await RollupService(db).run(start)
+        return crashed.process_id
+
+    crashed_id = asyncio.run(scenario())
+    assert crashed_id not in flushes(streaming)
+    assert totals(streaming) == {window: 500 for window in WINDOWS}
+
+
+def test_an_aggregator_that_could_not_flush_rejoins_under_a_new_id(streaming):
+    async def scenario():
+        aggregator = StreamAggregator(WINDOWS, 3600)
+        await aggregator.start()
+        old_id = aggregator.process_id
+        aggregator.add([{"metric_name": "cpu", "series_id": 1, "value": 1.0, "timestamp": utc_now()}], utc_now())
+        aggregator._flushed_at -= 120
+
+        await aggregator._flush(utc_now())
+
+        assert aggregator.process_id != old_id
+        assert aggregator.open_bucket_count() == 0
+        with streaming() as db:
+            rows = {row.process_id: row.updated_at for row in db.query(StreamFlushWatermark)}
+        # The old id is recorded as stale, so the job rebuilds whatever it held
+        assert rows.keys() == {old_id, aggregator.process_id}
+        assert rows[old_id] < utc_now() - timedelta(seconds=60)
+        await aggregator.stop()
+
+    asyncio.run(scenario())
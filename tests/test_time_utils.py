@@ -0,0 +1,46 @@
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from app.utils.time_utils import ceil_to_window, generate_time_buckets, round_to_window
+
+
+@contextmanager
+def local_timezone(name):
+    previous = os.environ.get("TZ")
+    os.environ["TZ"] = name
+    time.tzset()
+    try:
+        yield
+    finally:
+        if previous is None:
+            del os.environ["TZ"]
+        else:
+            os.environ["TZ"] = previous
+        time.tzset()
+
+
+def test_naive_datetimes_round_as_utc_under_a_non_utc_local_zone():
+    with local_timezone("America/New_York"):
+        assert round_to_window(datetime(2024, 6, 1, 12), "1d") == datetime(2024, 6, 1)
+        assert round_to_window(datetime(2024, 6, 1, 12), "6h") == datetime(2024, 6, 1, 12)
+        assert round_to_window(datetime(2024, 6, 1, 11, 59), "6h") == datetime(2024, 6, 1, 6)
+        assert round_to_window(datetime(2024, 6, 1, 12, 7, 30), "5m") == datetime(2024, 6, 1, 12, 5)
+        # 2024-05-30 is a Thursday, like the epoch
+        assert round_to_window(datetime(2024, 6, 1, 12), "1w") == datetime(2024, 5, 30)
+
+
+def test_ceil_and_buckets_follow_the_utc_grid():
+    with local_timezone("Asia/Kolkata"):
+        assert ceil_to_window(datetime(2024, 6, 1, 12), "1d") == datetime(2024, 6, 2)
+        assert ceil_to_window(datetime(2024, 6, 1), "1d") == datetime(2024, 6, 1)
+        buckets = generate_time_buckets(datetime(2024, 6, 1, 1), datetime(2024, 6, 1, 13), "6h")
+        assert [start.hour for start, _ in buckets] == [0, 6, 12]
+
+
+def test_aware_datetimes_keep_their_zone():
+    eastern = timezone(timedelta(hours=-4))
+    rounded = round_to_window(datetime(2024, 6, 1, 12, tzinfo=eastern), "1d")
+    assert rounded.tzinfo == eastern
+    assert rounded == datetime(2024, 6, 1, tzinfo=timezone.utc)
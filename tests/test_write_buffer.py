@@ -0,0 +1,73 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import RawMetrics
+from app.services import write_buffer
+from app.services.write_buffer import WriteBuffer, WriteBufferFullException
+
+
+def row(second):
+    return {"metric_name": "cpu", "value": float(second), "timestamp": datetime(2024, 6, 1, 12) + timedelta(seconds=second),
+            "series_id": 1, "labels": {}}
+
+
+def test_concurrent_submissions_share_one_commit(database, monkeypatch):
+    monkeypatch.setattr(write_buffer, "AsyncSessionLocal", database.AsyncSession)
+    buffer = WriteBuffer(max_batch=10, max_delay_ms=50, capacity=100)
+    batches = []
+    write = buffer._write
+
+    async def counted_write(rows):
+        batches.append(len(rows))
+        await write(rows)
+
+    buffer._write = counted_write
+
+    async def run():
+        await buffer.start()
+        await asyncio.gather(*(buffer.submit(row(second)) for second in range(25)))
+        await buffer.stop()
+
+    asyncio.run(run())
+    assert batches == [10, 10, 5]
+    with database.Session() as db:
+        assert sorted(row.value for row in db.query(RawMetrics)) == [float(second) for second in range(25)]
+
+
+def test_a_failed_commit_fails_every_waiter(database, monkeypatch):
+    monkeypatch.setattr(write_buffer, "AsyncSessionLocal", database.AsyncSession)
+    buffer = WriteBuffer(max_batch=10, max_delay_ms=10, capacity=100)
+
+    async def failing_write(rows):
+        raise RuntimeError("database unavailable")
+
+    buffer._write = failing_write
+
+    async def run():
+        await buffer.start()
+        results = await asyncio.gather(*(buffer.submit(row(second)) for second in range(3)), return_exceptions=True)
+        await buffer.stop()
+        return results
+
+    results = asyncio.run(run())
+    assert [str(result) for result in results] == ["database unavailable"] * 3
+
+
+def test_a_full_buffer_rejects_new_rows(database, monkeypatch):
+    monkeypatch.setattr(write_buffer, "AsyncSessionLocal", database.AsyncSession)
+    buffer = WriteBuffer(max_batch=10, max_delay_ms=1000, capacity=2)
+
+    async def run():
+        await buffer.start()
+        waiting = [asyncio.create_task(buffer.submit(row(second))) for second in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(WriteBufferFullException):
+            await buffer.submit(row(2))
+        await buffer.stop()
+        await asyncio.gather(*waiting)
+
+    asyncio.run(run())
+    with database.Session() as db:
+        assert db.query(RawMetrics).count() == 2